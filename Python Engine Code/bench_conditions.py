@@ -0,0 +1,73 @@
+"""
+Choice condition memoization benchmark
+Plays a generated hub-heavy story (a central menu revisited after every short branch)
+headlessly with condition memoization on and off, checks that both runs produce the
+same events, and reports the time spent.
+
+Usage: python bench_conditions.py [options] [interactions]
+"""
+import random
+import sys
+import time
+
+from engine import expressions
+from engine.core import run
+from engine.headless import HeadlessUiPort, SessionLimitReached
+from parser import parse_script
+
+# Hub menu whose options are guarded by slow-changing state (quests, level, gold),
+# while most branches only touch counters no condition reads
+def hub_story(options: int) -> str:
+    lines = [f"setVar:quest{i}=0;" for i in range(options)]
+    lines += [f"setVar:visits{i}=0;" for i in range(options)]
+    lines += ["setVar:gold=100;", "setVar:level=1;", "setVar:reputation=5;", "label:hub;"]
+
+    choices = []
+    for i in range(options):
+        when = f"{{quest{i}}} < 3 and {{level}} >= {i % 3} or {{reputation}} > 50"
+        enable = f"{{gold}} >= {i * 5} or {{reputation}} > 10 and {{level}} > {i}"
+        # A parameter value runs to the end of the line, so each one gets its own line
+        choices.append(f'"Option {i}":branch{i} -when={when}\n    -enable={enable}')
+    choices.append('"Rest":rest')
+    lines.append("choose:" + " |\n  ".join(choices) + ";")
+
+    for i in range(options):
+        lines += [f"label:branch{i};", f"setVar:visits{i}={{visits{i}}}+1;"]
+        # Only some branches advance state that conditions depend on
+        if i % 4 == 0:
+            lines.append(f"setVar:quest{i}={{quest{i}}}+1;")
+        lines += [f'say:"Branch {i}: {{visits{i}}}";', "jump:hub;"]
+    lines += ["label:rest;", "setVar:level={level}+1;", "jump:hub;"]
+    return "\n".join(lines)
+
+def play(cmds, interactions: int, memoize: bool):
+    expressions.memoize_conditions = memoize
+    random.seed(0)
+    ui = HeadlessUiPort(max_interactions=interactions, seed=0, record=True)
+
+    start = time.perf_counter()
+    try:
+        run(cmds, initial_scene="hub", ui=ui)
+    except SessionLimitReached:
+        pass
+    elapsed = time.perf_counter() - start
+    return elapsed, [(ev.type, ev.payload) for ev in ui.events]
+
+def main():
+    options = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    interactions = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    cmds = parse_script(hub_story(options))
+    plain_time, plain_events = play(cmds, interactions, memoize=False)
+    memo_time, memo_events = play(cmds, interactions, memoize=True)
+
+    if plain_events != memo_events:
+        print("ERROR: memoized run produced different events")
+        sys.exit(1)
+
+    print(f"{options} options, {interactions} interactions, {len(memo_events)} events")
+    print(f"without memo: {plain_time * 1000:.1f} ms")
+    print(f"with memo:    {memo_time * 1000:.1f} ms ({plain_time / memo_time:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Scene optimizer benchmark
+Plays stories headlessly with the optimizer off and on, checks that both runs show the
+player the same thing (label trace lines aside), and reports commands executed and
+steps per second. Real stories are given as scene directories or bundles; --generated
+adds a story written the way long-running projects drift: section labels nobody jumps
+to, jumps through old hub labels and options cut with a constant -when.
+
+Usage: python bench_optimizer.py [story ...] [--entry main] [--interactions N] [--sessions N] [--generated]
+"""
+import argparse
+import gc
+import os
+import random
+import time
+
+from engine.core import run
+from engine.headless import HeadlessUiPort, SessionLimitReached
+from engine.scenes import SceneCache, open_source
+
+# Counts engine steps through run()'s profiler hook
+class StepCounter:
+
+    def __init__(self):
+        self.steps = 0
+
+    def wrap_ui(self, ui):
+        return ui
+
+    def run_command(self, handler, cmd, st):
+        self.steps += 1
+        handler(cmd, st)
+
+def generated_story(chapters: int) -> str:
+    lines = ["setVar:chapter=0;", "setVar:gold=10*10;", "label:hub;"]
+    choices = [f'"Chapter {i}":old_hub{i}' for i in range(chapters)]
+    choices.append('"Cut content":hub -when=1 > 2')
+    choices.append('"Debug":hub -when=0')
+    lines.append("choose:" + " |\n  ".join(choices) + ";")
+
+    for i in range(chapters):
+        lines += [f"label:old_hub{i};", f"jump:chapter{i};"]
+        lines += [f"label:chapter{i};", "setVar:chapter={chapter}+1;"]
+        for p in range(6):
+            lines += [f"label:chapter{i}_part{p};", f'say:"Chapter {i}, part {p}: {{gold}} gold";',
+                      f"setVar:gold={{gold}}+{p}*2;"]
+        lines += [f"jump:back{i};", 'say:"Leftover line from an old draft";',
+                  f"label:back{i};", "jump:hub;"]
+    return "\n".join(lines)
+
+def play(scenes: SceneCache, entry: str, interactions: int, seed: int):
+    random.seed(seed)
+    ui = HeadlessUiPort(max_interactions=interactions, seed=seed, record=True)
+    counter = StepCounter()
+    # Don't bill one side for the previous session's garbage
+    gc.collect()
+    start = time.perf_counter()
+    try:
+        run(scenes.get(entry).cmds, initial_scene=entry, ui=ui, scenes=scenes, profiler=counter)
+    except SessionLimitReached:
+        pass
+    elapsed = time.perf_counter() - start
+    # Label trace lines go away with the labels, so compare everything else
+    events = [(ev.type, ev.payload) for ev in ui.events
+              if not (ev.type == "INFO" and ev.payload.get("text", "").startswith("[Label"))]
+    return elapsed, counter.steps, events
+
+def bench(name: str, source, entry: str, interactions: int, sessions: int) -> bool:
+    caches = {optimize: SceneCache(source, optimize) for optimize in (False, True)}
+    totals = {optimize: [0.0, 0, []] for optimize in caches}
+    # Parse everything up front, then alternate so neither side runs on a colder interpreter
+    for scenes in caches.values():
+        play(scenes, entry, interactions, sessions)
+    for seed in range(sessions):
+        for optimize, scenes in caches.items():
+            elapsed, steps, events = play(scenes, entry, interactions, seed)
+            totals[optimize][0] += elapsed
+            totals[optimize][1] += steps
+            totals[optimize][2].append(events)
+
+    scenes = caches[True]
+    removed = sum(scenes.get(n).optimization.commands_before - scenes.get(n).optimization.commands_after
+                  for n in scenes.names() if n in scenes)
+    plain, optimized = totals[False] + [0], totals[True] + [removed]
+    print(f"{name}: {sessions} sessions x {interactions} interactions")
+    for label, (elapsed, steps, _, removed) in (("plain", plain), ("optimized", optimized)):
+        extra = f", {removed} commands removed" if label == "optimized" else ""
+        print(f"  {label:<10} {elapsed * 1000:>9.1f} ms {steps:>9} steps {steps / elapsed:>11,.0f} steps/s{extra}")
+    print(f"  same interactions in {optimized[0] / plain[0] * 100:.0f}% of the time, "
+          f"{optimized[1] / plain[1] * 100:.0f}% of the steps")
+
+    if plain[2] != optimized[2]:
+        print("  ERROR: optimized run showed the player something different")
+        return False
+    return True
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the scene optimizer")
+    arg_parser.add_argument("stories", nargs="*", help="Scene directories or story bundles")
+    arg_parser.add_argument("--entry", default="main")
+    arg_parser.add_argument("--interactions", type=int, default=5000)
+    arg_parser.add_argument("--sessions", type=int, default=5)
+    arg_parser.add_argument("--generated", action="store_true", help="Also run a generated story")
+    args = arg_parser.parse_args()
+
+    stories = [(os.path.basename(os.path.abspath(s)), open_source(s), args.entry) for s in args.stories]
+    if args.generated:
+        from parser import parse_script
+
+        # In-memory source holding one scene
+        class GeneratedSource:
+            def __init__(self, text):
+                self.text = text
+
+            def read(self, name):
+                return self.text
+
+            def load(self, name, strict=False):
+                return parse_script(self.text, strict=strict)
+
+            def names(self):
+                return ["generated"]
+
+        stories.append(("generated", GeneratedSource(generated_story(12)), "generated"))
+    if not stories:
+        arg_parser.error("give a story or --generated")
+
+    ok = all([bench(name, source, entry, args.interactions, args.sessions) for name, source, entry in stories])
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Variable store benchmark
+Compares the name-keyed dict store with the slot-indexed store: memory held per
+session for a story's variables, and the cost of the reads and writes handlers do.
+
+Usage: python bench_variables.py [variables] [sessions]
+"""
+import sys
+import time
+import tracemalloc
+
+from engine.expressions import compile_expr
+from engine.variables import SlotVars, VarSchema
+
+def session_memory(factory, names, sessions: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    stores = []
+    for _ in range(sessions):
+        store = factory()
+        for i, name in enumerate(names):
+            store[name] = i
+        stores.append(store)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return total / sessions
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    names = [f"var{i}" for i in range(count)]
+    schema = VarSchema()
+    slots = [schema.slot(name) for name in names]
+
+    dict_bytes = session_memory(dict, names, sessions)
+    slot_bytes = session_memory(lambda: SlotVars(schema=schema), names, sessions)
+    print(f"{count} variables, {sessions} sessions")
+    print(f"memory per session: dict {dict_bytes:.0f} B, slots {slot_bytes:.0f} B")
+
+    # Writes as handle_setvar does them, then reads through a compiled expression
+    rounds = 200
+    plain, store = dict.fromkeys(names, 0), SlotVars(dict.fromkeys(names, 0), schema)
+    expr = compile_expr(" + ".join(f"{{{name}}}" for name in names[:8]), schema)
+
+    start = time.perf_counter()
+    for r in range(rounds):
+        for name in names:
+            plain[name] = r
+        for _ in range(count):
+            expr.evaluate(plain)
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for r in range(rounds):
+        for slot in slots:
+            store.set_slot(slot, r)
+        for _ in range(count):
+            expr.evaluate(store)
+    slot_time = time.perf_counter() - start
+
+    print(f"writes + reads: dict {dict_time * 1000:.1f} ms, slots {slot_time * 1000:.1f} ms "
+          f"({dict_time / slot_time:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Wire encoding benchmark
+Compares bytes on the wire and encode/decode cost per event for every available
+encoding, with and without permessage-deflate style compression.
+The sample repeats, so deflate figures are an upper bound on real savings.
+
+Usage: python bench_wire.py [rounds]
+"""
+import sys
+import time
+import zlib
+
+from protocol import available_codecs
+
+# Representative engine traffic, roughly in the proportions a story produces
+SAMPLE_EVENTS = [
+    {"type": "SHOW_TEXT", "payload": {"text": "Welcome to the Adventurer's Guild!", "speaker": "Narrator"}},
+    {"type": "SHOW_TEXT", "payload": {"text": "Current Status - Health: 100, Strength: 10, Magic: 8, Gold: 50", "speaker": "System"}},
+    {"type": "SHOW_TEXT", "payload": {"text": "你有 100 点生命值。", "speaker": "System"}},
+    {"type": "INFO", "payload": {"text": "[Label: main_menu]"}},
+    {"type": "CHOICES", "payload": {"items": [
+        {"id": "battle_area", "text": "Go to Battle Arena", "enabled": True},
+        {"id": "shop_area", "text": "Visit Equipment Shop", "enabled": True},
+        {"id": "casino_area", "text": "Go to casino", "enabled": False},
+    ]}},
+    {"type": "ROLL_RESULT", "payload": {"expr": "1d20+{strength}", "to": "player_attack", "value": 17}},
+    {"type": "SCENE_CHANGED", "payload": {"name": "casino", "mode": "call"}},
+    {"type": "SHOW_IMAGE", "payload": {"path": "casino.jpg"}},
+    {"type": "PLAY_BGM", "payload": {"path": "casino_theme.mp3", "loop": True}},
+    {"type": "STOP_BGM", "payload": {}},
+]
+
+SAMPLE_REPLIES = [
+    {"type": "NEXT"},
+    {"type": "CHOICE_SELECTED", "payload": {"id": "battle_area"}},
+    {"type": "INPUT_REPLY", "payload": {"value": "Hero"}},
+]
+
+# Per-message deflate with context takeover, as negotiated by default in websockets
+class _Deflater:
+    def __init__(self):
+        self.compressor = zlib.compressobj(wbits=-15)
+        self.decompressor = zlib.decompressobj(wbits=-15)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)[:-4]
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+def _as_bytes(message) -> bytes:
+    return message.encode("utf-8") if isinstance(message, str) else message
+
+def bench_codec(codec, deflate: bool, rounds: int):
+    events = SAMPLE_EVENTS * rounds
+    replies = [codec.encode(r) for r in SAMPLE_REPLIES] * rounds
+    deflater = _Deflater() if deflate else None
+
+    # Encode outbound events
+    start = time.perf_counter()
+    wire_bytes = 0
+    for ev in events:
+        frame = _as_bytes(codec.encode(ev))
+        if deflater:
+            frame = deflater.compress(frame)
+        wire_bytes += len(frame)
+    encode_time = time.perf_counter() - start
+
+    # Decode inbound replies
+    inbound = replies
+    inflater = None
+    if deflate:
+        client = _Deflater()
+        inbound = [client.compress(_as_bytes(r)) for r in replies]
+        inflater = _Deflater()
+
+    start = time.perf_counter()
+    for frame in inbound:
+        if inflater:
+            frame = inflater.decompress(frame)
+            if codec.name == "json":
+                frame = frame.decode("utf-8")
+        codec.decode(frame)
+    decode_time = time.perf_counter() - start
+
+    return {
+        "bytes_per_event": wire_bytes / len(events),
+        "encode_us": encode_time / len(events) * 1e6,
+        "decode_us": decode_time / len(inbound) * 1e6,
+    }
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print(f"{'encoding':<18}{'bytes/event':>12}{'encode us':>12}{'decode us':>12}")
+    for codec in available_codecs():
+        for deflate in (False, True):
+            result = bench_codec(codec, deflate, rounds)
+            label = codec.name + ("+deflate" if deflate else "")
+            print(f"{label:<18}{result['bytes_per_event']:>12.1f}"
+                  f"{result['encode_us']:>12.2f}{result['decode_us']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
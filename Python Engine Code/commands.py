@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional, Any
 
 @dataclass
@@ -7,6 +7,8 @@ class Option:
     target: str
     when: Optional[str] = None
     enable: Optional[str] = None
+    # String table id, assigned when the scene is compiled against one
+    text_id: Optional[int] = field(default=None, compare=False, repr=False)
 
 # Basic narrative commands
 @dataclass
@@ -14,73 +16,93 @@ class SayCommand:
     text: str
     speaker: str = None
     voice: str = None
+    # String table ids, assigned when the scene is compiled against one
+    text_id: Optional[int] = field(default=None, compare=False, repr=False)
+    speaker_id: Optional[int] = field(default=None, compare=False, repr=False)
+    # Source line, for profiling and error reports
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class SetVarCommand:
     name: str
     value: Any
     global_var: bool = False
+    # Variable slot, assigned when the scene is compiled
+    slot: Optional[int] = field(default=None, compare=False, repr=False)
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class InputCommand:
     var_name: str
     prompt: str = ""
+    slot: Optional[int] = field(default=None, compare=False, repr=False)
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class RollCommand:
     expr: str
     to: str = None
+    slot: Optional[int] = field(default=None, compare=False, repr=False)
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class ChooseCommand:
     options: List[Option]
     global_when: Optional[str] = None
     global_enable: Optional[str] = None
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 # Flow control commands
 @dataclass
 class LabelCommand:
     name: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class JumpCommand:
     target: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class SceneCommand:
     name: str
-    mode: str  
+    mode: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class ReturnCommand:
-    pass
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 # Media commands
 @dataclass
 class ShowImageCommand:
     path: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class HideImageCommand:
-    pass
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class PlayBGMCommand:
     path: str
     loop: bool = True
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class StopBGMCommand:
-    pass
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class PlaySFXCommand:
     path: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class PlayVoiceCommand:
     path: str
+    line: Optional[int] = field(default=None, compare=False, repr=False)
 
 @dataclass
 class StopVoiceCommand:
-    pass
\ No newline at end of file
+    line: Optional[int] = field(default=None, compare=False, repr=False)
\ No newline at end of file
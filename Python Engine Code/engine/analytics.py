@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+import weakref
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# Columns of every flushed batch
+COLUMNS = ("story", "scene", "index", "event", "option", "target", "count")
+
+# What a counter slot counts: (story, scene, source index, event, option text, option target)
+SlotInfo = Tuple[str, str, int, str, Optional[str], Optional[str]]
+
+# Choice and path counters shared by every session of a server
+# Each (story, scene, command, option) gets a slot in one machine-word array the first
+# time it is seen; after that a choice costs two dict lookups and two increments.
+# Increments aren't locked, so a rare one can be lost when sessions race on the same
+# slot; that's the price of keeping the engine thread free of locks and I/O.
+# A background thread appends the counts added since its last flush to a file of
+# JSON lines, one column-oriented batch per flush (see COLUMNS)
+class ChoiceAnalytics:
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.counters = array("Q")
+        self.slots: List[SlotInfo] = []
+        self.batches = 0
+        self._keys: Dict[Tuple, int] = {}
+        # id(command) -> (weak reference to the command, first slot)
+        # An entry goes away with its command, so scenes evicted from a cache aren't kept alive
+        # and a reused id never finds a stale entry
+        self._commands: Dict[int, Tuple[weakref.ref, int]] = {}
+        self._flushed = array("Q")
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+        self._thread.start()
+
+    # Slots for a group of counters, allocated together the first time the key is seen
+    def _allocate(self, key: Tuple, infos: List[SlotInfo]) -> int:
+        with self._lock:
+            base = self._keys.get(key)
+            if base is None:
+                base = len(self.slots)
+                self.slots.extend(infos)
+                self.counters.extend([0] * len(infos))
+                self._keys[key] = base
+            return base
+
+    # First slot of a choose command: slot 0 counts showings, slot 1 + i picks of option i
+    def _choice_base(self, story: str, cmd, st) -> int:
+        entry = self._commands.get(id(cmd))
+        if entry is not None and entry[0]() is cmd:
+            return entry[1]
+        index = _source_index(st, st.index - 1)
+        infos = [(story, st.current_scene, index, "shown", None, None)]
+        # Option texts in the story's source language, whatever this session reads
+        texts = [opt.text if opt.text_id is None else st.scenes.strings.get(opt.text_id) for opt in cmd.options]
+        infos += [(story, st.current_scene, index, "picked", text, opt.target) for text, opt in zip(texts, cmd.options)]
+        # Options are part of the key: an edited scene gets fresh slots rather than mislabelled ones
+        key = ("choice", story, st.current_scene, index, tuple(zip(texts, (opt.target for opt in cmd.options))))
+        base = self._allocate(key, infos)
+        with self._lock:
+            command_id = id(cmd)
+            ref = weakref.ref(cmd, lambda ref: self._forget_command(command_id, ref))
+            self._commands[command_id] = (ref, base)
+        return base
+
+    # Weak reference callback: a command that had slots was freed
+    # Runs wherever the garbage collector does, so it takes no lock; losing a race only
+    # costs the next showing of a new command a lookup by key
+    def _forget_command(self, command_id: int, ref: weakref.ref):
+        entry = self._commands.get(command_id)
+        if entry is not None and entry[0] is ref:
+            self._commands.pop(command_id, None)
+
+    def choice_shown(self, story: str, cmd, st):
+        self.counters[self._choice_base(story, cmd, st)] += 1
+
+    def choice_picked(self, story: str, cmd, st, option):
+        base = self._choice_base(story, cmd, st)
+        for i, opt in enumerate(cmd.options):
+            if opt is option:
+                self.counters[base + 1 + i] += 1
+                return
+
+    # Count an event at a position, e.g. a scene entered or a session ending there
+    def count(self, story: str, scene: str, index: int, event: str):
+        key = (event, story, scene, index)
+        slot = self._keys.get(key)
+        if slot is None:
+            slot = self._allocate(key, [(story, scene, index, event, None, None)])
+        self.counters[slot] += 1
+
+    # Append counts added since the last flush as one batch
+    def flush(self):
+        with self._flush_lock:
+            counts = array("Q", self.counters)
+            slots = self.slots[:len(counts)]
+            previous = self._flushed
+            columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+            for slot, value in enumerate(counts):
+                delta = value - (previous[slot] if slot < len(previous) else 0)
+                if delta:
+                    for name, field in zip(COLUMNS, slots[slot] + (delta,)):
+                        columns[name].append(field)
+            self._flushed = counts
+            if not columns["count"]:
+                return
+            batch = {"time": time.time(), "rows": len(columns["count"]), "columns": columns}
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(batch, ensure_ascii=False) + "\n")
+            self.batches += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Analytics flush to {self.path} failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    # Per-session handle bound to a story, as stored on GameState.analytics
+    def session(self, story: str) -> "SessionAnalytics":
+        return SessionAnalytics(self, story)
+
+# Index of a command in its scene's parsed source, so counts survive optimized scenes
+def _source_index(st, index: int) -> int:
+    scene = st.scenes.scene_for(st.current_scene, st.cmds, load=False) if st.scenes is not None else None
+    return scene.to_source(index) if scene is not None else index
+
+# Analytics hooks of one session
+class SessionAnalytics:
+    __slots__ = ("sink", "story")
+
+    def __init__(self, sink: ChoiceAnalytics, story: str):
+        self.sink = sink
+        self.story = story
+
+    def choice_shown(self, cmd, st):
+        self.sink.choice_shown(self.story, cmd, st)
+
+    def choice_picked(self, cmd, st, option):
+        self.sink.choice_picked(self.story, cmd, st, option)
+
+    def scene_entered(self, st):
+        self.sink.count(self.story, st.current_scene, 0, "entered")
+
+    # Where the session stopped: "finished" at the end of the story, otherwise "ended" (a drop-off)
+    def session_ended(self, st, finished: bool):
+        index = _source_index(st, max(0, st.index - 1))
+        self.sink.count(self.story, st.current_scene, index, "finished" if finished else "ended")
+
+# Totals across all batches of an analytics file
+def load_totals(path: str) -> Dict[Tuple, int]:
+    totals: Dict[Tuple, int] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            columns = json.loads(line)["columns"]
+            keys = zip(*(columns[name] for name in COLUMNS[:-1]))
+            for key, count in zip(keys, columns["count"]):
+                totals[key] = totals.get(key, 0) + count
+    return totals
+
+# Summarize an analytics file: pick rates per choice and where sessions stopped
+# Usage: python -m engine.analytics analytics.jsonl [--story name]
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Summarize choice and path analytics")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--story", default=None)
+    arg_parser.add_argument("--top", type=int, default=15)
+    args = arg_parser.parse_args()
+
+    totals = {key: count for key, count in load_totals(args.path).items()
+              if args.story is None or key[0] == args.story}
+
+    shown = {key[:3]: count for key, count in totals.items() if key[3] == "shown"}
+    print("Choices:")
+    for where in sorted(shown):
+        story, scene, index = where
+        print(f"  {story}/{scene} command {index}: shown {shown[where]}")
+        for key, count in sorted(totals.items()):
+            if key[:3] == where and key[3] == "picked":
+                share = count / shown[where] * 100 if shown[where] else 0
+                print(f"    {count:>8} {share:>5.1f}%  {key[4]} -> {key[5]}")
+
+    print("\nScenes entered:")
+    for key, count in sorted(totals.items(), key=lambda kv: -kv[1]):
+        if key[3] == "entered":
+            print(f"  {count:>8}  {key[0]}/{key[1]}")
+
+    stops = [(key, count) for key, count in totals.items() if key[3] in ("ended", "finished")]
+    total_stops = sum(count for _, count in stops) or 1
+    print(f"\nWhere sessions stopped (top {args.top}):")
+    for key, count in sorted(stops, key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {count:>8} {count / total_stops * 100:>5.1f}%  {key[0]}/{key[1]} command {key[2]} ({key[3]})")
@@ -0,0 +1,206 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .variables import MISSING
+
+# Slot name LOAD_REQUEST uses to resume from the session's latest autosave
+AUTOSAVE_SLOT = "auto"
+
+# Raw session state taken on the engine thread: references and one list copy, no serialization
+# Everything the writer needs to build a save document later, on its own thread
+class Checkpoint:
+    __slots__ = ("taken", "reason", "scene", "cmds", "index", "names", "values", "frames", "media")
+
+    def __init__(self, st, index: int, reason: str):
+        self.taken = time.time()
+        self.reason = reason
+        self.scene = st.current_scene
+        self.cmds = st.cmds
+        self.index = index
+        # Schema names are append-only, so the writer can read them without a lock
+        self.names = st.vars.schema.names
+        self.values = list(st.vars.values)
+        # Call frames are immutable tuples
+        self.frames = list(st.call_stack)
+        self.media = (getattr(st, "current_image", None), getattr(st, "current_bgm", None),
+                      getattr(st, "bgm_loop", True))
+
+# Index into the parsed source of a scene, when cmds is that scene's cached command list
+def _source_index(scenes, name: str, cmds, index: int) -> int:
+    scene = scenes.scene_for(name, cmds) if scenes is not None else None
+    return scene.to_source(index) if scene is not None else index
+
+# Source index a call frame returns to; frames pinning their own commands index those directly
+def frame_source_index(scenes, frame) -> int:
+    return frame.index if frame.cmds is None else _source_index(scenes, frame.scene, frame.cmds, frame.index)
+
+# Save document for a checkpoint, in the same layout as SaveSystemManager's saves
+# Call stack frames are stored as scene name and source index and resolved again on load
+def checkpoint_document(checkpoint: Checkpoint, scenes=None) -> Dict[str, Any]:
+    names = checkpoint.names
+    variables = {names[slot]: value for slot, value in enumerate(checkpoint.values) if value is not MISSING}
+    image, bgm, bgm_loop = checkpoint.media
+    return {
+        "save_time": datetime.fromtimestamp(checkpoint.taken).isoformat(),
+        "save_name": "Autosave",
+        "slot": AUTOSAVE_SLOT,
+        "game_state": {
+            "vars": variables,
+            "current_scene": checkpoint.scene,
+            "current_index": _source_index(scenes, checkpoint.scene, checkpoint.cmds, checkpoint.index),
+            "call_stack": [{"scene_name": frame.scene, "index": frame_source_index(scenes, frame)}
+                           for frame in checkpoint.frames],
+        },
+        "media_state": {
+            "images": {"current": image} if image is not None else {},
+            "audio": {"current_bgm": bgm, "bgm_loop": bgm_loop} if bgm else {},
+        },
+        "metadata": {
+            "engine_version": "1.4",
+            "save_type": "autosave",
+            "reason": checkpoint.reason,
+            "has_media_state": True,
+        },
+    }
+
+# Writes autosaves for every session on one background thread
+# Sessions hand over checkpoints without waiting; a session's newer checkpoint replaces
+# one still waiting, so bursts of choices cost one write. Files are replaced atomically
+class AutosaveWriter:
+
+    def __init__(self, directory: str, delay: float = 0.5, scenes=None):
+        self.directory = os.path.abspath(directory)
+        self.delay = delay
+        self.scenes = scenes
+        self.counts = {"checkpoints": 0, "coalesced": 0, "written": 0, "failed": 0}
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._pending: Dict[str, Checkpoint] = {}
+        self._latest: Dict[str, Checkpoint] = {}
+        # Checkpoints being written, and ended sessions whose last checkpoint is still to be written
+        self._writing: Dict[str, Checkpoint] = {}
+        self._forgotten = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="autosave-writer", daemon=True)
+        self._thread.start()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    # Engine thread: hand over a checkpoint; never blocks on the writer
+    def submit(self, key: str, checkpoint: Checkpoint):
+        with self._cond:
+            self.counts["checkpoints"] += 1
+            if key in self._pending:
+                self.counts["coalesced"] += 1
+            self._pending[key] = checkpoint
+            self._latest[key] = checkpoint
+            self._forgotten.discard(key)
+            self._cond.notify()
+
+    # Latest save document of a session: the newest checkpoint, written or not, else its file
+    def latest(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            checkpoint = self._latest.get(key)
+        if checkpoint is not None:
+            return checkpoint_document(checkpoint, self.scenes)
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # A session ended: its pending checkpoint is still written, but nothing else is kept
+    # once it is; until then a reconnecting client still resumes from it
+    def forget(self, key: str):
+        with self._cond:
+            if key in self._pending or key in self._writing:
+                self._forgotten.add(key)
+            else:
+                self._latest.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            # Let a burst of checkpoints collapse before writing
+            if self.delay and not self._closed:
+                time.sleep(self.delay)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._writing = batch
+            for key, checkpoint in batch.items():
+                self._write(key, checkpoint)
+            with self._cond:
+                self._writing = {}
+                for key in batch:
+                    if key in self._forgotten and key not in self._pending:
+                        self._forgotten.discard(key)
+                        self._latest.pop(key, None)
+
+    def _write(self, key: str, checkpoint: Checkpoint):
+        path = self.path(key)
+        tmp = f"{path}.tmp"
+        try:
+            data = json.dumps(checkpoint_document(checkpoint, self.scenes), ensure_ascii=False, default=str)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.counts["written"] += 1
+        except Exception as e:
+            self.counts["failed"] += 1
+            print(f"Autosave for {key} failed: {e}")
+
+    # Write whatever is pending and stop the writer thread
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+# Session keys end up in file names
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def valid_session_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+# Key the server gives a new session; unguessable, so only its client can resume the autosave
+def new_session_key() -> str:
+    return secrets.token_urlsafe(24)
+
+# Autosave policy of one session: checkpoint at every choice and/or every interval seconds
+class Autosave:
+
+    def __init__(self, writer: AutosaveWriter, key: str, at_choices: bool = True,
+                 interval: Optional[float] = None):
+        self.writer = writer
+        self.key = key
+        self.at_choices = at_choices
+        self.interval = interval
+        self._due = time.monotonic() + interval if interval else None
+
+    # Checkpoint resuming at cmds[index]
+    def checkpoint(self, st, index: int, reason: str):
+        self.writer.submit(self.key, Checkpoint(st, index, reason))
+        if self.interval:
+            self._due = time.monotonic() + self.interval
+
+    # Called by handle_choose once the choice is about to be shown; resuming shows it again
+    def at_choice(self, st):
+        if self.at_choices:
+            self.checkpoint(st, st.index - 1, "choice")
+
+    # Called by the engine loop before each command
+    def tick(self, st):
+        if self._due is not None and time.monotonic() >= self._due:
+            self.checkpoint(st, st.index, "interval")
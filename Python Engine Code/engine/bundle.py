@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+from typing import Any, Dict, List, Tuple
+
+from commands import ShowImageCommand, PlayBGMCommand, PlaySFXCommand, PlayVoiceCommand
+from .scenes import DirectorySource
+
+# Single-file story bundle
+# Layout: header | scene blobs | JSON index (scene offsets + asset manifest)
+MAGIC = b"IFBUNDLE"
+VERSION = 1
+_HEADER = struct.Struct("<8sIQQ")  # magic, version, index offset, index length
+
+SOURCE = "source"
+COMPILED = "pickle"
+
+_ASSET_TYPES = {
+    ShowImageCommand: "image",
+    PlayBGMCommand: "audio",
+    PlaySFXCommand: "audio",
+    PlayVoiceCommand: "audio",
+}
+
+# Media files referenced by a command list
+def _asset_refs(cmds: List[Any]) -> List[Tuple[str, str]]:
+    return [(_ASSET_TYPES[type(cmd)], cmd.path) for cmd in cmds if type(cmd) in _ASSET_TYPES]
+
+# Pack every scene of a story directory into one bundle file
+# compiled=True stores pickled command lists so loading skips parsing entirely
+# A scene that doesn't parse fails the build with a ScriptSyntaxError naming its file
+def build_bundle(scene_dir: str, out_path: str, compiled: bool = False) -> Dict[str, Any]:
+    from fastparser import ScriptSyntaxError
+    from parser import parse_script
+
+    source = DirectorySource(scene_dir)
+    scenes = {}
+    assets = {}
+
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, 0))
+
+        for name in source.names():
+            text = source.read(name)
+            try:
+                cmds = parse_script(text, strict=True)
+            except ScriptSyntaxError as e:
+                raise e.in_file(source.path(name)) from e
+
+            if compiled:
+                blob = pickle.dumps(cmds, protocol=pickle.HIGHEST_PROTOCOL)
+                kind = COMPILED
+            else:
+                blob = text.encode("utf-8")
+                kind = SOURCE
+
+            scenes[name] = [f.tell(), len(blob), kind]
+            f.write(blob)
+
+            # Asset manifest: every referenced media path and the scenes using it
+            for asset_type, path in _asset_refs(cmds):
+                entry = assets.setdefault(path, {"type": asset_type, "scenes": []})
+                if name not in entry["scenes"]:
+                    entry["scenes"].append(name)
+
+        index = json.dumps({"scenes": scenes, "assets": assets}, ensure_ascii=False).encode("utf-8")
+        index_offset = f.tell()
+        f.write(index)
+        size = f.tell()
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, index_offset, len(index)))
+
+    return {"scenes": len(scenes), "assets": len(assets), "bytes": size}
+
+# Read-only, memory-mapped story bundle
+# Scenes are located through the in-memory index and sliced straight out of the mapping
+class StoryBundle:
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, index_offset, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a story bundle: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported bundle version {version} in {self.path}")
+
+        index = json.loads(self._view[index_offset:index_offset + index_length].tobytes())
+        self.scenes: Dict[str, List[Any]] = index["scenes"]
+        self.assets: Dict[str, Dict[str, Any]] = index["assets"]
+
+    @staticmethod
+    def is_bundle(path: str) -> bool:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def _blob(self, name: str):
+        if name not in self.scenes:
+            raise FileNotFoundError(f"Scene '{name}' not found in bundle {self.path}")
+        offset, length, kind = self.scenes[name]
+        return self._view[offset:offset + length], kind
+
+    # Raw script text of a scene (source bundles only)
+    def read(self, name: str) -> str:
+        blob, kind = self._blob(name)
+        if kind != SOURCE:
+            raise ValueError(f"Scene '{name}' is stored compiled in {self.path}")
+        return str(blob, "utf-8")
+
+    # Parsed command list of a scene
+    # Strict loads raise syntax errors naming the bundle and scene, line and column
+    def load(self, name: str, strict: bool = False) -> List[Any]:
+        blob, kind = self._blob(name)
+        if kind == COMPILED:
+            return pickle.loads(blob)
+
+        from fastparser import ScriptSyntaxError
+        from parser import parse_script
+        try:
+            return parse_script(str(blob, "utf-8"), strict=strict)
+        except ScriptSyntaxError as e:
+            raise e.in_file(f"{self.path}:{name}") from e
+
+    def names(self) -> List[str]:
+        return sorted(self.scenes)
+
+    # Pickled as its path, so worker processes map the same file
+    def __reduce__(self):
+        return (StoryBundle, (self.path,))
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    arg_parser = argparse.ArgumentParser(description="Build a single-file story bundle")
+    arg_parser.add_argument("scene_dir", help="Directory holding the story's .txt scenes")
+    arg_parser.add_argument("output", help="Bundle file to write")
+    arg_parser.add_argument("--compiled", action="store_true", help="Store parsed command lists instead of source")
+    args = arg_parser.parse_args()
+
+    from fastparser import ScriptSyntaxError
+
+    try:
+        stats = build_bundle(args.scene_dir, args.output, compiled=args.compiled)
+    except ScriptSyntaxError as e:
+        # Don't leave a half-written bundle behind
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        print(f"Bundle not built: {e}")
+        sys.exit(1)
+    print(f"Bundled {stats['scenes']} scenes, {stats['assets']} assets, {stats['bytes']} bytes -> {args.output}")
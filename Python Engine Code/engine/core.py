@@ -3,10 +3,15 @@ from .handlers import (
     handle_say, handle_setvar, handle_jump, handle_label,
     handle_choose, handle_roll, handle_input, handle_scene, handle_return,
     handle_show_image, handle_hide_image, handle_play_bgm, 
-    handle_stop_bgm, handle_play_sfx, handle_play_voice, handle_stop_voice
+    handle_stop_bgm, handle_play_sfx, handle_play_voice, handle_stop_voice, return_to
 )
 from .ui import UiPort, UIEvent
+from .scenes import DirectorySource, scene_cache
+from .expressions import resolve_variables
+from .variables import SlotVars
+from .presentation import Presentation
 from typing import Optional
+import os
 from commands import (
     SayCommand, SetVarCommand, LabelCommand, JumpCommand, ChooseCommand,
     RollCommand, InputCommand, SceneCommand, ReturnCommand,
@@ -35,16 +40,36 @@ HANDLERS = {
 }
 
 # Main game execution loop
-def run(cmd_list, initial_scene="main", ui: Optional[UiPort] = None):
+# profiler: optional engine.profiler.ScriptProfiler charged with every command
+# autosave: optional engine.autosave.Autosave checkpointing the session in the background
+# saves: save slots of the session's story (engine.save_system.SaveSystemManager)
+# analytics: optional engine.analytics.SessionAnalytics counting choices and drop-offs
+# strings: dialogue table of the session's language, for stories compiled against string tables
+# max_call_depth: how deeply scene calls may nest (default engine.state.MAX_CALL_DEPTH)
+def run(cmd_list, initial_scene="main", ui: Optional[UiPort] = None, scenes=None, profiler=None,
+        autosave=None, saves=None, analytics=None, strings=None, max_call_depth=None):
     if ui is None:
         raise RuntimeError("No UiPort provided. Use WebSocket server.")
+    if profiler is not None:
+        ui = profiler.wrap_ui(ui)
     
     # Initialize game state
-    st = GameState(cmds=cmd_list)
+    # Scenes from the cache are already resolved; this covers command lists parsed by the caller
+    # Variables live in slots of the story's schema, which the scene cache compiles against
+    scenes = scene_cache(scenes if scenes is not None else DirectorySource(os.getcwd()))
+    st = GameState(cmds=resolve_variables(cmd_list, scenes.schema), vars=SlotVars(schema=scenes.schema))
     st.current_scene = initial_scene
     st.labels = {cmd.name: i for i, cmd in enumerate(cmd_list) 
                  if isinstance(cmd, LabelCommand)}
     st.ui = ui
+    st.presentation = Presentation(ui)
+    st.scenes = scenes
+    st.autosave = autosave
+    st.saves = saves
+    st.analytics = analytics
+    st.strings = strings
+    if max_call_depth is not None:
+        st.max_call_depth = max_call_depth
     
     _init_media_state(st)
     
@@ -54,21 +79,39 @@ def run(cmd_list, initial_scene="main", ui: Optional[UiPort] = None):
     
     st.ui.emit(UIEvent("INIT", {"title": initial_scene}))
 
+    # Start parsing the scenes this one can switch to
+    st.scenes.prefetch_for(st)
+    if analytics is not None:
+        analytics.scene_entered(st)
+
     # Main execution loop
-    while st.index < len(st.cmds):
-        cmd = st.cmds[st.index]
-        st.index += 1
+    finished = False
+    try:
+        while st.index < len(st.cmds):
+            if autosave is not None:
+                autosave.tick(st)
+            cmd = st.cmds[st.index]
+            st.index += 1
 
-        handler = HANDLERS.get(type(cmd))
-        if handler:
-            try:
-                handler(cmd, st)
-            except Exception as e:
-                st.ui.emit(UIEvent("INFO", {"text": f"Error: {e}"}))
+            handler = HANDLERS.get(type(cmd))
+            if handler:
+                try:
+                    if profiler is None:
+                        handler(cmd, st)
+                    else:
+                        profiler.run_command(handler, cmd, st)
+                except Exception as e:
+                    st.ui.emit(UIEvent("INFO", {"text": f"Error: {e}"}))
         
-        # Auto-return from scene calls when finished
-        if st.index >= len(st.cmds) and st.call_stack:
-            _return_to_caller(st)
+            # Auto-return from scene calls when finished, through every caller that has finished too
+            while st.index >= len(st.cmds) and st.call_stack:
+                _return_to_caller(st)
+        finished = True
+    finally:
+        # Stop prefetching for this session, however it ended
+        st.scenes.release(st)
+        if analytics is not None:
+            analytics.session_ended(st, finished)
 
     st.ui.emit(UIEvent("END", {"text": "Game finished!"}))
 
@@ -78,15 +121,17 @@ def _return_to_caller(st: GameState):
     if not st.call_stack:
         return
     
-    caller_state = st.call_stack.pop()
-    st.cmds = caller_state['cmds']
-    st.index = caller_state['index']
-    st.labels = caller_state['labels']
-    st.current_scene = caller_state.get('scene_name', st.current_scene)
-    st.ui.emit(UIEvent("INFO", {"text": "[Scene returned]"}))
+    try:
+        return_to(st, st.call_stack.pop())
+    except Exception as e:
+        st.ui.emit(UIEvent("INFO", {"text": f"Error returning from scene: {e}"}))
+        return
+    if st.ui.wants("INFO", "debug"):
+        st.ui.emit(UIEvent("INFO", {"text": "[Scene returned]"}, droppable=True))
 
 # Initialize media state tracking attributes
 def _init_media_state(st: GameState):
     st.current_image = None  
     st.current_bgm = None        
-    st.bgm_loop = True           
\ No newline at end of file
+    st.bgm_loop = True
+    st.current_voice = None           
\ No newline at end of file
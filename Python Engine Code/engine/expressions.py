@@ -0,0 +1,296 @@
+import ast
+import operator as op
+import re
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .variables import MISSING, SlotVars, VarSchema
+
+# Safe expression evaluation system
+_BIN_OPERATORS = {
+    ast.Add: op.add, ast.Sub: op.sub, ast.Mult: op.mul,
+    ast.Div: op.truediv, ast.Mod: op.mod, ast.Pow: op.pow
+}
+
+_CMP_OPERATORS = {
+    ast.Gt: op.gt, ast.GtE: op.ge, ast.Lt: op.lt,
+    ast.LtE: op.le, ast.Eq: op.eq, ast.NotEq: op.ne
+}
+
+# Safe evaluation function for expressions
+# Supports basic math, comparisons, and variable references
+def safe_eval(expr: str, vars_dict: Dict[str, Any]) -> Any:
+    if expr is None:
+        return None
+
+    # Clean expression
+    expr = str(expr).replace("{", "").replace("}", "").strip()
+
+    try:
+        node = ast.parse(expr, mode="eval").body
+        return _eval_node(node, vars_dict)
+    except Exception:
+        return 0
+
+# Recursive evaluation of AST nodes
+# Handle numbers, variable references, binary operations, comparisons, and boolean operations
+def _eval_node(node, vars_dict: Dict[str, Any]) -> Any:
+    if isinstance(node, (ast.Constant, ast.Constant)):
+        return node.n if hasattr(node, "n") else node.value
+
+    elif isinstance(node, ast.Name):
+        return vars_dict.get(node.id, 0)
+
+    elif isinstance(node, ast.BinOp):
+        if type(node.op) in _BIN_OPERATORS:
+            left = _eval_node(node.left, vars_dict)
+            right = _eval_node(node.right, vars_dict)
+            return _BIN_OPERATORS[type(node.op)](left, right)
+
+    elif isinstance(node, ast.Compare):
+        left = _eval_node(node.left, vars_dict)
+        right = _eval_node(node.comparators[0], vars_dict)
+        if type(node.ops[0]) in _CMP_OPERATORS:
+            return _CMP_OPERATORS[type(node.ops[0])](left, right)
+
+    elif isinstance(node, ast.BoolOp):
+        if isinstance(node.op, ast.And):
+            return all(_eval_node(v, vars_dict) for v in node.values)
+        elif isinstance(node.op, ast.Or):
+            return any(_eval_node(v, vars_dict) for v in node.values)
+
+    raise ValueError(f"Unsupported expression node type: {type(node)}")
+
+# Compile an AST node into a function of the slot value list
+# Mirrors _eval_node case by case, with variable names resolved to slots of schema up front
+def _compile_node(node, schema: VarSchema) -> Callable[[List[Any]], Any]:
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda values: value
+
+    elif isinstance(node, ast.Name):
+        slot = schema.slot(node.id)
+        def load(values):
+            if slot < len(values):
+                value = values[slot]
+                if value is not MISSING:
+                    return value
+            return 0
+        return load
+
+    elif isinstance(node, ast.BinOp):
+        fn = _BIN_OPERATORS.get(type(node.op))
+        if fn is not None:
+            left, right = _compile_node(node.left, schema), _compile_node(node.right, schema)
+            return lambda values: fn(left(values), right(values))
+
+    elif isinstance(node, ast.Compare):
+        # Like _eval_node, only the first comparison of a chain counts
+        fn = _CMP_OPERATORS.get(type(node.ops[0]))
+        if fn is not None:
+            left, right = _compile_node(node.left, schema), _compile_node(node.comparators[0], schema)
+            return lambda values: fn(left(values), right(values))
+
+    elif isinstance(node, ast.BoolOp):
+        parts = [_compile_node(v, schema) for v in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda values: all(part(values) for part in parts)
+        elif isinstance(node.op, ast.Or):
+            return lambda values: any(part(values) for part in parts)
+
+    message = f"Unsupported expression node type: {type(node)}"
+    def unsupported(values):
+        raise ValueError(message)
+    return unsupported
+
+# Expression parsed once, with its variables resolved to slots of one schema
+# evaluate() gives exactly what safe_eval() would for the same text
+# slots are the variables it reads, which is what its result depends on
+class CompiledExpr:
+    __slots__ = ("source", "node", "slots", "fn")
+
+    def __init__(self, source: str, schema: VarSchema):
+        self.source = source
+        self.slots: Tuple[int, ...] = ()
+        self.fn = None
+        try:
+            self.node = ast.parse(source.replace("{", "").replace("}", "").strip(), mode="eval").body
+            self.fn = _compile_node(self.node, schema)
+        except Exception:
+            self.node = None
+            return
+        names = sorted({n.id for n in ast.walk(self.node) if isinstance(n, ast.Name)})
+        self.slots = tuple(schema.slot(name) for name in names)
+
+    def evaluate(self, vars_dict: Dict[str, Any]) -> Any:
+        if self.fn is None:
+            return 0
+        try:
+            # Plain dicts (tools, old callers) take the name-based path
+            if isinstance(vars_dict, SlotVars):
+                return self.fn(vars_dict.values)
+            return _eval_node(self.node, vars_dict)
+        except Exception:
+            return 0
+
+# Story expressions are shared by all sessions, so compile each text once per story
+# Stores of that story (SlotVars with the same schema) are what the result evaluates against
+_compiled_lock = threading.Lock()
+
+def compile_expr(expr: Any, schema: VarSchema) -> CompiledExpr:
+    source = str(expr)
+    compiled = schema.exprs.get(source)
+    if compiled is None:
+        with _compiled_lock:
+            compiled = schema.exprs.setdefault(source, CompiledExpr(source, schema))
+    return compiled
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# Placeholders of a say text, found once: (start, end, slot) of each {name}
+# It keeps no text of its own, so table strings stay in their table; render() is given the
+# text again and gives what substituting {name} with the variable (or leaving it as is) would
+class TextTemplate:
+    __slots__ = ("parts",)
+
+    def __init__(self, text: str, schema: VarSchema):
+        self.parts: List[Tuple[int, int, int]] = [
+            (m.start(), m.end(), schema.slot(m.group(1))) for m in _PLACEHOLDER.finditer(text)]
+
+    def render(self, text: str, vars_dict: SlotVars) -> str:
+        if not self.parts:
+            return text
+        out = []
+        pos = 0
+        for start, end, slot in self.parts:
+            value = vars_dict.get_slot(slot, MISSING)
+            out.append(text[pos:start])
+            out.append(text[start:end] if value is MISSING else str(value))
+            pos = end
+        out.append(text[pos:])
+        return "".join(out)
+
+# Template of text without placeholders
+_PLAIN_TEXT = TextTemplate("", VarSchema())
+
+# Template of an inline say text, cached by the text its command holds
+def compile_text(text: str, schema: VarSchema) -> TextTemplate:
+    template = schema.texts.get(text)
+    if template is None:
+        with _compiled_lock:
+            template = schema.texts.setdefault(text, TextTemplate(text, schema))
+    return template
+
+# Template of a string table string, cached by (table, string id) and only for the strings the
+# table found placeholders in, so dialogue read from a table is never kept on the heap
+def compile_table_text(table, string_id: int, text: str, schema: VarSchema) -> TextTemplate:
+    if string_id not in table.templated:
+        return _PLAIN_TEXT
+    key = (table, string_id)
+    template = schema.table_texts.get(key)
+    if template is None:
+        with _compiled_lock:
+            template = schema.table_texts.setdefault(key, TextTemplate(text, schema))
+    return template
+
+# Compile-time pass over a scene: give every variable it touches a slot in the
+# story's schema, record the slot on commands that write variables, and precompile
+# its expressions and texts so sessions never parse them
+def resolve_variables(cmds: List[Any], schema: VarSchema) -> List[Any]:
+    from commands import ChooseCommand, InputCommand, RollCommand, SayCommand, SetVarCommand
+
+    for cmd in cmds:
+        if isinstance(cmd, SetVarCommand):
+            cmd.slot = schema.slot(cmd.name)
+            compile_expr(cmd.value, schema)
+        elif isinstance(cmd, InputCommand):
+            cmd.slot = schema.slot(cmd.var_name)
+        elif isinstance(cmd, RollCommand):
+            cmd.slot = schema.slot(cmd.to or "rollResult")
+        elif isinstance(cmd, SayCommand) and cmd.text is not None:
+            compile_text(cmd.text, schema)
+        elif isinstance(cmd, ChooseCommand):
+            for expr in (cmd.global_when, cmd.global_enable):
+                if expr:
+                    compile_expr(expr, schema)
+            for opt in cmd.options:
+                for expr in (opt.when, opt.enable):
+                    if expr:
+                        compile_expr(expr, schema)
+    return cmds
+
+# Evaluate a choice condition through the story's compiled expressions
+def eval_condition(expr: Any, st) -> Any:
+    return compile_expr(expr, st.vars.schema).evaluate(st.vars)
+
+# Choice menu memoization can be switched off for benchmarking
+memoize_conditions = True
+
+# Options of a menu that pass their -when, each with whether its -enable holds,
+# or None when the menu's global conditions fail
+def _evaluate_menu(cmd, st) -> Optional[List[Tuple[Any, bool]]]:
+    if cmd.global_when and not eval_condition(cmd.global_when, st):
+        return None
+    if cmd.global_enable and not eval_condition(cmd.global_enable, st):
+        return None
+    return [(opt, not opt.enable or bool(eval_condition(opt.enable, st)))
+            for opt in cmd.options if not opt.when or eval_condition(opt.when, st)]
+
+# Slots read by any condition of a menu
+def _menu_slots(cmd, schema: VarSchema) -> Tuple[int, ...]:
+    exprs = [cmd.global_when, cmd.global_enable]
+    for opt in cmd.options:
+        exprs += [opt.when, opt.enable]
+    return tuple(sorted({slot for expr in exprs if expr for slot in compile_expr(expr, schema).slots}))
+
+# Choice menus a session last evaluated
+# id(command) -> (weak reference to the command, store id, store version, slots read, menu)
+# An entry goes away with its command, so menus of scenes evicted from a cache aren't
+# kept and a reused id never finds a stale entry
+class ConditionMemo:
+
+    def __init__(self):
+        self.entries: Dict[int, Tuple[weakref.ref, int, int, Tuple[int, ...], Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, cmd):
+        entry = self.entries.get(id(cmd))
+        return entry if entry is not None and entry[0]() is cmd else None
+
+    def put(self, cmd, ref: Optional[weakref.ref], store_id: int, version: int, slots: Tuple[int, ...], menu):
+        command_id = id(cmd)
+        if ref is None:
+            ref = weakref.ref(cmd, lambda ref: self._forget(command_id, ref))
+        self.entries[command_id] = (ref, store_id, version, slots, menu)
+
+    # Weak reference callback: a memoized command was freed
+    def _forget(self, command_id: int, ref: weakref.ref):
+        entry = self.entries.get(command_id)
+        if entry is not None and entry[0] is ref:
+            self.entries.pop(command_id, None)
+
+# Evaluate a menu's conditions, reusing the session's last result for that menu while
+# none of the variables they read has changed (hub menus are revisited with most of them untouched)
+def choice_menu(cmd, st) -> Optional[List[Tuple[Any, bool]]]:
+    vars_ = st.vars
+    if not memoize_conditions or not isinstance(vars_, SlotVars):
+        return _evaluate_menu(cmd, st)
+
+    memo = st.condition_memo
+    entry = memo.get(cmd)
+    if entry is not None:
+        ref, store_id, since, slots, menu = entry
+        if store_id == vars_.store_id and not vars_.changed_since(slots, since):
+            if since != vars_.version:
+                memo.put(cmd, ref, store_id, vars_.version, slots, menu)
+            return menu
+    else:
+        ref, slots = None, _menu_slots(cmd, vars_.schema)
+
+    version = vars_.version
+    menu = _evaluate_menu(cmd, st)
+    memo.put(cmd, ref, vars_.store_id, version, slots, menu)
+    return menu
@@ -1,5 +1,3 @@
-import ast
-import operator as op
 import re
 import random
 from typing import Any, Dict, List
@@ -10,67 +8,17 @@ from commands import (
     ShowImageCommand, HideImageCommand, PlayBGMCommand, 
     StopBGMCommand, PlaySFXCommand, PlayVoiceCommand, StopVoiceCommand
 )
-from .state import GameState
+from .state import CallFrame, GameState
 from .ui import UIEvent
 from .save_system import SaveSystemManager 
-
-# Safe expression evaluation system
-_BIN_OPERATORS = {
-    ast.Add: op.add, ast.Sub: op.sub, ast.Mult: op.mul,
-    ast.Div: op.truediv, ast.Mod: op.mod, ast.Pow: op.pow
-}
-
-_CMP_OPERATORS = {
-    ast.Gt: op.gt, ast.GtE: op.ge, ast.Lt: op.lt,
-    ast.LtE: op.le, ast.Eq: op.eq, ast.NotEq: op.ne
-}
+from .expressions import (
+    safe_eval, compile_expr, compile_text, compile_table_text, eval_condition, choice_menu
+)
+from .presentation import present, presentation_of
+from .strings import localized
 
 _DICE_PATTERN = re.compile(r'(\d*)d(\d+)')
 
-# Safe evaluation function for expressions
-# Supports basic math, comparisons, and variable references
-def safe_eval(expr: str, vars_dict: Dict[str, Any]) -> Any:
-    if expr is None:
-        return None
-    
-    # Clean expression
-    expr = str(expr).replace("{", "").replace("}", "").strip()
-    
-    try:
-        node = ast.parse(expr, mode="eval").body
-        return _eval_node(node, vars_dict)
-    except Exception:
-        return 0
-
-# Recursive evaluation of AST nodes
-# Handle numbers, variable references, binary operations, comparisons, and boolean operations
-def _eval_node(node, vars_dict: Dict[str, Any]) -> Any:
-    if isinstance(node, (ast.Constant, ast.Constant)):
-        return node.n if hasattr(node, "n") else node.value
-    
-    elif isinstance(node, ast.Name):
-        return vars_dict.get(node.id, 0)
-    
-    elif isinstance(node, ast.BinOp):
-        if type(node.op) in _BIN_OPERATORS:
-            left = _eval_node(node.left, vars_dict)
-            right = _eval_node(node.right, vars_dict)
-            return _BIN_OPERATORS[type(node.op)](left, right)
-    
-    elif isinstance(node, ast.Compare):
-        left = _eval_node(node.left, vars_dict)
-        right = _eval_node(node.comparators[0], vars_dict)
-        if type(node.ops[0]) in _CMP_OPERATORS:
-            return _CMP_OPERATORS[type(node.ops[0])](left, right)
-    
-    elif isinstance(node, ast.BoolOp):
-        if isinstance(node.op, ast.And):
-            return all(_eval_node(v, vars_dict) for v in node.values)
-        elif isinstance(node.op, ast.Or):
-            return any(_eval_node(v, vars_dict) for v in node.values)
-    
-    raise ValueError(f"Unsupported expression node type: {type(node)}")
-
 # Roll dice expression handler
 def _roll_dice(match: re.Match) -> str:
     count = int(match.group(1) or 1)
@@ -81,18 +29,27 @@ def _roll_dice(match: re.Match) -> str:
 # Basic command handlers
 # Handle Say, SetVar, Input, Label, Jump, Choose, Roll, Scene, Return commands
 def handle_say(cmd: SayCommand, st: GameState):
+    # Dialogue of scenes compiled against a string table comes from the session's language
     # Replace variable references in text
-    text = re.sub(r"\{(\w+)\}", lambda m: str(st.vars.get(m.group(1), f"{{{m.group(1)}}}")), cmd.text)
+    if cmd.text_id is None:
+        text, speaker = cmd.text, cmd.speaker
+        template = compile_text(text, st.vars.schema)
+    else:
+        strings = st.strings or st.scenes.strings
+        text = strings.get(cmd.text_id)
+        speaker = cmd.speaker if cmd.speaker_id is None else strings.get(cmd.speaker_id)
+        template = compile_table_text(strings, cmd.text_id, text, st.vars.schema)
+    text = template.render(text, st.vars)
     
     st.ui.emit(UIEvent("SHOW_TEXT", {
         "text": text, 
-        "speaker": cmd.speaker
+        "speaker": speaker
     }))
     st.ui.wait_next()
 
 def handle_setvar(cmd: SetVarCommand, st: GameState):
-    value = safe_eval(cmd.value, st.vars)
-    st.vars[cmd.name] = value
+    value = compile_expr(cmd.value, st.vars.schema).evaluate(st.vars)
+    st.vars.set_slot(cmd.slot, value)
 
 def handle_input(cmd: InputCommand, st: GameState):
     prompt = cmd.prompt or f"Enter {cmd.var_name}: "
@@ -103,10 +60,11 @@ def handle_input(cmd: InputCommand, st: GameState):
     }))
     
     value = st.ui.wait_text_input(prompt)
-    st.vars[cmd.var_name] = value
+    st.vars.set_slot(cmd.slot, value)
 
 def handle_label(cmd: LabelCommand, st: GameState):
-    st.ui.emit(UIEvent("INFO", {"text": f"[Label: {cmd.name}]"}))
+    if st.ui.wants("INFO", "trace"):
+        st.ui.emit(UIEvent("INFO", {"text": f"[Label: {cmd.name}]"}, droppable=True))
 
 def handle_jump(cmd: JumpCommand, st: GameState):
     if cmd.target in st.labels:
@@ -115,20 +73,13 @@ def handle_jump(cmd: JumpCommand, st: GameState):
         st.ui.emit(UIEvent("INFO", {"text": f"Error: Label {cmd.target} not found"}))
 
 def handle_choose(cmd: ChooseCommand, st: GameState):
-    # Check global conditions
-    if cmd.global_when and not safe_eval(cmd.global_when, st.vars):
-        return
-    
-    if cmd.global_enable and not safe_eval(cmd.global_enable, st.vars):
+    # Check global conditions and filter valid options
+    # The result is memoized per session and recomputed only when a variable it reads changes
+    menu = choice_menu(cmd, st)
+    if menu is None:
         return
 
-    # Filter valid options
-    candidates: List[Option] = []
-    for opt in cmd.options:
-        if opt.when and not safe_eval(opt.when, st.vars):
-            continue
-        candidates.append(opt)
-    
+    candidates: List[Option] = [opt for opt, _ in menu]
     if not candidates:
         st.ui.emit(UIEvent("INFO", {"text": "[No available choices]"}))
         st.ui.wait_next()
@@ -137,18 +88,18 @@ def handle_choose(cmd: ChooseCommand, st: GameState):
     # Build choice list
     items = []
     valid_ids = []
-    for opt in candidates:
-        enabled = True
-        if opt.enable and not safe_eval(opt.enable, st.vars):
-            enabled = False
-        
+    for opt, enabled in menu:
         items.append({
             "id": opt.target, 
-            "text": opt.text, 
+            "text": localized(opt, "text", st), 
             "enabled": enabled
         })
         valid_ids.append(opt.target)
 
+    if st.autosave is not None:
+        st.autosave.at_choice(st)
+    if st.analytics is not None:
+        st.analytics.choice_shown(cmd, st)
     st.ui.emit(UIEvent("CHOICES", {"items": items}))
     
     # Wait for user choice
@@ -156,7 +107,9 @@ def handle_choose(cmd: ChooseCommand, st: GameState):
         chosen = st.ui.wait_choice(valid_ids)
         chosen_opt = next((o for o in candidates if o.target == chosen), None)
         
-        if chosen_opt and (not chosen_opt.enable or safe_eval(chosen_opt.enable, st.vars)):
+        if chosen_opt and (not chosen_opt.enable or eval_condition(chosen_opt.enable, st)):
+            if st.analytics is not None:
+                st.analytics.choice_picked(cmd, st, chosen_opt)
             st.index = st.labels[chosen]
             return
         else:
@@ -171,49 +124,53 @@ def handle_roll(cmd: RollCommand, st: GameState):
     
     # Save result to variable
     target_var = cmd.to or "rollResult"
-    st.vars[target_var] = result
+    st.vars.set_slot(cmd.slot, result)
     
-    st.ui.emit(UIEvent("ROLL_RESULT", {
-        "expr": cmd.expr, 
-        "to": target_var, 
-        "value": result
-    }))
+    if st.ui.wants("ROLL_RESULT"):
+        st.ui.emit(UIEvent("ROLL_RESULT", {
+            "expr": cmd.expr, 
+            "to": target_var, 
+            "value": result
+        }))
 
 def handle_scene(cmd: SceneCommand, st: GameState):
-    from parser import parse_script
-    from commands import LabelCommand
-    
     script_file = f"{cmd.name}.txt"
     
     try:
-        with open(script_file, "r", encoding="utf-8") as f:
-            script_text = f.read()
+        scene = st.scenes.get(cmd.name)
         
-        new_cmds = parse_script(script_text)
-        
-        if cmd.mode == "call":
-            # Call scene: save current state to call stack
-            st.call_stack.append({
-                'cmds': st.cmds,
-                'index': st.index,
-                'labels': st.labels,
-                'scene_name': st.current_scene,
-            })
-            st.ui.emit(UIEvent("INFO", {"text": f"[Calling scene: {cmd.name}]"}))
+        if cmd.mode == "call" and _in_tail_position(st):
+            # Nothing left to do here but return, so the called scene returns straight to our caller
+            if st.ui.wants("INFO", "debug"):
+                st.ui.emit(UIEvent("INFO", {"text": f"[Tail-calling scene: {cmd.name}]"}, droppable=True))
+        elif cmd.mode == "call":
+            if len(st.call_stack) >= st.max_call_depth:
+                st.ui.emit(UIEvent("INFO", {"text": f"Error: scene calls nested {st.max_call_depth} deep; "
+                                                    f"not calling '{cmd.name}' from '{st.current_scene}'"}))
+                return
+            # Call scene: save where to come back to on the call stack
+            st.call_stack.append(_call_frame(st))
+            if st.ui.wants("INFO", "debug"):
+                st.ui.emit(UIEvent("INFO", {"text": f"[Calling scene: {cmd.name}]"}, droppable=True))
         else:
             # Change scene: direct replacement
-            st.ui.emit(UIEvent("INFO", {"text": f"[Changed to scene: {cmd.name}]"}))
+            if st.ui.wants("INFO", "debug"):
+                st.ui.emit(UIEvent("INFO", {"text": f"[Changed to scene: {cmd.name}]"}, droppable=True))
 
         # Update scene state
-        st.cmds = new_cmds
+        st.cmds = scene.cmds
         st.index = 0
         st.current_scene = cmd.name
-        st.labels = {c.name: i for i, c in enumerate(new_cmds) if isinstance(c, LabelCommand)}
+        st.labels = scene.labels
+        st.scenes.prefetch_for(st)
+        if st.analytics is not None:
+            st.analytics.scene_entered(st)
         
         # Initialize media state for new scene
         _init_media_state(st)
         
-        st.ui.emit(UIEvent("SCENE_CHANGED", {"name": cmd.name, "mode": cmd.mode}))
+        if st.ui.wants("SCENE_CHANGED"):
+            st.ui.emit(UIEvent("SCENE_CHANGED", {"name": cmd.name, "mode": cmd.mode}))
         
     except FileNotFoundError:
         error_msg = f"Error: Scene file '{script_file}' not found"
@@ -222,61 +179,76 @@ def handle_scene(cmd: SceneCommand, st: GameState):
         error_msg = f"Error loading scene '{cmd.name}': {e}"
         st.ui.emit(UIEvent("INFO", {"text": error_msg}))
 
+# A call is in tail position when only labels stand between it and a return or the end of
+# a called scene; without a caller to return to, a return just warns, so that isn't one
+def _in_tail_position(st: GameState) -> bool:
+    if not st.call_stack:
+        return False
+    cmds, i = st.cmds, st.index
+    while i < len(cmds) and type(cmds[i]) is LabelCommand:
+        i += 1
+    return i >= len(cmds) or type(cmds[i]) is ReturnCommand
+
+# Call frame returning to the command after the current one
+def _call_frame(st: GameState) -> CallFrame:
+    scene = st.scenes.scene_for(st.current_scene, st.cmds, load=False)
+    if scene is not None:
+        return CallFrame(st.current_scene, scene.to_source(st.index))
+    return CallFrame(st.current_scene, st.index, st.cmds, st.labels)
+
+# Resume the scene a call frame returns to
+def return_to(st: GameState, frame: CallFrame):
+    if frame.cmds is None:
+        scene = st.scenes.get(frame.scene)
+        st.cmds, st.labels, st.index = scene.cmds, scene.labels, scene.from_source(frame.index)
+    else:
+        st.cmds, st.labels, st.index = frame.cmds, frame.labels, frame.index
+    st.current_scene = frame.scene
+    st.scenes.prefetch_for(st)
+
 def handle_return(cmd: ReturnCommand, st: GameState):
     if not st.call_stack:
         st.ui.emit(UIEvent("INFO", {"text": "Warning: No scene to return to"}))
         return
     
     # Restore state from call stack
-    caller_state = st.call_stack.pop()
-    st.cmds = caller_state['cmds']
-    st.index = caller_state['index']
-    st.labels = caller_state['labels']
-    st.current_scene = caller_state.get('scene_name', st.current_scene)
+    return_to(st, st.call_stack.pop())
     
-    st.ui.emit(UIEvent("INFO", {"text": "[Returned to previous scene]"}))
+    if st.ui.wants("INFO", "debug"):
+        st.ui.emit(UIEvent("INFO", {"text": "[Returned to previous scene]"}, droppable=True))
 
 # Media command handlers
 # Handle image display, background music, sound effects, and voice commands
+# Image, music and voice handlers update the tracked state and let present() emit
+# only what the client doesn't already show
 def handle_show_image(cmd: ShowImageCommand, st: GameState):
-    st.ui.emit(UIEvent("SHOW_IMAGE", {
-        "path": cmd.path,
-    }))
-    
-    # Track image state
     st.current_image = cmd.path
+    present(st)
 
 def handle_hide_image(cmd: HideImageCommand, st: GameState):
-    st.ui.emit(UIEvent("HIDE_IMAGE", {}))
-    
-    # Clear state tracking
     st.current_image = None
+    present(st)
 
 def handle_play_bgm(cmd: PlayBGMCommand, st: GameState):
-    if hasattr(st, 'current_bgm') and st.current_bgm is not None:
-        st.ui.emit(UIEvent("STOP_BGM", {}))
-    
-    st.ui.emit(UIEvent("PLAY_BGM", {
-        "path": cmd.path,
-        "loop": cmd.loop
-    }))
-    
-    # Track BGM state
     st.current_bgm = cmd.path
     st.bgm_loop = cmd.loop
+    present(st)
 
 def handle_stop_bgm(cmd: StopBGMCommand, st: GameState):
-    st.ui.emit(UIEvent("STOP_BGM", {}))
     st.current_bgm = None
+    present(st)
 
 def handle_play_sfx(cmd: PlaySFXCommand, st: GameState):
-    st.ui.emit(UIEvent("PLAY_SFX", {"path": cmd.path}))
+    if st.ui.wants("PLAY_SFX"):
+        st.ui.emit(UIEvent("PLAY_SFX", {"path": cmd.path}))
 
 def handle_play_voice(cmd: PlayVoiceCommand, st: GameState):
-    st.ui.emit(UIEvent("PLAY_VOICE", {"path": cmd.path}))
+    st.current_voice = cmd.path
+    presentation_of(st).play_voice(cmd.path)
 
 def handle_stop_voice(cmd: StopVoiceCommand, st: GameState):
-    st.ui.emit(UIEvent("STOP_VOICE", {}))
+    st.current_voice = None
+    present(st)
 
 # Initialize media state for game state
 def _init_media_state(st: GameState):
@@ -286,16 +258,19 @@ def _init_media_state(st: GameState):
         st.current_bgm = None
     if not hasattr(st, 'bgm_loop'):
         st.bgm_loop = True
+    if not hasattr(st, 'current_voice'):
+        st.current_voice = None
 
 # Save system handlers
+# Sessions use their story's save slots; states without one share the process-wide slots
 _save_manager = SaveSystemManager()
 
 def handle_save_request(payload: Dict[str, Any], st: GameState):
     _init_media_state(st)
-    result = _save_manager.handle_save_request(payload, st)
+    result = (st.saves or _save_manager).handle_save_request(payload, st)
     st.ui.emit(UIEvent(result["type"], result["payload"]))
 
 def handle_load_request(payload: Dict[str, Any], st: GameState):
     _init_media_state(st)
-    result = _save_manager.handle_load_request(payload, st)
+    result = (st.saves or _save_manager).handle_load_request(payload, st)
     st.ui.emit(UIEvent(result["type"], result["payload"]))
\ No newline at end of file
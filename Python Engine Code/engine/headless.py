@@ -0,0 +1,134 @@
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from .ui import LoadInterruptException, Subscription, UiPort, UIEvent
+
+# Raised by the headless port to end a session
+# A BaseException so the engine's per-command error handling doesn't swallow it
+class SessionLimitReached(BaseException):
+    pass
+
+# In-memory UiPort for benchmarks and tools: answers every wait immediately
+# Picks randomly among the enabled choices of the last CHOICES event
+class HeadlessUiPort(UiPort):
+
+    def __init__(self, max_interactions: int = 1000, seed: Optional[int] = None,
+                 input_value: Any = "Reader", record: bool = False,
+                 subscription: Optional[Subscription] = None):
+        self.rng = random.Random(seed)
+        self.subscription = subscription
+        self.remaining = max_interactions
+        self.input_value = input_value
+        self.event_counts = Counter()
+        self.events: List[UIEvent] = [] if record else None
+        self.last_choices: List[str] = []
+        self.game_state = None
+
+    def wants(self, event_type: str, level: str = "content") -> bool:
+        return self.subscription is None or self.subscription.wants(event_type, level)
+
+    def emit(self, ev: UIEvent) -> None:
+        self.event_counts[ev.type] += 1
+        if self.events is not None:
+            self.events.append(ev)
+        if ev.type == "CHOICES":
+            self.last_choices = [item["id"] for item in ev.payload["items"] if item["enabled"]]
+
+    def _interact(self):
+        self.remaining -= 1
+        if self.remaining < 0:
+            raise SessionLimitReached()
+
+    def wait_next(self) -> None:
+        self._interact()
+
+    def wait_choice(self, valid_ids: List[str]) -> str:
+        self._interact()
+        enabled = [choice for choice in self.last_choices if choice in valid_ids]
+        return self.rng.choice(enabled or valid_ids)
+
+    def wait_text_input(self, prompt: str) -> Any:
+        self._interact()
+        return self.input_value
+
+    def set_game_state(self, game_state):
+        self.game_state = game_state
+
+# In-memory UiPort replaying a recorded session's messages (see engine.recording)
+# Messages are consumed the way WsUiPort consumes its receive queue: a wait skips messages
+# of other kinds, save and load requests are handled inline and a load interrupts a choice.
+# The session ends when the recording runs out
+class ReplayUiPort(UiPort):
+
+    def __init__(self, messages: List[List[Any]], subscription: Optional[Subscription] = None):
+        self.messages = messages
+        self.position = 0
+        self.subscription = subscription or Subscription()
+        self.event_counts = Counter()
+        # Recorded messages the replay couldn't use, e.g. choices the replayed story didn't offer
+        self.counters = Counter()
+        # Time spent on save and load requests, which run inside waits
+        self.save_load_seconds = 0.0
+        self.game_state = None
+
+    def wants(self, event_type: str, level: str = "content") -> bool:
+        return self.subscription.wants(event_type, level)
+
+    def emit(self, ev: UIEvent) -> None:
+        if self.subscription.wants(ev.type):
+            self.event_counts[ev.type] += 1
+
+    def _wait_for(self, message_type: str) -> Dict[str, Any]:
+        messages = self.messages
+        while self.position < len(messages):
+            kind, payload = messages[self.position]
+            self.position += 1
+            if kind == message_type:
+                return payload
+            if kind in ("SAVE_REQUEST", "LOAD_REQUEST"):
+                self._save_load(kind, payload)
+                if kind == "LOAD_REQUEST" and message_type == "CHOICE_SELECTED":
+                    raise LoadInterruptException("Choice wait interrupted by load")
+            else:
+                self.counters[f"skipped {kind}"] += 1
+        raise SessionLimitReached()
+
+    def _save_load(self, kind: str, payload: Dict[str, Any]):
+        from .handlers import handle_save_request, handle_load_request
+
+        start = time.perf_counter()
+        try:
+            if not self.game_state:
+                self.emit(UIEvent("SAVE_ERROR", {"message": "Game state unavailable"}))
+            elif kind == "SAVE_REQUEST":
+                handle_save_request(payload, self.game_state)
+            else:
+                handle_load_request(payload, self.game_state)
+        except Exception as e:
+            self.emit(UIEvent("SAVE_ERROR", {"message": f"Save/load error: {str(e)}"}))
+        finally:
+            self.save_load_seconds += time.perf_counter() - start
+
+    def wait_next(self) -> None:
+        self._wait_for("NEXT")
+
+    def wait_choice(self, valid_ids: List[str]) -> str:
+        while True:
+            choice_id = self._wait_for("CHOICE_SELECTED").get("id")
+            if choice_id in valid_ids:
+                return choice_id
+            self.counters["invalid choice"] += 1
+
+    def wait_text_input(self, prompt: str) -> Any:
+        value = self._wait_for("INPUT_REPLY").get("value", "")
+        try:
+            if '.' not in str(value):
+                return int(value)
+            return float(value)
+        except (ValueError, TypeError):
+            return str(value)
+
+    def set_game_state(self, game_state):
+        self.game_state = game_state
@@ -0,0 +1,264 @@
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Approximate memory of an object graph, counting each object once
+# Objects whose ids are in skip (shared scene data) and non-data objects are not followed
+def deep_size(obj: Any, skip: Set[int] = frozenset(), seen: Optional[Set[int]] = None) -> int:
+    seen = set() if seen is None else seen
+    stack, total = [obj], 0
+    while stack:
+        value = stack.pop()
+        key = id(value)
+        if key in seen or key in skip or isinstance(value, (type, threading.Thread)) or callable(value):
+            continue
+        seen.add(key)
+        total += sys.getsizeof(value)
+        if isinstance(value, (str, bytes, int, float, bool, array)) or value is None:
+            continue
+        if isinstance(value, dict):
+            items = list(value.items())
+            stack.extend(k for k, _ in items)
+            stack.extend(v for _, v in items)
+        elif isinstance(value, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(value))
+        else:
+            if hasattr(value, "__dict__"):
+                total += sys.getsizeof(value.__dict__)
+                stack.extend(list(value.__dict__.values()))
+            for slot in getattr(type(value), "__slots__", ()):
+                if hasattr(value, slot):
+                    stack.append(getattr(value, slot))
+    return total
+
+# Ids of what every session of a story shares: cached command lists and label tables
+def shared_ids(scenes) -> Set[int]:
+    ids = set()
+    for scene in list(scenes._scenes.values()):
+        ids.add(id(scene.cmds))
+        ids.add(id(scene.labels))
+    return ids
+
+# Bytes a session holds on its own, by part
+# Command lists of scenes no longer cached are charged to the sessions still running them
+def session_footprint(st, ui=None, skip: Set[int] = frozenset()) -> Dict[str, int]:
+    parts = {"vars": 0, "labels": 0, "call stack": 0, "pinned scenes": 0, "condition memo": 0,
+             "presentation": 0, "queues": 0}
+    if st is not None:
+        seen: Set[int] = set()
+        vars_ = st.vars
+        parts["vars"] = (sys.getsizeof(vars_) + deep_size(vars_.values, seen=seen)
+                         + deep_size(vars_.versions, seen=seen))
+        parts["labels"] = deep_size(st.labels, skip, seen)
+        pinned = [st.cmds] + [frame.cmds for frame in list(st.call_stack)]
+        pinned_ids = {id(cmds) for cmds in pinned if cmds is not None}
+        parts["call stack"] = deep_size(list(st.call_stack), skip | pinned_ids, seen)
+        parts["pinned scenes"] = sum(deep_size(cmds, skip, seen) for cmds in pinned if cmds is not None)
+        # Memoized menus refer to the story's options, which aren't the session's
+        memo = dict(st.condition_memo.entries)
+        commands = [cmd for cmd in (entry[0]() for entry in memo.values()) if cmd is not None]
+        memo_skip = {id(opt) for cmd in commands for opt in cmd.options}
+        parts["condition memo"] = deep_size(memo, skip | memo_skip, seen)
+        parts["presentation"] = deep_size(st.presentation, {id(st.ui), id(ui)}, seen) if st.presentation else 0
+    if ui is not None:
+        for name in ("send_queue", "recv_queue"):
+            q = getattr(ui, name, None)
+            if q is not None:
+                parts["queues"] += sys.getsizeof(q) + deep_size(list(q.queue))
+    return parts
+
+# Bytes shared by a story's sessions, by part
+def story_footprint(story) -> Dict[str, int]:
+    from .scenes import scene_footprint
+
+    scenes = story.scenes
+    skip = shared_ids(scenes)
+    prefetcher = scenes.prefetcher
+    autosave = story.autosave
+    return {
+        "scenes": sum(scene_footprint(scene) for scene in list(scenes._scenes.values())),
+        "prefetched": prefetcher.ready_bytes if prefetcher else 0,
+        # Saves keep call frames, which point at shared command lists
+        "saves": deep_size(story.saves.memory_saves, skip),
+        "autosave": deep_size(list(autosave._latest.values()), skip) if autosave else 0,
+    }
+
+def process_rss() -> int:
+    try:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+# Address space reserved for each engine thread's stack (virtual; not part of the totals)
+def thread_stack_reserve() -> int:
+    size = threading.stack_size()
+    if size:
+        return size
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_STACK)
+        return soft if soft > 0 else 0
+    except (ImportError, ValueError, OSError):
+        return 0
+
+def _fmt(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+class _Tracked:
+    __slots__ = ("key", "story", "ui", "started", "first", "last")
+
+    def __init__(self, key: str, story, ui):
+        self.key = key
+        self.story = story
+        self.ui = ui
+        self.started = time.time()
+        # (time, bytes) of the first and latest samples, for growth
+        self.first: Optional[Tuple[float, int]] = None
+        self.last: Optional[Tuple[float, Dict[str, int]]] = None
+
+# Opt-in memory accounting for a server
+# Live sessions are sampled every interval seconds on a background thread; each sample
+# attributes bytes to sessions and to the stories' shared data and is kept for growth trends
+class MemoryAccountant:
+
+    def __init__(self, stories: Iterable[Any], interval: float = 10.0, history: int = 360):
+        self.stories = list(stories)
+        self.interval = interval
+        # (time, rss, sessions, session bytes, shared bytes)
+        self.history: deque = deque(maxlen=history)
+        self.shared: Dict[str, Dict[str, int]] = {}
+        self._sessions: Dict[str, _Tracked] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, key: str, story, ui):
+        with self._lock:
+            self._sessions[key] = _Tracked(key, story, ui)
+
+    def untrack(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="memory-accounting", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    # Measure everything now
+    def sample(self):
+        now = time.time()
+        skips = {}
+        shared_total = 0
+        for story in self.stories:
+            skips[story.name] = shared_ids(story.scenes)
+            self.shared[story.name] = story_footprint(story)
+            shared_total += sum(self.shared[story.name].values())
+
+        tracked = self._live()
+        session_total = 0
+        for entry in tracked:
+            # Sessions keep running while they are measured; a graph that changed under us is retried next time
+            try:
+                parts = session_footprint(getattr(entry.ui, "game_state", None), entry.ui,
+                                          skips.get(entry.story.name, frozenset()))
+            except RuntimeError:
+                continue
+            total = sum(parts.values())
+            if entry.first is None:
+                entry.first = (now, total)
+            entry.last = (now, parts)
+            session_total += total
+        self.history.append((now, process_rss(), len(tracked), session_total, shared_total))
+
+    # Tracked sessions whose client is still connected; ones closing right now are left out
+    def _live(self):
+        with self._lock:
+            return [entry for entry in self._sessions.values() if getattr(entry.ui, "running", True)]
+
+    def report(self, top: int = 10) -> str:
+        tracked = [entry for entry in self._live() if entry.last is not None]
+        if not self.history:
+            return "Memory: no samples yet"
+
+        when, rss, count, session_bytes, shared_bytes = self.history[-1]
+        out = [f"Memory at {time.strftime('%H:%M:%S', time.localtime(when))}: RSS {_fmt(rss)}, "
+               f"{count} sessions holding {_fmt(session_bytes)}, shared {_fmt(shared_bytes)}",
+               f"Engine thread stacks reserve {_fmt(thread_stack_reserve())} each (virtual, not counted)"]
+
+        out.append("\nShared per story:")
+        for name, parts in sorted(self.shared.items()):
+            out.append(f"  {name:<16} " + ", ".join(f"{part} {_fmt(size)}" for part, size in parts.items()))
+
+        def total(entry):
+            return sum(entry.last[1].values())
+
+        columns = ["vars", "labels", "call stack", "pinned scenes", "condition memo", "presentation", "queues"]
+        out.append(f"\nTop {min(top, len(tracked))} of {len(tracked)} sessions:")
+        out.append(f"  {'session':<34} {'story':<12} {'total':>9} " + " ".join(f"{c:>14}" for c in columns)
+                   + f" {'age':>7} {'growth/min':>11}")
+        for entry in sorted(tracked, key=total, reverse=True)[:top]:
+            now, parts = entry.last
+            first_time, first_bytes = entry.first
+            minutes = (now - first_time) / 60
+            growth = _fmt((total(entry) - first_bytes) / minutes) if minutes > 0 else "-"
+            out.append(f"  {entry.key[:34]:<34} {entry.story.name[:12]:<12} {_fmt(total(entry)):>9} "
+                       + " ".join(f"{_fmt(parts[c]):>14}" for c in columns)
+                       + f" {int(now - entry.started):>6}s {growth:>11}")
+
+        out.append("\nHistory:")
+        out.append(f"  {'time':<8} {'RSS':>10} {'sessions':>9} {'session bytes':>14} {'shared':>10}")
+        samples = list(self.history)
+        step = max(1, len(samples) // 12)
+        for when, rss, count, session_bytes, shared_bytes in samples[::-step][::-1]:
+            out.append(f"  {time.strftime('%H:%M:%S', time.localtime(when)):<8} {_fmt(rss):>10} {count:>9} "
+                       f"{_fmt(session_bytes):>14} {_fmt(shared_bytes):>10}")
+        return "\n".join(out)
+
+# Print the memory report of a server running with --memory-accounting
+# Usage: python -m engine.memory [--host 127.0.0.1] [--port 8765] [--top 10] [--sample]
+if __name__ == "__main__":
+    import argparse
+    import urllib.error
+    import urllib.request
+
+    arg_parser = argparse.ArgumentParser(description="Show a running server's memory report")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--top", type=int, default=10)
+    arg_parser.add_argument("--sample", action="store_true", help="Measure now instead of showing the last sample")
+    args = arg_parser.parse_args()
+
+    url = f"http://{args.host}:{args.port}/admin/memory?top={args.top}" + ("&sample=1" if args.sample else "")
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            print(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        print(f"{e.code}: {e.read().decode('utf-8', 'replace').strip()}")
+        sys.exit(1)
+    except urllib.error.URLError as e:
+        print(f"Could not reach {url}: {e.reason}")
+        sys.exit(1)
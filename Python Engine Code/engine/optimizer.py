@@ -0,0 +1,251 @@
+import ast
+import copy
+import math
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from commands import ChooseCommand, JumpCommand, LabelCommand, SetVarCommand
+from .expressions import _compile_node, _eval_node
+from .variables import VarSchema
+
+# Optimizer pass over a parsed scene, run before the scene is cached
+# Every rewrite keeps what the engine would do at runtime, including safe_eval's
+# "anything unsupported evaluates to 0"; commands only ever disappear, never move,
+# so each remaining command keeps a source index for saves
+
+# What the optimizer changed in one scene
+@dataclass
+class OptimizationReport:
+    scene: str
+    commands_before: int = 0
+    commands_after: int = 0
+    changes: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    def format(self) -> str:
+        lines = [f"{self.scene}: {self.commands_before} -> {self.commands_after} commands, "
+                 f"{len(self.changes)} changes, {len(self.warnings)} warnings"]
+        lines.extend(f"  {change}" for change in self.changes)
+        lines.extend(f"  warning: {warning}" for warning in self.warnings)
+        return "\n".join(lines)
+
+def _where(cmd, index: int) -> str:
+    line = getattr(cmd, "line", None)
+    return f"line {line}" if line is not None else f"command {index}"
+
+# Constant folding
+
+# AST for a value that evaluates back to exactly that value, or None
+# (the evaluator has no unary minus, so negative numbers are written as 0 - n)
+def _literal(value: Any) -> Optional[ast.expr]:
+    if isinstance(value, bool) or isinstance(value, str):
+        node = ast.Constant(value)
+    elif isinstance(value, (int, float)):
+        if isinstance(value, float) and (not math.isfinite(value) or (value == 0 and math.copysign(1, value) < 0)):
+            return None
+        node = ast.Constant(value) if value >= 0 else ast.BinOp(ast.Constant(0), ast.Sub(), ast.Constant(-value))
+    else:
+        return None
+    # Only keep literals that survive a round trip through source text
+    try:
+        back = _eval_node(ast.parse(ast.unparse(node), mode="eval").body, {})
+    except Exception:
+        return None
+    return node if type(back) is type(value) and back == value else None
+
+def _has_names(node) -> bool:
+    return any(isinstance(n, ast.Name) for n in ast.walk(node))
+
+def _fold_node(node, schema: VarSchema):
+    if not isinstance(node, ast.Constant) and not _has_names(node):
+        try:
+            literal = _literal(_compile_node(node, schema)([]))
+        except Exception:
+            literal = None
+        if literal is not None:
+            return literal
+    for name, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            setattr(node, name, _fold_node(value, schema))
+        elif isinstance(value, list):
+            setattr(node, name, [_fold_node(v, schema) if isinstance(v, ast.AST) else v for v in value])
+    return node
+
+# Fold an expression's constant parts
+# Returns (new text or None if unchanged, constant value or None, note for always-0 expressions)
+def fold_expression(expr: Any, schema: VarSchema) -> Tuple[Optional[str], Optional[Tuple[Any]], Optional[str]]:
+    source = str(expr).replace("{", "").replace("}", "").strip()
+    try:
+        tree = ast.parse(source, mode="eval").body
+    except Exception:
+        return "0", (0,), "does not parse, so it always evaluates to 0"
+
+    constant = None
+    if not _has_names(tree):
+        try:
+            constant = (_compile_node(tree, schema)([]),)
+        except Exception as e:
+            return "0", (0,), f"always evaluates to 0 ({e})"
+
+    folded = _fold_node(copy.deepcopy(tree), schema)
+    text = ast.unparse(folded)
+    if text == ast.unparse(tree):
+        return None, constant, None
+    return text, constant, None
+
+def _fold_commands(cmds: List[Any], report: OptimizationReport, schema: VarSchema) -> List[Any]:
+    out = []
+    for i, cmd in enumerate(cmds):
+        where = _where(cmd, i)
+        if isinstance(cmd, SetVarCommand):
+            text, _, note = fold_expression(cmd.value, schema)
+            if note:
+                report.warnings.append(f"{where}: setVar {cmd.name} = {str(cmd.value).strip()} {note}")
+            if text is not None:
+                report.changes.append(f"{where}: folded setVar {cmd.name} = {str(cmd.value).strip()} -> {text}")
+                cmd = copy.copy(cmd)
+                cmd.value = text
+        elif isinstance(cmd, ChooseCommand):
+            cmd = _fold_choose(cmd, where, report, schema)
+        out.append(cmd)
+    return out
+
+def _fold_condition(expr, what: str, where: str, report: OptimizationReport, schema: VarSchema):
+    text, constant, note = fold_expression(expr, schema)
+    if note:
+        report.warnings.append(f"{where}: {what} '{str(expr).strip()}' {note}")
+    if constant is not None:
+        return expr, bool(constant[0])
+    if text is not None:
+        report.changes.append(f"{where}: folded {what} '{str(expr).strip()}' -> '{text}'")
+        return text, None
+    return expr, None
+
+def _fold_choose(cmd: ChooseCommand, where: str, report: OptimizationReport, schema: VarSchema) -> ChooseCommand:
+    cmd = copy.copy(cmd)
+    for attr in ("global_when", "global_enable"):
+        expr = getattr(cmd, attr)
+        if expr:
+            expr, truth = _fold_condition(expr, attr, where, report, schema)
+            if truth is True:
+                report.changes.append(f"{where}: dropped always-true {attr}")
+                expr = None
+            elif truth is False:
+                report.warnings.append(f"{where}: {attr} is never true, the choice is always skipped")
+            setattr(cmd, attr, expr)
+
+    options = []
+    for opt in cmd.options:
+        opt = copy.copy(opt)
+        if opt.when:
+            opt.when, truth = _fold_condition(opt.when, f"-when of '{opt.text}'", where, report, schema)
+            if truth is False:
+                report.changes.append(f"{where}: removed option '{opt.text}', its -when is never true")
+                continue
+            if truth is True:
+                report.changes.append(f"{where}: dropped always-true -when of '{opt.text}'")
+                opt.when = None
+        if opt.enable:
+            opt.enable, truth = _fold_condition(opt.enable, f"-enable of '{opt.text}'", where, report, schema)
+            if truth is True:
+                report.changes.append(f"{where}: dropped always-true -enable of '{opt.text}'")
+                opt.enable = None
+            elif truth is False:
+                report.warnings.append(f"{where}: option '{opt.text}' is always disabled")
+        options.append(opt)
+    cmd.options = options
+    return cmd
+
+# Control flow
+
+def _labels(cmds: List[Any]) -> dict:
+    # Later duplicates win, as in build_labels
+    return {cmd.name: i for i, cmd in enumerate(cmds) if isinstance(cmd, LabelCommand)}
+
+# First command executed after jumping to a label: labels only emit trace lines
+def _landing(cmds: List[Any], index: int) -> int:
+    while index < len(cmds) and isinstance(cmds[index], LabelCommand):
+        index += 1
+    return index
+
+# Point jumps that land on another jump straight at the final target
+def _collapse_jumps(cmds: List[Any], report: OptimizationReport) -> List[Any]:
+    labels = _labels(cmds)
+    out = []
+    for i, cmd in enumerate(cmds):
+        if isinstance(cmd, JumpCommand) and cmd.target in labels:
+            target, seen = cmd.target, {cmd.target}
+            while True:
+                landing = _landing(cmds, labels[target])
+                nxt = cmds[landing] if landing < len(cmds) else None
+                if not isinstance(nxt, JumpCommand) or nxt.target not in labels or nxt.target in seen:
+                    break
+                target = nxt.target
+                seen.add(target)
+            if target != cmd.target:
+                report.changes.append(f"{_where(cmd, i)}: jump {cmd.target} -> {target} (collapsed chain)")
+                cmd = copy.copy(cmd)
+                cmd.target = target
+        out.append(cmd)
+    return out
+
+def _referenced_labels(cmds: List[Any]) -> set:
+    referenced = set()
+    for cmd in cmds:
+        if isinstance(cmd, JumpCommand):
+            referenced.add(cmd.target)
+        elif isinstance(cmd, ChooseCommand):
+            referenced.update(opt.target for opt in cmd.options)
+    return referenced
+
+# Indices to keep: drop code after a resolved jump up to the next referenced label,
+# and labels nothing refers to
+def _live_indices(cmds: List[Any], report: OptimizationReport) -> List[int]:
+    labels = _labels(cmds)
+    referenced = _referenced_labels(cmds)
+    keep, dead_from = [], None
+    for i, cmd in enumerate(cmds):
+        is_entry = isinstance(cmd, LabelCommand) and cmd.name in referenced
+        if dead_from is not None and not is_entry:
+            continue
+        if dead_from is not None:
+            if i > dead_from:
+                report.changes.append(f"{_where(cmds[dead_from], dead_from)}: removed {i - dead_from} unreachable commands")
+            dead_from = None
+        if isinstance(cmd, LabelCommand) and not is_entry:
+            report.changes.append(f"{_where(cmd, i)}: stripped unreferenced label {cmd.name}")
+            continue
+        keep.append(i)
+        if isinstance(cmd, JumpCommand) and cmd.target in labels:
+            dead_from = i + 1
+    if dead_from is not None and dead_from < len(cmds):
+        report.changes.append(f"{_where(cmds[dead_from], dead_from)}: removed {len(cmds) - dead_from} unreachable commands")
+    return keep
+
+# Optimize a scene's command list, folding expressions against the story's variable schema
+# Returns the new list, each new command's index in the original list, and a report
+def optimize(cmds: List[Any], scene: str = "", schema: Optional[VarSchema] = None) -> Tuple[List[Any], List[int], OptimizationReport]:
+    report = OptimizationReport(scene, commands_before=len(cmds))
+    current = _collapse_jumps(_fold_commands(cmds, report, schema or VarSchema()), report)
+    source_index = list(range(len(cmds)))
+
+    # Removing code can orphan more labels, so repeat until nothing changes
+    while True:
+        keep = _live_indices(current, report)
+        if len(keep) == len(current):
+            break
+        current = [current[i] for i in keep]
+        source_index = [source_index[i] for i in keep]
+
+    report.commands_after = len(current)
+    return current, source_index, report
+
+# Print what the optimizer would change in a story
+# Usage: python -m engine.optimizer story_dir_or_bundle
+if __name__ == "__main__":
+    import sys
+    from .scenes import open_source
+
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else ".")
+    for name in source.names():
+        print(optimize(source.load(name), name)[2].format())
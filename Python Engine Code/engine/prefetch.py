@@ -0,0 +1,119 @@
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .scenes import Scene, compile_scene, scene_footprint
+
+# Parses scenes a session is likely to enter next on one background thread
+# Results wait here, unclaimed, until a scene change takes them; unclaimed scenes
+# are bounded by max_bytes, and sessions that leave a scene drop their interest,
+# which cancels queued parses and discards results nobody else wants
+class ScenePrefetcher:
+
+    def __init__(self, source, max_bytes: int = 16 * 1024 * 1024,
+                 compile: Callable[[str, Any], Scene] = compile_scene):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.compile = compile
+        self.ready_bytes = 0
+        self.counts = {"prefetched": 0, "claimed": 0, "cancelled": 0, "discarded": 0, "over budget": 0}
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scene-prefetch")
+        self._jobs: Dict[str, Future] = {}
+        self._ready: Dict[str, Tuple[Scene, int]] = {}
+        self._wanted: Dict[str, Set[int]] = {}
+        self._interests: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    # Replace an owner's interest with the given scene names, queueing new ones
+    def want(self, owner: Any, names: Iterable[str], loaded=()):
+        key = id(owner)
+        names = set(names)
+        with self._lock:
+            previous = self._interests.get(key, set())
+            for name in previous - names:
+                self._drop_interest(key, name)
+            self._interests[key] = names
+            for name in names:
+                self._wanted.setdefault(name, set()).add(key)
+                if name in loaded or name in self._jobs or name in self._ready:
+                    continue
+                if self.ready_bytes >= self.max_bytes:
+                    self.counts["over budget"] += 1
+                    continue
+                self._jobs[name] = self._executor.submit(self._load, name)
+
+    # Forget everything an owner asked for, e.g. when its session ends
+    def release(self, owner: Any):
+        key = id(owner)
+        with self._lock:
+            for name in self._interests.pop(key, ()):
+                self._drop_interest(key, name)
+
+    def _drop_interest(self, key: int, name: str):
+        owners = self._wanted.get(name)
+        if owners is None:
+            return
+        owners.discard(key)
+        if owners:
+            return
+        del self._wanted[name]
+        job = self._jobs.get(name)
+        if job is not None and job.cancel():
+            del self._jobs[name]
+            self.counts["cancelled"] += 1
+        elif name in self._ready:
+            self.ready_bytes -= self._ready.pop(name)[1]
+            self.counts["discarded"] += 1
+
+    # Worker thread: parse one scene and keep it while someone still wants it
+    def _load(self, name: str) -> Optional[Scene]:
+        try:
+            scene = self.compile(name, self.source.load(name, strict=True))
+        except Exception:
+            # The scene change itself will report the problem
+            scene = None
+        with self._lock:
+            self._jobs.pop(name, None)
+            if scene is None:
+                return None
+            size = scene_footprint(scene)
+            if name not in self._wanted:
+                self.counts["discarded"] += 1
+            elif self.ready_bytes + size > self.max_bytes:
+                self.counts["over budget"] += 1
+            else:
+                self._ready[name] = (scene, size)
+                self.ready_bytes += size
+                self.counts["prefetched"] += 1
+        return scene
+
+    # Scene ready or being parsed for a scene change; None if it was never prefetched
+    def claim(self, name: str) -> Optional[Scene]:
+        with self._lock:
+            entry = self._ready.pop(name, None)
+            if entry is not None:
+                self.ready_bytes -= entry[1]
+                self.counts["claimed"] += 1
+                return entry[0]
+            job = self._jobs.get(name)
+            # Still queued behind other scenes: parsing it right away is quicker
+            if job is not None and job.cancel():
+                del self._jobs[name]
+                job = None
+        if job is None:
+            return None
+        # Already running on the worker: waiting is cheaper than parsing twice
+        try:
+            scene = job.result()
+        except CancelledError:
+            return None
+        with self._lock:
+            entry = self._ready.pop(name, None)
+            if entry is not None:
+                self.ready_bytes -= entry[1]
+                self.counts["claimed"] += 1
+        return scene
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
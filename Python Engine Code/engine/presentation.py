@@ -0,0 +1,67 @@
+from typing import Optional
+
+from .ui import UIEvent
+
+# What the client was last told to present: background image, music and voice
+# Media handlers and loads describe the state they want; sync() emits only the
+# events needed to get the client there, so unchanged images and music are left alone
+# Events the client didn't subscribe to aren't built at all; the state is tracked all the same
+class Presentation:
+
+    def __init__(self, ui):
+        self.ui = ui
+        self.image: Optional[str] = None
+        self.bgm: Optional[str] = None
+        self.bgm_loop: bool = True
+        self.voice: Optional[str] = None
+        # Set when the client's state is unknown, so the next sync sends everything
+        self.stale = False
+
+    # Forget what the client shows, e.g. after it reconnected or reloaded its scene
+    def invalidate(self):
+        self.stale = True
+
+    # Bring the client to the given state with the fewest events
+    def sync(self, image: Optional[str], bgm: Optional[str], bgm_loop: bool = True,
+             voice: Optional[str] = None):
+        stale = self.stale
+        self.stale = False
+
+        if stale or image != self.image:
+            if image:
+                if self.ui.wants("SHOW_IMAGE"):
+                    self.ui.emit(UIEvent("SHOW_IMAGE", {"path": image}))
+            elif self.ui.wants("HIDE_IMAGE"):
+                self.ui.emit(UIEvent("HIDE_IMAGE", {}))
+            self.image = image
+
+        # A new track replaces the playing one, so no STOP_BGM in between
+        if stale or bgm != self.bgm or (bgm and bgm_loop != self.bgm_loop):
+            if bgm:
+                if self.ui.wants("PLAY_BGM"):
+                    self.ui.emit(UIEvent("PLAY_BGM", {"path": bgm, "loop": bgm_loop}))
+            elif self.ui.wants("STOP_BGM"):
+                self.ui.emit(UIEvent("STOP_BGM", {}))
+            self.bgm = bgm
+            self.bgm_loop = bgm_loop
+
+        # Voice lines are started by commands; sync only ever stops a stale one
+        if (stale or self.voice) and voice is None:
+            if self.ui.wants("STOP_VOICE"):
+                self.ui.emit(UIEvent("STOP_VOICE", {}))
+            self.voice = None
+
+    def play_voice(self, path: str):
+        if self.ui.wants("PLAY_VOICE"):
+            self.ui.emit(UIEvent("PLAY_VOICE", {"path": path}))
+        self.voice = path
+
+# Presentation of a game state, created on first use for states built outside run()
+def presentation_of(st) -> Presentation:
+    if st.presentation is None:
+        st.presentation = Presentation(st.ui)
+    return st.presentation
+
+# Bring the client in line with the media state of a game state
+def present(st):
+    presentation_of(st).sync(st.current_image, st.current_bgm, st.bgm_loop, st.current_voice)
@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from commands import LabelCommand
+
+# Stack of (scene, label, line) frames a command ran under; callers come first
+StackKey = Tuple[Tuple[str, str, str], ...]
+
+# Wraps a UiPort to measure how long the engine waits on the player
+class _TimedUi:
+
+    def __init__(self, ui):
+        self._ui = ui
+        self.waited = 0.0
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.waited += time.perf_counter() - start
+
+    def wait_next(self):
+        return self._timed(self._ui.wait_next)
+
+    def wait_choice(self, valid_ids):
+        return self._timed(self._ui.wait_choice, valid_ids)
+
+    def wait_text_input(self, prompt):
+        return self._timed(self._ui.wait_text_input, prompt)
+
+    def __getattr__(self, name):
+        return getattr(self._ui, name)
+
+# Opt-in script profiler for engine.core.run
+# Per executed command it records visits, engine time (handler wall time minus
+# waiting on the player) and dwell time (waiting on the player), keyed by the
+# scene/label/line stack it ran under, callers included
+class ScriptProfiler:
+
+    def __init__(self):
+        # stack -> [visits, engine seconds, dwell seconds]
+        self.stats: Dict[StackKey, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        self.sessions = 0
+        self.ui: Optional[_TimedUi] = None
+        self._labels: Dict[int, Tuple[List[Any], List[str]]] = {}
+        # Last call stack resolved by _callers, as (its frames, their key)
+        self._caller_frames: Tuple[Tuple[Any, ...], StackKey] = ((), ())
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # Called by run() before the first command
+    def wrap_ui(self, ui):
+        self.ui = _TimedUi(ui)
+        self.sessions += 1
+        return self.ui
+
+    # Nearest preceding label of every command, computed once per command list
+    def _label_at(self, cmds: List[Any], index: int) -> str:
+        entry = self._labels.get(id(cmds))
+        if entry is None or entry[0] is not cmds:
+            labels, current = [], "(start)"
+            for cmd in cmds:
+                if isinstance(cmd, LabelCommand):
+                    current = cmd.name
+                labels.append(current)
+            entry = self._labels[id(cmds)] = (cmds, labels)
+        return entry[1][index] if 0 <= index < len(entry[1]) else "(start)"
+
+    def _frame(self, scene: str, cmds: List[Any], index: int) -> Tuple[str, str, str]:
+        cmd = cmds[index] if 0 <= index < len(cmds) else None
+        line = getattr(cmd, "line", None)
+        where = f"line {line}" if line is not None else f"command {index}"
+        kind = type(cmd).__name__.replace("Command", "") if cmd is not None else "?"
+        return (scene, self._label_at(cmds, index), f"{where} {kind}")
+
+    # Frames of the scenes that called into the current one
+    # Call frames are immutable and the stack only changes on calls and returns, so the key
+    # is resolved (scene lookups included) once per stack rather than once per command
+    def _callers(self, st) -> StackKey:
+        stack = tuple(st.call_stack)
+        cached, key = self._caller_frames
+        if len(cached) == len(stack) and all(a is b for a, b in zip(cached, stack)):
+            return key
+        frames = []
+        for frame in stack:
+            if frame.cmds is not None:
+                cmds, index = frame.cmds, frame.index
+            else:
+                scene = st.scenes.get(frame.scene)
+                cmds, index = scene.cmds, scene.from_source(frame.index)
+            frames.append(self._frame(frame.scene, cmds, index - 1))
+        key = tuple(frames)
+        self._caller_frames = (stack, key)
+        return key
+
+    # Run one handler and charge its time to the command's stack
+    def run_command(self, handler, cmd, st):
+        index = st.index - 1
+        key = self._callers(st) + (self._frame(st.current_scene, st.cmds, index),)
+        ui = self.ui
+        waited = ui.waited if ui is not None else 0.0
+        start = time.perf_counter()
+        try:
+            handler(cmd, st)
+        finally:
+            wall = time.perf_counter() - start
+            dwell = (ui.waited - waited) if ui is not None else 0.0
+            entry = self.stats[key]
+            entry[0] += 1
+            entry[1] += wall - dwell
+            entry[2] += dwell
+
+    # Fold another profiler's numbers into this one (e.g. a finished session)
+    def merge(self, other: "ScriptProfiler"):
+        with self._lock:
+            self.sessions += other.sessions
+            for key, (visits, engine, dwell) in other.stats.items():
+                entry = self.stats[key]
+                entry[0] += visits
+                entry[1] += engine
+                entry[2] += dwell
+
+    # Totals per line, label or scene, ignoring callers
+    def totals(self, level: str = "line") -> Dict[Tuple[str, ...], List[float]]:
+        depth = {"scene": 1, "label": 2, "line": 3}[level]
+        totals: Dict[Tuple[str, ...], List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        with self._lock:
+            for key, (visits, engine, dwell) in self.stats.items():
+                entry = totals[key[-1][:depth]]
+                entry[0] += visits
+                entry[1] += engine
+                entry[2] += dwell
+        return totals
+
+    # Folded stacks ("frame;frame;frame value" per line), as read by flamegraph.pl,
+    # speedscope and inferno; metric is "engine" or "dwell" (microseconds) or "visits"
+    def folded(self, metric: str = "engine") -> str:
+        column = {"visits": 0, "engine": 1, "dwell": 2}[metric]
+        scale = 1 if metric == "visits" else 1_000_000
+        lines = []
+        with self._lock:
+            for key, entry in self.stats.items():
+                value = int(round(entry[column] * scale))
+                if value > 0:
+                    names = [part.replace(";", ",") for frame in key for part in frame]
+                    lines.append(f"{';'.join(names)} {value}")
+        return "\n".join(sorted(lines)) + "\n"
+
+    def report(self, top: int = 15) -> str:
+        out = [f"Script profile: {self.sessions} sessions"]
+        for level in ("scene", "label", "line"):
+            totals = self.totals(level)
+            rows = sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+            out.append(f"\nBy {level}:")
+            out.append(f"  {'visits':>8} {'engine ms':>10} {'dwell s':>9}  {level}")
+            for key, (visits, engine, dwell) in rows:
+                out.append(f"  {visits:>8} {engine * 1000:>10.2f} {dwell:>9.2f}  {' / '.join(key)}")
+        return "\n".join(out)
+
+    # Write <prefix>.engine.folded, <prefix>.dwell.folded, <prefix>.visits.folded and <prefix>.txt
+    def write(self, prefix: str):
+        with self._write_lock:
+            for metric in ("engine", "dwell", "visits"):
+                with open(f"{prefix}.{metric}.folded", "w", encoding="utf-8") as f:
+                    f.write(self.folded(metric))
+            with open(f"{prefix}.txt", "w", encoding="utf-8") as f:
+                f.write(self.report() + "\n")
+
+# Profile a story headlessly: engine CPU per line under random play
+# Usage: python -m engine.profiler story_dir [entry_scene] [--interactions N] [--sessions N] [--out prefix]
+if __name__ == "__main__":
+    import argparse
+    from .core import run
+    from .headless import HeadlessUiPort, SessionLimitReached
+    from .scenes import open_source, scene_cache
+
+    arg_parser = argparse.ArgumentParser(description="Profile a story with random headless play")
+    arg_parser.add_argument("story", help="Scene directory or story bundle")
+    arg_parser.add_argument("entry", nargs="?", default="main")
+    arg_parser.add_argument("--interactions", type=int, default=2000)
+    arg_parser.add_argument("--sessions", type=int, default=10)
+    arg_parser.add_argument("--out", default=None, help="Write folded stacks and the report under this prefix")
+    args = arg_parser.parse_args()
+
+    scenes = scene_cache(open_source(args.story))
+    profiler = ScriptProfiler()
+    for seed in range(args.sessions):
+        ui = HeadlessUiPort(max_interactions=args.interactions, seed=seed)
+        try:
+            run(scenes.get(args.entry).cmds, initial_scene=args.entry, ui=ui, scenes=scenes, profiler=profiler)
+        except SessionLimitReached:
+            pass
+
+    print(profiler.report())
+    if args.out:
+        profiler.write(args.out)
@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+from .autosave import AUTOSAVE_SLOT
+
+# Client messages the engine acts on; everything else is left out of recordings
+RECORDED_TYPES = frozenset({"NEXT", "CHOICE_SELECTED", "INPUT_REPLY", "SAVE_REQUEST", "LOAD_REQUEST"})
+
+# Sessions longer than this stop recording (the session itself carries on)
+MAX_RECORDED_MESSAGES = 20000
+
+# Input replies as the engine reads them (see WsUiPort.wait_text_input)
+def _as_number(value: Any) -> Optional[Any]:
+    try:
+        return int(value) if "." not in str(value) else float(value)
+    except (ValueError, TypeError):
+        return None
+
+# Message as stored in a corpus: [type, payload], keeping only what steers the engine
+# Typed text is replaced by as many x's (numbers are kept, stories branch on them) and
+# save names are dropped; nothing identifies the reader or the connection
+def anonymize(message: Any) -> Optional[List[Any]]:
+    if not isinstance(message, dict):
+        return None
+    kind = message.get("type")
+    if kind not in RECORDED_TYPES:
+        return None
+    payload = message.get("payload") or {}
+    if not isinstance(payload, dict):
+        payload = {}
+    if kind == "CHOICE_SELECTED":
+        return [kind, {"id": payload.get("id")}]
+    if kind == "INPUT_REPLY":
+        value = payload.get("value", "")
+        number = _as_number(value)
+        return [kind, {"value": number if number is not None else "x" * min(len(str(value)), 64)}]
+    if kind in ("SAVE_REQUEST", "LOAD_REQUEST"):
+        slot = payload.get("slot", 0)
+        return [kind, {"slot": slot if isinstance(slot, int) or slot == AUTOSAVE_SLOT else 0}]
+    return [kind, {}]
+
+# Inbound messages of one session, kept in memory until the session ends
+class SessionRecorder:
+
+    def __init__(self, corpus: "CorpusWriter", header: Dict[str, Any]):
+        self.corpus = corpus
+        self.header = header
+        self.messages: List[List[Any]] = []
+        self.truncated = False
+
+    # Event loop: a message the session accepted
+    def message(self, data: Dict[str, Any]):
+        if len(self.messages) >= MAX_RECORDED_MESSAGES:
+            self.truncated = True
+            return
+        recorded = anonymize(data)
+        if recorded is not None:
+            self.messages.append(recorded)
+
+    def finish(self):
+        self.corpus.write(dict(self.header, messages=self.messages, truncated=self.truncated))
+
+# Corpus of recorded sessions: one JSON line per session, appended as sessions end
+# rate is the share of sessions recorded
+class CorpusWriter:
+
+    def __init__(self, path: str, rate: float = 1.0):
+        self.path = os.path.abspath(path)
+        self.rate = rate
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    # Recorder for a new session, or None if it isn't sampled
+    # The seed lets a replay roll dice the same way every time; production rolls aren't recorded
+    def session(self, story: str, entry: str, language: Optional[str] = None,
+                subscription=None) -> Optional[SessionRecorder]:
+        if self.rate < 1.0 and random.random() >= self.rate:
+            return None
+        header = {
+            "story": story,
+            "entry": entry,
+            "language": language,
+            "events": sorted(subscription.events) if subscription is not None and subscription.events else None,
+            "verbosity": subscription.verbosity if subscription is not None else "trace",
+            "seed": random.getrandbits(32),
+        }
+        return SessionRecorder(self, header)
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.sessions += 1
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    sessions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                sessions.append(json.loads(line))
+    return sessions
@@ -1,6 +1,9 @@
 from datetime import datetime
 from typing import Dict, Any
-from .ui import UIEvent
+from .variables import SlotVars
+from .presentation import present, presentation_of
+from .autosave import AUTOSAVE_SLOT
+from .state import CallFrame
 
 class SaveSystemManager:
     
@@ -41,8 +44,14 @@ class SaveSystemManager:
         try:
             slot = payload.get("slot", 0)
             
-            # Get save from memory
-            if slot not in self.memory_saves:
+            # Get save from memory; the autosave slot resumes from the session's latest checkpoint
+            autosave = getattr(game_state, "autosave", None)
+            if slot == AUTOSAVE_SLOT and autosave is not None:
+                save_data = autosave.writer.latest(autosave.key)
+            else:
+                save_data = self.memory_saves.get(slot)
+            
+            if save_data is None:
                 return {
                     "type": "LOAD_ERROR",
                     "payload": {
@@ -50,7 +59,6 @@ class SaveSystemManager:
                     }
                 }
             
-            save_data = self.memory_saves[slot]
             save_name = save_data.get("save_name", f"Save {slot}")
             
             # Jump to save state
@@ -79,7 +87,11 @@ class SaveSystemManager:
     # Create save data structure
     def _create_save_data(self, game_state, slot: int, save_name: str) -> Dict[str, Any]:
         # Save index-1 so load will re-execute current command
+        # Stored as an index into the parsed source, so optimized scenes load the same
         save_index = max(0, game_state.index - 1)
+        scene = self._scene_of(game_state)
+        if scene is not None:
+            save_index = scene.to_source(save_index)
         
         # Capture current media state
         media_state = self._capture_media_state(game_state)
@@ -92,7 +104,7 @@ class SaveSystemManager:
                 "vars": game_state.vars.copy(),
                 "current_scene": game_state.current_scene,
                 "current_index": save_index,
-                "call_stack": [stack.copy() for stack in game_state.call_stack],
+                "call_stack": [self._save_frame(frame) for frame in game_state.call_stack],
                 "labels": game_state.labels.copy()
             },
             "media_state": media_state,
@@ -124,88 +136,84 @@ class SaveSystemManager:
         return media_state
     
     # Restore media state from save data
+    # The client may show anything by now (it may have just reconnected), so the whole
+    # saved state is sent rather than a diff against what the server last told it
     def _restore_media_state(self, game_state, save_data: Dict[str, Any]):
         media_state = save_data.get("media_state", {})
-        
-        if not media_state:
-            return
-        
-        # Restore images
         images = media_state.get("images", {})
-        if images:
-            self._restore_images(game_state, images)
-        
-        # Restore audio
         audio = media_state.get("audio", {})
-        if audio:
-            self._restore_audio(game_state, audio)
-    
-    def _restore_images(self, game_state, images: Dict[str, Any]):
-        # Hide all images first
-        game_state.ui.emit(UIEvent("HIDE_IMAGE", {}))
         
-        # Restore background image if exists
-        current_image = images.get("current")
-        if current_image:
-            game_state.ui.emit(UIEvent("SHOW_IMAGE", {
-            "path": current_image
-        }))
-            game_state.current_image = current_image
-    
-    def _restore_audio(self, game_state, audio: Dict[str, Any]):
-        # Stop current audio
-        game_state.ui.emit(UIEvent("STOP_BGM", {}))
-        game_state.ui.emit(UIEvent("STOP_VOICE", {}))
+        game_state.current_image = images.get("current")
+        game_state.current_bgm = audio.get("current_bgm")
+        game_state.bgm_loop = audio.get("bgm_loop", True)
+        # Voice lines belong to the moment they were played and aren't saved
+        game_state.current_voice = None
         
-        # Restore background music
-        current_bgm = audio.get("current_bgm")
-        if current_bgm:
-            game_state.ui.emit(UIEvent("PLAY_BGM", {
-                "path": current_bgm,
-                "loop": audio.get("bgm_loop", True)
-            }))
-            
-            # Update game state tracking
-            game_state.current_bgm = current_bgm
-            game_state.bgm_loop = audio.get("bgm_loop", True)
+        presentation_of(game_state).invalidate()
+        present(game_state)
     
     def _jump_to_save_state(self, game_state, save_data: Dict[str, Any]):
         saved_state = save_data.get("game_state", {})
         
         # Restore variables
-        game_state.vars = saved_state.get("vars", {}).copy()
+        game_state.vars = SlotVars(saved_state.get("vars", {}), game_state.vars.schema)
         
         # Restore call stack
-        game_state.call_stack = [stack.copy() for stack in saved_state.get("call_stack", [])]
+        game_state.call_stack = [self._restore_frame(game_state, stack) for stack in saved_state.get("call_stack", [])]
         
         # Check if scene switch is needed
         target_scene = saved_state.get("current_scene", "main")
         target_index = saved_state.get("current_index", 0)
-        target_labels = saved_state.get("labels", {})
+        target_labels = saved_state.get("labels")
         
         if target_scene != game_state.current_scene:
             # Switch to target scene
             self._switch_to_scene(game_state, target_scene, target_index)
         else:
-            # Jump within current scene
-            game_state.index = target_index
-            game_state.labels = target_labels
+            # Jump within current scene; saved labels may index another optimization of
+            # it, so they're rebuilt from the scene unless its commands aren't cached ones
+            scene = self._scene_of(game_state)
+            if scene is not None:
+                game_state.index = scene.from_source(target_index)
+                game_state.labels = scene.labels
+            else:
+                game_state.index = target_index
+                if target_labels is not None:
+                    game_state.labels = target_labels
+    
+    # Call frames are saved as scene name and source index, plus the command list for
+    # frames that pin their own (those saves only live in memory)
+    def _save_frame(self, frame: CallFrame) -> Dict[str, Any]:
+        saved = {"scene_name": frame.scene, "index": frame.index}
+        if frame.cmds is not None:
+            saved["cmds"] = frame.cmds
+            saved["labels"] = frame.labels
+        return saved
+    
+    # The scene of a frame is loaded up front, so a save naming a missing scene fails to load
+    def _restore_frame(self, game_state, frame: Dict[str, Any]) -> CallFrame:
+        if "cmds" in frame:
+            return CallFrame(frame["scene_name"], frame["index"], frame["cmds"], frame["labels"])
+        game_state.scenes.get(frame["scene_name"])
+        return CallFrame(frame["scene_name"], frame["index"])
+    
+    # Cached scene the state is running, if its commands came from the scene cache
+    def _scene_of(self, game_state):
+        scenes = getattr(game_state, "scenes", None)
+        if scenes is None:
+            return None
+        return scenes.scene_for(game_state.current_scene, game_state.cmds)
     
     def _switch_to_scene(self, game_state, target_scene: str, target_index: int):
         try:
-            from parser import parse_script
-            from commands import LabelCommand
-            
-            script_file = f"{target_scene}.txt"
-            with open(script_file, "r", encoding="utf-8") as f:
-                script_text = f.read()
+            scene = game_state.scenes.get(target_scene)
             
             # Update scene state
-            game_state.cmds = parse_script(script_text)
+            game_state.cmds = scene.cmds
             game_state.current_scene = target_scene
-            game_state.index = target_index
-            game_state.labels = {cmd.name: i for i, cmd in enumerate(game_state.cmds) 
-                               if isinstance(cmd, LabelCommand)}
+            game_state.index = scene.from_source(target_index)
+            game_state.labels = scene.labels
+            game_state.scenes.prefetch_for(game_state)
             
         except Exception as e:
             raise Exception(f"Scene switch failed: {e}")
@@ -0,0 +1,216 @@
+import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Scene sources resolve a scene name to its command list
+# Handlers and the save system load scenes only through a source, never by path
+
+# Loose .txt scene files in one story directory
+class DirectorySource:
+
+    def __init__(self, root: str):
+        # Resolve once so later working directory changes don't matter
+        self.root = os.path.abspath(root)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.txt")
+
+    # Raw script text of a scene
+    def read(self, name: str) -> str:
+        with open(self.path(name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    # Parsed command list of a scene
+    # Strict loads raise syntax errors naming the scene file, line and column
+    def load(self, name: str, strict: bool = False) -> List[Any]:
+        from fastparser import ScriptSyntaxError
+        from parser import parse_script
+        try:
+            return parse_script(self.read(name), strict=strict)
+        except ScriptSyntaxError as e:
+            raise e.in_file(self.path(name)) from e
+
+    # All scene names available in this source
+    def names(self) -> List[str]:
+        return sorted(entry[:-4] for entry in os.listdir(self.root) if entry.endswith(".txt"))
+
+# Parsed scene with its label index and the scenes it can switch to
+# An optimized scene also keeps, per command, its index in the parsed source;
+# saves store source indices so they stay valid whether or not scenes are optimized
+@dataclass
+class Scene:
+    name: str
+    cmds: List[Any]
+    labels: Dict[str, int]
+    targets: Tuple[str, ...] = ()
+    source_index: Optional[List[int]] = field(default=None, repr=False)
+    optimization: Any = field(default=None, repr=False)
+
+    def to_source(self, index: int) -> int:
+        if self.source_index is None:
+            return index
+        if index < len(self.source_index):
+            return self.source_index[index]
+        return (self.source_index[-1] + 1 if self.source_index else 0) + index - len(self.source_index)
+
+    # Removed commands were never executed, so resume at the next one that is left
+    def from_source(self, index: int) -> int:
+        if self.source_index is None:
+            return index
+        return bisect_left(self.source_index, index)
+
+def build_labels(cmds: List[Any]) -> Dict[str, int]:
+    from commands import LabelCommand
+    return {cmd.name: i for i, cmd in enumerate(cmds) if isinstance(cmd, LabelCommand)}
+
+# changeScene/callScene targets of a command list, in order of first appearance
+def scene_targets(cmds: List[Any]) -> Tuple[str, ...]:
+    from commands import SceneCommand
+    return tuple(dict.fromkeys(cmd.name for cmd in cmds if isinstance(cmd, SceneCommand)))
+
+# Turn a parsed command list into a runnable scene: labels indexed, variables resolved to
+# slots of the story's schema (engine.variables.VarSchema; None gives the scene one of its own)
+# With a string table, dialogue gets table ids (before the optimizer drops anything, so ids
+# follow the source) and the inline copies are dropped
+def compile_scene(name: str, cmds: List[Any], optimize: bool = False, strings=None, schema=None) -> Scene:
+    from .expressions import resolve_variables
+    from .strings import assign_string_ids, strip_strings
+    from .variables import VarSchema
+    if schema is None:
+        schema = VarSchema()
+    bound = strings is not None and assign_string_ids(name, cmds, strings)
+    source_index = report = None
+    if optimize:
+        from .optimizer import optimize as optimize_cmds
+        cmds, source_index, report = optimize_cmds(cmds, name, schema)
+    if bound:
+        strip_strings(cmds)
+    return Scene(name, resolve_variables(cmds, schema), build_labels(cmds), scene_targets(cmds), source_index, report)
+
+# Approximate memory held by a parsed scene: command objects, their fields and option lists
+def scene_footprint(scene: Scene) -> int:
+    def size(value) -> int:
+        total = sys.getsizeof(value)
+        if isinstance(value, list):
+            total += sum(size(item) for item in value)
+        elif hasattr(value, "__dict__"):
+            total += sys.getsizeof(value.__dict__)
+            total += sum(size(item) for item in value.__dict__.values() if isinstance(item, (str, list)) or hasattr(item, "__dict__"))
+        return total
+    return size(scene.cmds) + sys.getsizeof(scene.labels)
+
+# Parsed scenes shared by every session of a story
+# Command lists are never mutated at runtime, so sessions can share them
+# With max_bytes set, least recently used scenes are dropped once the cache outgrows it;
+# sessions still running an evicted scene keep its command list until they leave
+# Scenes are compiled against schema, the story's variable slots; without one the cache keeps its own
+class SceneCache:
+
+    def __init__(self, source, optimize: bool = False, max_bytes: Optional[int] = None, schema=None):
+        from .variables import VarSchema
+        self.source = source
+        self.optimize = optimize
+        self.schema = schema if schema is not None else VarSchema()
+        # Source-language string table (engine.strings.StringTable) scenes are compiled against
+        self.strings = None
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self.prefetcher = None
+        self._scenes: "OrderedDict[str, Scene]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # Parse the scenes reachable from a session's current scene in the background
+    def enable_prefetch(self, max_bytes: int = 16 * 1024 * 1024):
+        from .prefetch import ScenePrefetcher
+        self.prefetcher = ScenePrefetcher(self.source, max_bytes, self.compile)
+
+    def compile(self, name: str, cmds: List[Any]) -> Scene:
+        return compile_scene(name, cmds, self.optimize, self.strings, self.schema)
+
+    # Parsed scene, loading it through the source on first use
+    # Scenes that fail to parse raise and aren't cached, so a fixed file loads on the next try
+    def get(self, name: str) -> Scene:
+        scene = self._scenes.get(name)
+        if scene is not None and self.max_bytes:
+            with self._lock:
+                if name in self._scenes:
+                    self._scenes.move_to_end(name)
+        if scene is None:
+            if self.prefetcher is not None:
+                scene = self.prefetcher.claim(name)
+            if scene is None:
+                scene = self.compile(name, self.source.load(name, strict=True))
+            scene = self.put(scene)
+        return scene
+
+    # Cached scene whose command list is cmds, or None
+    # A scene evicted and parsed again compares equal to the list sessions still hold
+    def scene_for(self, name: str, cmds: List[Any], load: bool = True) -> Optional[Scene]:
+        scene = self._scenes.get(name)
+        if scene is None and load:
+            try:
+                scene = self.get(name)
+            except Exception:
+                return None
+        if scene is None:
+            return None
+        return scene if scene.cmds is cmds or scene.cmds == cmds else None
+
+    # A session entered a scene: prefetch where it can go next, drop what it no longer needs
+    def prefetch_for(self, st):
+        if self.prefetcher is None:
+            return
+        scene = self._scenes.get(st.current_scene)
+        targets = scene.targets if scene is not None and scene.cmds is st.cmds else scene_targets(st.cmds)
+        self.prefetcher.want(st, targets, loaded=self._scenes)
+
+    def release(self, owner: Any):
+        if self.prefetcher is not None:
+            self.prefetcher.release(owner)
+
+    def put(self, scene: Scene) -> Scene:
+        size = scene_footprint(scene) if self.max_bytes else 0
+        with self._lock:
+            cached = self._scenes.get(scene.name)
+            if cached is not None:
+                return cached
+            self._scenes[scene.name] = scene
+            self._sizes[scene.name] = size
+            self.bytes += size
+            # Never evict the scene being handed out
+            while self.max_bytes and self.bytes > self.max_bytes and len(self._scenes) > 1:
+                evicted, _ = self._scenes.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+            return scene
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._scenes
+
+    # Source passthrough, so a cache can stand in wherever a source is expected
+    def read(self, name: str) -> str:
+        return self.source.read(name)
+
+    def load(self, name: str) -> List[Any]:
+        return self.get(name).cmds
+
+    def names(self) -> List[str]:
+        return self.source.names()
+
+def scene_cache(source) -> SceneCache:
+    return source if isinstance(source, SceneCache) else SceneCache(source)
+
+# Pick a source for a story location: a bundle file or a scene directory
+def open_source(location: str):
+    if os.path.isfile(location):
+        from .bundle import StoryBundle
+        if StoryBundle.is_bundle(location):
+            return StoryBundle(location)
+        location = os.path.dirname(os.path.abspath(location))
+    return DirectorySource(location)
@@ -1,5 +1,21 @@
 from dataclasses import dataclass, field
-from typing import Any, List, Dict
+from typing import Any, List, Dict, NamedTuple, Optional
+
+from .expressions import ConditionMemo
+from .variables import SlotVars
+
+# Where a called scene returns to: the calling scene and the index after its callScene
+# The index is into the scene's parsed source (see Scene.from_source) and the scene is looked
+# up in the scene cache on return, so a frame pins no commands. Command lists that didn't come
+# from the cache (e.g. the one passed to run()) are kept in cmds/labels, indexed directly
+class CallFrame(NamedTuple):
+    scene: str
+    index: int
+    cmds: Optional[List[Any]] = None
+    labels: Optional[Dict[str, int]] = None
+
+# Scene calls nested deeper than this are refused
+MAX_CALL_DEPTH = 64
 
 # Main game state container
 @dataclass
@@ -9,20 +25,40 @@ class GameState:
     index: int = 0
 
     # Game variables and labels
-    vars: Dict[str, Any] = field(default_factory=dict)
+    vars: SlotVars = field(default_factory=SlotVars)
     labels: Dict[str, int] = field(default_factory=dict)
 
     # Scene management
     current_scene: str = "main"
-    call_stack: List[Dict[str, Any]] = field(default_factory=list)
+    call_stack: List[CallFrame] = field(default_factory=list)
+    max_call_depth: int = MAX_CALL_DEPTH
+    scenes: Any = None
 
-    # UI interface
+    # UI interface, and what the client is currently presenting
     ui: Any = None
+    presentation: Any = None
+
+    # Last evaluated choice menus (engine.expressions.choice_menu)
+    condition_memo: ConditionMemo = field(default_factory=ConditionMemo)
+
+    # Save slots (engine.save_system.SaveSystemManager) of the session's story
+    saves: Any = None
+
+    # Dialogue table of the session's language (engine.strings.StringTable); None reads the story's own
+    strings: Any = None
+
+    # Autosave policy (engine.autosave.Autosave), if the session autosaves
+    autosave: Any = None
+
+    # Choice and path counters (engine.analytics.SessionAnalytics), if collected
+    analytics: Any = None
 
     # Initialize collections
     def __post_init__(self):
         if self.vars is None:
-            self.vars = {}
+            self.vars = SlotVars()
+        elif not isinstance(self.vars, SlotVars):
+            self.vars = SlotVars(self.vars)
         if self.labels is None:
             self.labels = {}
         if self.call_stack is None:
@@ -0,0 +1,83 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from .autosave import AutosaveWriter
+from .save_system import SaveSystemManager
+from .scenes import DirectorySource, SceneCache
+from .strings import load_language_packs, strings_dir
+from .variables import VarSchema
+
+# Story names appear in URLs and directory names
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def valid_story_name(name: str) -> bool:
+    return bool(_NAME_PATTERN.match(name))
+
+# One story hosted by a server: its own scene cache, variable slots, save slots and autosave
+# directory, so sessions of different stories never see each other's scenes, variables or saves
+class Story:
+
+    def __init__(self, name: str, source, entry: str = "main", optimize: bool = False,
+                 cache_bytes: Optional[int] = None, prefetch_bytes: int = 16 * 1024 * 1024,
+                 autosave_dir: Optional[str] = None):
+        self.name = name
+        self.entry = entry
+        self.variables = VarSchema()
+        self.scenes = SceneCache(source, optimize, cache_bytes, self.variables)
+        # Dialogue tables, if the story has them: the source language and its translations
+        self.scenes.strings, self.languages = load_language_packs(strings_dir(source))
+        if prefetch_bytes:
+            self.scenes.enable_prefetch(prefetch_bytes)
+        self.saves = SaveSystemManager()
+        self.autosave = AutosaveWriter(autosave_dir, scenes=self.scenes) if autosave_dir else None
+        self.sessions = 0
+
+    def close(self):
+        if self.autosave:
+            self.autosave.close()
+        if self.scenes.prefetcher:
+            self.scenes.prefetcher.shutdown()
+        for table in self.languages.values():
+            table.close()
+        if self.scenes.strings is not None:
+            self.scenes.strings.close()
+
+# Stories served by one process, routed by handshake path (/<story>) or ?story=<story>
+# Requests naming no story go to the default one
+class StoryHost:
+
+    def __init__(self, stories: List[Story], default: Optional[str] = None):
+        self.stories: Dict[str, Story] = {story.name: story for story in stories}
+        if default is None and len(self.stories) == 1:
+            default = next(iter(self.stories))
+        if default is not None and default not in self.stories:
+            raise ValueError(f"Default story '{default}' is not hosted")
+        self.default = default
+
+    # Story for a handshake path and query; None if it names no hosted story
+    def route(self, path: str, query: str = "") -> Optional[Story]:
+        name = parse_qs(query).get("story", [None])[-1] or path.strip("/") or self.default
+        return self.stories.get(name) if name else None
+
+    def close(self):
+        for story in self.stories.values():
+            story.close()
+
+# Story sources under a root directory: every subdirectory holding the entry scene,
+# and every story bundle file (named after the file without its extension)
+def discover_stories(root: str, entry: str = "main") -> List[Tuple[str, object]]:
+    from .bundle import StoryBundle
+
+    found = []
+    for entry_name in sorted(os.listdir(root)):
+        path = os.path.join(root, entry_name)
+        name = os.path.splitext(entry_name)[0] if os.path.isfile(path) else entry_name
+        if not valid_story_name(name):
+            continue
+        if os.path.isdir(path) and os.path.isfile(os.path.join(path, f"{entry}.txt")):
+            found.append((name, DirectorySource(path)))
+        elif os.path.isfile(path) and StoryBundle.is_bundle(path):
+            found.append((name, StoryBundle(path)))
+    return found
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from commands import ChooseCommand, SayCommand
+
+# Dialogue string tables
+# Say texts, speakers and option texts are extracted at compile time; commands keep an id
+# and the text itself lives in a read-only, memory-mapped table shared by every session
+# (and by every process mapping the same file). Each language is one table with the same
+# ids, so one compiled scene serves all of them.
+#
+# Ids are per-scene ordinals: a scene's strings, in command order, get ids base..base+count-1.
+# Each scene's entry carries a checksum of its source strings, so a scene edited after the
+# table was built is noticed and keeps its inline text.
+#
+# Layout: header | entries (offset, length) | UTF-8 blob | JSON index (language, scenes)
+MAGIC = b"IFSTRTAB"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQQ")  # magic, version, string count, index offset, index length
+_ENTRY = struct.Struct("<QI")       # blob offset, byte length
+
+SOURCE_LANGUAGE = "source"
+EXTENSION = ".strtab"
+
+# (object, text attribute, id attribute) of every table string in a command list, in order
+def _text_refs(cmds: List[Any]) -> Iterator[Tuple[Any, str, str]]:
+    for cmd in cmds:
+        if isinstance(cmd, SayCommand):
+            if cmd.speaker is not None:
+                yield cmd, "speaker", "speaker_id"
+            yield cmd, "text", "text_id"
+        elif isinstance(cmd, ChooseCommand):
+            for opt in cmd.options:
+                yield opt, "text", "text_id"
+
+def scene_strings(cmds: List[Any]) -> List[str]:
+    return [str(getattr(obj, attr)) for obj, attr, _ in _text_refs(cmds)]
+
+def strings_checksum(strings: List[str]) -> str:
+    digest = hashlib.sha1()
+    for text in strings:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+# Write a table; identical strings share their bytes in the blob
+def write_table(path: str, language: str, strings: List[str], scenes: Dict[str, List[Any]],
+                source_checksum: str) -> Dict[str, Any]:
+    blob = bytearray()
+    offsets: Dict[str, Tuple[int, int]] = {}
+    located = []
+    for text in strings:
+        entry = offsets.get(text)
+        if entry is None:
+            data = text.encode("utf-8")
+            entry = offsets[text] = (len(blob), len(data))
+            blob += data
+        located.append(entry)
+
+    blob_start = _HEADER.size + len(strings) * _ENTRY.size
+    entries = b"".join(_ENTRY.pack(blob_start + offset, length) for offset, length in located)
+    index = json.dumps({"language": language, "scenes": scenes, "source": source_checksum},
+                       ensure_ascii=False).encode("utf-8")
+    index_offset = blob_start + len(blob)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(strings), index_offset, len(index)))
+        f.write(entries)
+        f.write(blob)
+        f.write(index)
+    os.replace(tmp, path)
+    return {"strings": len(strings), "unique": len(offsets), "bytes": index_offset + len(index)}
+
+# Read-only, memory-mapped string table
+class StringTable:
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, index_offset, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a string table: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported string table version {version} in {self.path}")
+
+        # Ids of strings with a {placeholder}; only those need a say template
+        entries = self._mmap[_HEADER.size:_HEADER.size + self.count * _ENTRY.size]
+        self.templated = frozenset(string_id for string_id, (offset, length) in enumerate(_ENTRY.iter_unpack(entries))
+                                   if self._mmap.find(b"{", offset, offset + length) != -1)
+
+        index = json.loads(self._mmap[index_offset:index_offset + index_length])
+        self.language: str = index["language"]
+        # Scene name -> [first id, string count, checksum of the scene's source strings]
+        self.scenes: Dict[str, List[Any]] = index["scenes"]
+        # Checksum of the whole source table; translations must carry the same one
+        self.source: str = index["source"]
+
+    def get(self, string_id: int) -> str:
+        offset, length = _ENTRY.unpack_from(self._mmap, _HEADER.size + string_id * _ENTRY.size)
+        return self._mmap[offset:offset + length].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Pickled as its path, so worker processes map the same file
+    def __reduce__(self):
+        return (StringTable, (self.path,))
+
+    def close(self):
+        self._mmap.close()
+
+# Give a parsed scene's strings their table ids; False if the table doesn't match the scene
+def assign_string_ids(name: str, cmds: List[Any], table: StringTable) -> bool:
+    entry = table.scenes.get(name)
+    if entry is None:
+        return False
+    base, count, checksum = entry
+    refs = list(_text_refs(cmds))
+    if len(refs) != count or strings_checksum([str(getattr(obj, attr)) for obj, attr, _ in refs]) != checksum:
+        return False
+    for i, (obj, _, id_attr) in enumerate(refs):
+        setattr(obj, id_attr, base + i)
+    return True
+
+# Drop inline copies of strings that have ids; the table is now the only copy
+def strip_strings(cmds: List[Any]):
+    for obj, attr, id_attr in _text_refs(cmds):
+        if getattr(obj, id_attr) is not None:
+            setattr(obj, attr, None)
+
+# Text of a say, speaker or option in a session's language (its own table, else the story's)
+# Strings without an id were never extracted and are still inline
+def localized(obj: Any, attr: str, st) -> Any:
+    string_id = getattr(obj, f"{attr}_id")
+    if string_id is None:
+        return getattr(obj, attr)
+    return (st.strings or st.scenes.strings).get(string_id)
+
+# Tables of a story: a source table plus one table per translation
+# <story_dir>/strings for scene directories, <bundle>.strings next to a bundle file
+def strings_dir(source) -> Optional[str]:
+    root = getattr(source, "root", None)
+    if root:
+        return os.path.join(root, "strings")
+    path = getattr(source, "path", None)
+    return f"{os.path.splitext(path)[0]}.strings" if isinstance(path, str) else None
+
+# Language -> table, for every table in a directory that matches its source table
+def load_language_packs(directory: str) -> Tuple[Optional[StringTable], Dict[str, StringTable]]:
+    if not directory or not os.path.isfile(os.path.join(directory, SOURCE_LANGUAGE + EXTENSION)):
+        return None, {}
+    source = StringTable(os.path.join(directory, SOURCE_LANGUAGE + EXTENSION))
+    languages = {}
+    for entry in sorted(os.listdir(directory)):
+        if not entry.endswith(EXTENSION) or entry == SOURCE_LANGUAGE + EXTENSION:
+            continue
+        table = StringTable(os.path.join(directory, entry))
+        if table.source != source.source:
+            print(f"Skipping {entry}: built for a different version of the story's strings")
+            table.close()
+            continue
+        languages[table.language] = table
+    return source, languages
+
+# Extract every scene's strings into <directory>/source.strtab
+# Scenes load strictly: a scene that doesn't parse would otherwise get no strings
+def build_source_table(story_source, directory: str) -> Dict[str, Any]:
+    strings: List[str] = []
+    scenes: Dict[str, List[Any]] = {}
+    for name in story_source.names():
+        texts = scene_strings(story_source.load(name, strict=True))
+        scenes[name] = [len(strings), len(texts), strings_checksum(texts)]
+        strings.extend(texts)
+    os.makedirs(directory, exist_ok=True)
+    checksum = strings_checksum(strings)
+    return write_table(os.path.join(directory, SOURCE_LANGUAGE + EXTENSION), SOURCE_LANGUAGE,
+                       strings, scenes, checksum)
+
+# Strings to translate, keyed by id, with the scene they appear in for context
+def export_strings(source: StringTable) -> Dict[str, Dict[str, str]]:
+    exported = {}
+    for name, (base, count, _) in sorted(source.scenes.items(), key=lambda kv: kv[1][0]):
+        for string_id in range(base, base + count):
+            exported[str(string_id)] = {"scene": name, "text": source.get(string_id)}
+    return exported
+
+# Build <directory>/<language>.strtab from translations keyed by id; untranslated ids keep the source text
+def build_language_table(source: StringTable, language: str, translations: Dict[str, Any],
+                         directory: str) -> Dict[str, Any]:
+    strings = []
+    for string_id in range(len(source)):
+        translated = translations.get(str(string_id))
+        if isinstance(translated, dict):
+            translated = translated.get("text")
+        strings.append(translated if translated else source.get(string_id))
+    return write_table(os.path.join(directory, f"{language}{EXTENSION}"), language, strings,
+                       source.scenes, source.source)
+
+# Build, export and translate string tables of a story
+# Usage: python -m engine.strings build story_dir
+#        python -m engine.strings export story_dir out.json
+#        python -m engine.strings translate story_dir language translations.json
+if __name__ == "__main__":
+    import sys
+    from .scenes import open_source
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "export", "translate"):
+        print("Usage: python -m engine.strings build|export|translate story_dir ...")
+        sys.exit(1)
+    command, story = sys.argv[1], sys.argv[2]
+    story_source = open_source(story)
+    directory = strings_dir(story_source)
+
+    if command == "build":
+        from fastparser import ScriptSyntaxError
+        try:
+            print(build_source_table(story_source, directory))
+        except ScriptSyntaxError as e:
+            print(f"Source table not built: {e}")
+            sys.exit(1)
+    else:
+        source_table, _ = load_language_packs(directory)
+        if source_table is None:
+            print(f"No source table in {directory}; run build first")
+            sys.exit(1)
+        if command == "export":
+            with open(sys.argv[3], "w", encoding="utf-8") as f:
+                json.dump(export_strings(source_table), f, ensure_ascii=False, indent=2)
+        else:
+            with open(sys.argv[4], "r", encoding="utf-8") as f:
+                print(build_language_table(source_table, sys.argv[3], json.load(f), directory))
@@ -1,15 +1,74 @@
-from dataclasses import dataclass
-from typing import Any, Dict, List
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs
 
 # UI event container
+# droppable marks trace lines a port may shed when the client falls behind
 @dataclass
 class UIEvent:
     type: str
     payload: Dict[str, Any]
+    droppable: bool = field(default=False, compare=False, repr=False)
+
+# Verbosity of informational events, least to most chatty:
+# content (errors, notices the reader sees), debug (scene transitions), trace (every label)
+VERBOSITY = {"content": 0, "debug": 1, "trace": 2}
+
+# Events the wait protocol depends on; delivered whatever a client subscribes to
+# INFO carries errors and notices such as "[No available choices]"; verbosity still sheds its debug and trace lines
+REQUIRED_EVENTS = frozenset({
+    "INIT", "SHOW_TEXT", "CHOICES", "INPUT_REQUEST", "END", "ERROR", "INFO",
+    "SAVE_SUCCESS", "SAVE_ERROR", "LOAD_SUCCESS", "LOAD_ERROR",
+})
+
+# Events a client may leave out of its subscription
+OPTIONAL_EVENTS = frozenset({
+    "SHOW_IMAGE", "HIDE_IMAGE", "PLAY_BGM", "STOP_BGM", "PLAY_VOICE", "STOP_VOICE", "PLAY_SFX",
+    "SCENE_CHANGED", "ROLL_RESULT",
+})
+
+# Which events a client wants: optional event types and a verbosity level
+# The default subscribes to everything, as clients had before subscriptions existed
+class Subscription:
+
+    def __init__(self, events: Optional[Iterable[str]] = None, verbosity: str = "trace"):
+        if verbosity not in VERBOSITY:
+            raise ValueError(f"Unknown verbosity '{verbosity}', expected one of {', '.join(VERBOSITY)}")
+        if events is not None:
+            events = frozenset(events)
+            # A misspelt name would otherwise silently subscribe to nothing
+            unknown = events - OPTIONAL_EVENTS - REQUIRED_EVENTS
+            if unknown:
+                raise ValueError(f"Unknown events {', '.join(sorted(unknown))}")
+        self.events = None if events is None else events | REQUIRED_EVENTS
+        self.verbosity = verbosity
+        self.level = VERBOSITY[verbosity]
+
+    def wants(self, event_type: str, level: str = "content") -> bool:
+        return VERBOSITY[level] <= self.level and (self.events is None or event_type in self.events)
+
+    # Parse handshake query parameters: ?events=SHOW_IMAGE,PLAY_BGM&verbosity=content
+    @classmethod
+    def from_query(cls, query: str) -> "Subscription":
+        params = parse_qs(query)
+        events = None
+        if "events" in params:
+            events = {name.strip().upper() for value in params["events"] for name in value.split(",") if name.strip()}
+        verbosity = params.get("verbosity", ["trace"])[-1].lower()
+        return cls(events, verbosity)
+
+# Raised by a port's choice wait when a load request replaces the state being chosen in
+class LoadInterruptException(Exception):
+    pass
 
 # Abstract UI port interface
 class UiPort:
     
+    # Whether the client wants an event; checked before building optional events
+    # so unwanted ones cost nothing
+    def wants(self, event_type: str, level: str = "content") -> bool:
+        return True
+
     # Send event to UI client
     def emit(self, ev: UIEvent) -> None:
         raise NotImplementedError
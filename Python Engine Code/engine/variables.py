@@ -0,0 +1,138 @@
+import itertools
+import threading
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Marks an unset slot
+MISSING = object()
+
+# Process-wide store ids, so results cached against one store never match another
+_store_ids = itertools.count(1)
+
+# Variable name -> slot index table of one story, shared by its sessions
+# Slots are assigned at scene compile time and only ever appended
+class VarSchema:
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.names: List[str] = []
+        # Compiled expressions and say texts (engine.expressions) by source text, and say
+        # texts of string tables by (table, string id); they address this schema's slots,
+        # so each schema compiles its own
+        self.exprs: Dict[str, Any] = {}
+        self.texts: Dict[str, Any] = {}
+        self.table_texts: Dict[Tuple[Any, int], Any] = {}
+        self._lock = threading.Lock()
+
+    def slot(self, name: str) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            with self._lock:
+                slot = self.slots.get(name)
+                if slot is None:
+                    slot = len(self.names)
+                    self.names.append(name)
+                    self.slots[name] = slot
+        return slot
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+# List-backed variable store: one value and one version per slot
+# version counts the store's changes and each slot keeps the count of its last change,
+# in a machine-word array so a version costs 8 bytes rather than an int object; with
+# store_id, results cached against a store can tell what changed since
+# Handlers and compiled expressions address slots directly; the mapping API
+# (by name) serves saves, string interpolation fallbacks and debugging
+# A store made without a schema gets one of its own
+class SlotVars(MutableMapping):
+    __slots__ = ("schema", "values", "versions", "store_id", "version")
+
+    def __init__(self, data=None, schema: Optional[VarSchema] = None):
+        self.schema = schema if schema is not None else VarSchema()
+        self.values: List[Any] = []
+        self.versions = array("Q")
+        self.store_id = next(_store_ids)
+        self.version = 0
+        if data:
+            self.update(data)
+
+    # Slot access
+    def get_slot(self, slot: int, default: Any = None) -> Any:
+        values = self.values
+        if slot < len(values):
+            value = values[slot]
+            if value is not MISSING:
+                return value
+        return default
+
+    # Stamps a slot only when its value actually changes
+    def set_slot(self, slot: int, value: Any):
+        values = self.values
+        if slot >= len(values):
+            grow = slot + 1 - len(values)
+            values.extend([MISSING] * grow)
+            self.versions.extend([0] * grow)
+        else:
+            old = values[slot]
+            if old is value or (type(old) is type(value) and old == value):
+                return
+        values[slot] = value
+        self.version += 1
+        self.versions[slot] = self.version
+
+    # Whether any of the given slots changed after this store's version since
+    def changed_since(self, slots: Sequence[int], since: int) -> bool:
+        if self.version == since:
+            return False
+        versions = self.versions
+        count = len(versions)
+        for slot in slots:
+            if slot < count and versions[slot] > since:
+                return True
+        return False
+
+    # Mapping API by name
+    def __getitem__(self, name: str) -> Any:
+        slot = self.schema.slots.get(name)
+        value = MISSING if slot is None else self.get_slot(slot, MISSING)
+        if value is MISSING:
+            raise KeyError(name)
+        return value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        slot = self.schema.slots.get(name)
+        return default if slot is None else self.get_slot(slot, default)
+
+    def __setitem__(self, name: str, value: Any):
+        self.set_slot(self.schema.slot(name), value)
+
+    def __delitem__(self, name: str):
+        slot = self.schema.slots.get(name)
+        if slot is None or self.get_slot(slot, MISSING) is MISSING:
+            raise KeyError(name)
+        self.values[slot] = MISSING
+        self.version += 1
+        self.versions[slot] = self.version
+
+    def __contains__(self, name: object) -> bool:
+        slot = self.schema.slots.get(name)
+        return slot is not None and self.get_slot(slot, MISSING) is not MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.schema.names
+        return (names[slot] for slot, value in enumerate(self.values) if value is not MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for value in self.values if value is not MISSING)
+
+    # Plain dict snapshot, used by saves
+    def copy(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"SlotVars({self.copy()!r})"
+
+    def __reduce__(self):
+        return (SlotVars, (self.copy(),))
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from commands import ChooseCommand, JumpCommand, SceneCommand
+from .scenes import Scene, SceneCache
+
+# Raised when strict warm-up finds broken scenes
+class SceneValidationError(Exception):
+    pass
+
+# Outcome of a warm-up run
+@dataclass
+class WarmupReport:
+    scenes: List[str] = field(default_factory=list)
+    problems: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def format(self) -> str:
+        lines = [f"Warm-up: {len(self.scenes)} scenes parsed in {self.elapsed:.2f}s, "
+                 f"{len(self.problems)} problems"]
+        lines.extend(f"  {problem}" for problem in self.problems)
+        return "\n".join(lines)
+
+# Worker process: parse one scene strictly
+def _compile_scene(source, name: str, fast: bool):
+    if fast:
+        from parser import use_fast_parser
+        use_fast_parser()
+    try:
+        return name, source.load(name, strict=True), None
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+# Check that every jump and choice target resolves to a label in its scene
+# strings: the story's string table, for option texts moved out of the scene
+def link_scene(scene: Scene, strings=None) -> List[str]:
+    problems = []
+    for i, cmd in enumerate(scene.cmds):
+        if isinstance(cmd, JumpCommand) and cmd.target not in scene.labels:
+            problems.append(f"{scene.name}: jump to unknown label '{cmd.target}' (command {i})")
+        elif isinstance(cmd, ChooseCommand):
+            for opt in cmd.options:
+                if opt.target not in scene.labels:
+                    text = opt.text if opt.text_id is None else strings.get(opt.text_id)
+                    problems.append(f"{scene.name}: choice '{text}' targets unknown label "
+                                    f"'{opt.target}' (command {i})")
+    return problems
+
+# Parse every scene reachable from the entry scene through changeScene/callScene
+# across a process pool, then link them and fill the scene cache
+def warm_up(cache: SceneCache, entry: str, workers: Optional[int] = None) -> WarmupReport:
+    from parser import fast_parser_enabled
+
+    start = time.perf_counter()
+    report = WarmupReport()
+    parsed = {}
+    fast = fast_parser_enabled()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        seen = {entry}
+        pending = {pool.submit(_compile_scene, cache.source, entry, fast)}
+
+        # Breadth-first over scene references; each parsed scene may queue more work
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, cmds, error = future.result()
+                if error:
+                    report.problems.append(f"{name}: {error}")
+                    continue
+
+                parsed[name] = cmds
+                for cmd in cmds:
+                    if isinstance(cmd, SceneCommand) and cmd.name not in seen:
+                        seen.add(cmd.name)
+                        pending.add(pool.submit(_compile_scene, cache.source, cmd.name, fast))
+
+    for name in sorted(parsed):
+        scene = cache.put(cache.compile(name, parsed[name]))
+        report.problems.extend(link_scene(scene, cache.strings))
+
+    report.scenes = sorted(parsed)
+    report.elapsed = time.perf_counter() - start
+    return report
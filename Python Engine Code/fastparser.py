@@ -0,0 +1,281 @@
+import re
+from typing import Any, Dict, List, Optional
+from commands import (
+    SayCommand, SetVarCommand, RollCommand, ChooseCommand,
+    Option, LabelCommand, JumpCommand, InputCommand, SceneCommand, ReturnCommand,
+    ShowImageCommand, HideImageCommand, PlayBGMCommand, StopBGMCommand,
+    PlaySFXCommand, PlayVoiceCommand, StopVoiceCommand
+)
+
+# Hand-written single-pass parser for the story DSL
+# Builds the same command objects as the Lark grammar in grammar.lark,
+# including its lexing quirks (see parser_diff.py for the differential check)
+
+# Syntax error with source position
+class ScriptSyntaxError(Exception):
+
+    def __init__(self, message: str, line: int, column: int, path: Optional[str] = None):
+        super().__init__(f"{path + ': ' if path else ''}{message} at line {line}, column {column}")
+        self.message = message
+        self.line = line
+        self.column = column
+        self.path = path
+
+    # The same error, naming the file it was found in
+    def in_file(self, path: str) -> "ScriptSyntaxError":
+        return ScriptSyntaxError(self.message, self.line, self.column, path)
+
+# Terminals, mirroring grammar.lark
+_WS = re.compile(r'[ \t\f\r\n]*')
+_KEYWORD = re.compile(r'[A-Za-z]+')
+_IDENT = re.compile(r'[_A-Za-z][_A-Za-z0-9]*')
+_STRING = re.compile(r'".*?(?<!\\)(\\\\)*?"')
+# Same language as /(\\.|[^-;]|-(?!to=))+/, with plain runs matched in one step
+_EXPR = re.compile(r'(?:[^-;\\]+|\\.|\\|-(?!to=))+')
+_PARAM_VALUE = re.compile(r'[^\n|;]+')
+
+# Parameter value conversion shared with DSLTransformer.param
+def convert_param_value(value_str: str) -> Any:
+    if value_str.lower() == "true":
+        return True
+    elif value_str.lower() == "false":
+        return False
+    try:
+        return float(value_str) if '.' in value_str else int(value_str)
+    except ValueError:
+        return value_str
+
+class _Parser:
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    # Error helpers
+    def _error(self, message: str, pos: int = None):
+        if pos is None:
+            pos = self.pos
+        line = self.text.count("\n", 0, pos) + 1
+        column = pos - self.text.rfind("\n", 0, pos)
+        raise ScriptSyntaxError(message, line, column)
+
+    def _found(self) -> str:
+        if self.pos >= len(self.text):
+            return "end of script"
+        return repr(self.text[self.pos])
+
+    # Token readers; each skips leading whitespace like %ignore WS
+    def _skip_ws(self):
+        self.pos = _WS.match(self.text, self.pos).end()
+
+    def _expect(self, char: str):
+        self._skip_ws()
+        if not self.text.startswith(char, self.pos):
+            self._error(f"Expected '{char}' but found {self._found()}")
+        self.pos += 1
+
+    def _ident(self) -> str:
+        self._skip_ws()
+        m = _IDENT.match(self.text, self.pos)
+        if not m:
+            self._error(f"Expected identifier but found {self._found()}")
+        self.pos = m.end()
+        return m.group()
+
+    def _string(self) -> str:
+        self._skip_ws()
+        m = _STRING.match(self.text, self.pos)
+        if not m:
+            self._error(f"Expected string but found {self._found()}")
+        self.pos = m.end()
+        return m.group().strip('"')
+
+    # EXPR is tried before whitespace, so it keeps leading spaces
+    def _expr(self) -> str:
+        m = _EXPR.match(self.text, self.pos)
+        if not m:
+            self._error(f"Expected expression but found {self._found()}")
+        self.pos = m.end()
+        return m.group()
+
+    # -key=value / -flag parameters
+    def _params(self) -> Dict[str, Any]:
+        params = {}
+        text = self.text
+        while True:
+            self._skip_ws()
+            if not text.startswith("-", self.pos):
+                return params
+            self.pos += 1
+            key = self._ident()
+            self._skip_ws()
+            if text.startswith("=", self.pos):
+                self.pos += 1
+                self._skip_ws()
+                m = _PARAM_VALUE.match(text, self.pos)
+                if not m:
+                    self._error(f"Expected parameter value but found {self._found()}")
+                self.pos = m.end()
+                params[key] = convert_param_value(m.group().strip())
+            else:
+                params[key] = True
+
+    # Statements
+    def parse(self) -> List[Any]:
+        cmds = []
+        text = self.text
+        end = len(text)
+        # Line numbers are counted incrementally, one statement at a time
+        line, counted = 1, 0
+        while True:
+            self._skip_ws()
+            if self.pos >= end:
+                return cmds
+            line += text.count("\n", counted, self.pos)
+            counted = self.pos
+            m = _KEYWORD.match(text, self.pos)
+            statement = _STATEMENTS.get(m.group()) if m else None
+            if statement is None:
+                self._error(f"Unknown command {text[self.pos:m.end()]!r}" if m else
+                            f"Expected command but found {self._found()}")
+            self.pos = m.end()
+            cmd = statement(self)
+            cmd.line = line
+            cmds.append(cmd)
+
+    def say_stmt(self):
+        self._expect(":")
+        text = self._string()
+        params = self._params()
+        self._expect(";")
+        return SayCommand(text=text, speaker=params.get("speaker"))
+
+    def setvar_stmt(self):
+        self._expect(":")
+        name = self._ident()
+        self._expect("=")
+        expr = self._expr()
+        self._expect(";")
+        return SetVarCommand(name=name, value=expr)
+
+    def input_stmt(self):
+        self._expect(":")
+        var_name = self._ident()
+        params = self._params()
+        self._expect(";")
+        return InputCommand(var_name=var_name, prompt=params.get("prompt", ""))
+
+    def roll_stmt(self):
+        self._expect(":")
+        expr = self._expr()
+        to_var = None
+        self._skip_ws()
+        if self.text.startswith("-to", self.pos):
+            self.pos += 3
+            self._expect("=")
+            to_var = self._ident()
+        self._expect(";")
+        return RollCommand(expr=expr, to=to_var)
+
+    def choose_stmt(self):
+        self._expect(":")
+        options = []
+        while True:
+            text = self._string()
+            self._expect(":")
+            target = self._ident()
+            # Trailing parameters always bind to the last option, as in the LALR grammar
+            params = self._params()
+            options.append(Option(
+                text=text,
+                target=target,
+                when=params.get("when"),
+                enable=params.get("enable")
+            ))
+            self._skip_ws()
+            if not self.text.startswith("|", self.pos):
+                break
+            self.pos += 1
+        self._expect(";")
+        return ChooseCommand(options=options)
+
+    def label_stmt(self):
+        return LabelCommand(name=self._name_stmt())
+
+    def jump_stmt(self):
+        return JumpCommand(target=self._name_stmt())
+
+    def changescene_stmt(self):
+        return SceneCommand(name=self._name_stmt(), mode="change")
+
+    def callscene_stmt(self):
+        return SceneCommand(name=self._name_stmt(), mode="call")
+
+    def return_stmt(self):
+        self._expect(";")
+        return ReturnCommand()
+
+    def _name_stmt(self) -> str:
+        self._expect(":")
+        name = self._ident()
+        self._expect(";")
+        return name
+
+    # Media commands
+    def showimage_stmt(self):
+        return ShowImageCommand(path=self._path_stmt())
+
+    def hideimage_stmt(self):
+        self._expect(";")
+        return HideImageCommand()
+
+    def playbgm_stmt(self):
+        self._expect(":")
+        path = self._string()
+        params = self._params()
+        self._expect(";")
+        return PlayBGMCommand(path=path, loop=params.get("loop", True))
+
+    def stopbgm_stmt(self):
+        self._expect(";")
+        return StopBGMCommand()
+
+    def playsfx_stmt(self):
+        return PlaySFXCommand(path=self._path_stmt())
+
+    def playvoice_stmt(self):
+        return PlayVoiceCommand(path=self._path_stmt())
+
+    def stopvoice_stmt(self):
+        self._expect(";")
+        return StopVoiceCommand()
+
+    def _path_stmt(self) -> str:
+        self._expect(":")
+        path = self._string()
+        self._expect(";")
+        return path
+
+_STATEMENTS = {
+    "say":         _Parser.say_stmt,
+    "setVar":      _Parser.setvar_stmt,
+    "input":       _Parser.input_stmt,
+    "roll":        _Parser.roll_stmt,
+    "choose":      _Parser.choose_stmt,
+    "label":       _Parser.label_stmt,
+    "jump":        _Parser.jump_stmt,
+    "changeScene": _Parser.changescene_stmt,
+    "callScene":   _Parser.callscene_stmt,
+    "return":      _Parser.return_stmt,
+    "showImage":   _Parser.showimage_stmt,
+    "hideImage":   _Parser.hideimage_stmt,
+    "playBGM":     _Parser.playbgm_stmt,
+    "stopBGM":     _Parser.stopbgm_stmt,
+    "playSFX":     _Parser.playsfx_stmt,
+    "playVoice":   _Parser.playvoice_stmt,
+    "stopVoice":   _Parser.stopvoice_stmt,
+}
+
+# Parse script text into command objects, raising ScriptSyntaxError on bad input
+def parse_script_fast(script_text: str) -> List[Any]:
+    return _Parser(script_text).parse()
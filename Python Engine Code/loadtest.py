@@ -0,0 +1,348 @@
+"""
+Load-testing harness for server.py
+Opens many concurrent WebSocket readers against one server and plays the story the
+way people do: NEXT after some think time, a random enabled choice, a reply to every
+input prompt, and a save or load every few interactions. Readers start a new session
+when the story ends. Reports throughput, per-message latency percentiles, and the
+server's memory and thread count over the run.
+
+Usage: python loadtest.py [options] [url]
+       python loadtest.py --spawn ../GameEngine/main.txt --clients 500 --duration 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import websockets
+
+from protocol import get_codec
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# What reading a process's memory and threads can raise, with or without psutil
+_SAMPLE_ERRORS = (OSError, ValueError) if psutil is None else (OSError, ValueError, psutil.Error)
+
+# Events after which the engine waits for a NEXT
+_WAITS_FOR_NEXT = {"SHOW_TEXT"}
+_NO_CHOICES_TEXT = "[No available choices]"
+
+# Replies that complete a save or load
+_SAVE_RESULTS = {"SAVE_SUCCESS", "SAVE_ERROR"}
+_LOAD_RESULTS = {"LOAD_SUCCESS", "LOAD_ERROR"}
+
+# Shared counters and latency samples for all readers
+class Stats:
+
+    def __init__(self):
+        self.counts = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.loop_lag: List[float] = []
+
+    def latency(self, kind: str, seconds: float):
+        self.latencies[kind].append(seconds)
+
+    # How late this process wakes up from short sleeps; a large lag means the
+    # load generator, not the server, is limiting the numbers
+    async def watch_loop_lag(self, interval: float, stop: asyncio.Event):
+        while not stop.is_set():
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.monotonic() - start - interval)
+
+# Server process memory and thread count, sampled while the test runs
+class ServerMonitor:
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.samples = []
+
+    def sample(self):
+        try:
+            if psutil is not None:
+                proc = psutil.Process(self.pid)
+                self.samples.append((proc.memory_info().rss, proc.num_threads()))
+                return
+            rss = threads = 0
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss = int(line.split()[1]) * 1024
+                    elif line.startswith("Threads:"):
+                        threads = int(line.split()[1])
+            self.samples.append((rss, threads))
+        except _SAMPLE_ERRORS:
+            pass
+
+    async def watch(self, interval: float, stop: asyncio.Event):
+        while not stop.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        self.sample()
+
+    def format(self) -> str:
+        if not self.samples:
+            return f"Server pid {self.pid}: no samples (process not readable)"
+        rss = [s[0] / (1024 * 1024) for s in self.samples]
+        threads = [s[1] for s in self.samples]
+        return (f"Server pid {self.pid}: RSS start {rss[0]:.1f} MB, peak {max(rss):.1f} MB, "
+                f"end {rss[-1]:.1f} MB; threads start {threads[0]}, peak {max(threads)}, end {threads[-1]}")
+
+# One simulated reader: plays sessions back to back until the deadline
+class Reader:
+
+    def __init__(self, number: int, args, stats: Stats, deadline: float):
+        self.number = number
+        self.args = args
+        self.stats = stats
+        self.deadline = deadline
+        self.rng = random.Random(args.seed + number)
+        self.codec = get_codec(args.encoding)
+        # Saves are kept per server, so give each reader its own slot
+        self.save_slot = 1000 + number
+        self.saved = False
+
+    async def run(self):
+        while time.monotonic() < self.deadline:
+            try:
+                await self.session()
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                self.stats.counts["errors"] += 1
+                self.stats.counts[f"error: {type(e).__name__}"] += 1
+                await asyncio.sleep(1.0)
+
+    def think(self) -> float:
+        low, high = self.args.think
+        return self.rng.uniform(low, high)
+
+    async def send(self, ws, message_type: str, payload=None):
+        message = {"type": message_type}
+        if payload is not None:
+            message["payload"] = payload
+        await ws.send(self.codec.encode(message))
+        self.stats.counts["messages sent"] += 1
+
+    async def session(self):
+        subprotocols = [self.codec.subprotocol] if self.args.encoding != "json" else None
+        open_timeout = max(0.1, min(self.args.timeout, self.deadline - time.monotonic()))
+        async with websockets.connect(self.args.url, subprotocols=subprotocols,
+                                      compression=None if self.args.no_deflate else "deflate",
+                                      open_timeout=open_timeout, close_timeout=1, max_size=None) as ws:
+            self.stats.counts["sessions started"] += 1
+            self.saved = False
+            interactions = 0
+            # The reply the engine is waiting for, and the message whose answer we're timing
+            pending = None
+            awaiting = None
+
+            while time.monotonic() < self.deadline:
+                remaining = self.deadline - time.monotonic()
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), min(self.args.timeout, remaining))
+                except asyncio.TimeoutError:
+                    if remaining > self.args.timeout:
+                        self.stats.counts["stalled sessions"] += 1
+                    return
+                now = time.monotonic()
+                event = self.codec.decode(raw)
+                etype = event.get("type")
+                payload = event.get("payload") or {}
+                self.stats.counts["events received"] += 1
+
+                # Latency: first event after NEXT/CHOICE/INPUT, the result event for SAVE/LOAD
+                if awaiting is not None:
+                    kind, sent_at = awaiting
+                    if kind == "SAVE_REQUEST":
+                        done = etype in _SAVE_RESULTS
+                    elif kind == "LOAD_REQUEST":
+                        done = etype in _LOAD_RESULTS
+                    else:
+                        done = True
+                    if done:
+                        self.stats.latency(kind, now - sent_at)
+                        awaiting = None
+
+                if etype == "END":
+                    self.stats.counts["sessions finished"] += 1
+                    return
+                elif etype in _WAITS_FOR_NEXT or (etype == "INFO" and payload.get("text") == _NO_CHOICES_TEXT):
+                    pending = ("NEXT", None)
+                elif etype == "CHOICES":
+                    enabled = [item["id"] for item in payload.get("items", []) if item.get("enabled")]
+                    if not enabled:
+                        self.stats.counts["stuck on disabled choices"] += 1
+                        return
+                    pending = ("CHOICE_SELECTED", {"id": self.rng.choice(enabled)})
+                elif etype == "INPUT_REQUEST":
+                    pending = ("INPUT_REPLY", {"value": self.rng.choice(self.args.inputs)})
+                elif etype in _SAVE_RESULTS:
+                    self.saved = self.saved or etype == "SAVE_SUCCESS"
+                elif etype in _LOAD_RESULTS:
+                    # A load during a choice interrupts the wait and the engine moves on by itself
+                    if pending is not None and pending[0] == "CHOICE_SELECTED":
+                        pending = None
+                elif etype == "ERROR":
+                    self.stats.counts["engine errors"] += 1
+
+                if pending is None or awaiting is not None:
+                    continue
+
+                # Save and load ride along while the engine waits for the reader
+                interactions += 1
+                every = self.args.save_every
+                if every and interactions % every == 0:
+                    if self.saved and self.rng.random() < self.args.load_ratio:
+                        await self.send(ws, "LOAD_REQUEST", {"slot": self.save_slot})
+                        awaiting = ("LOAD_REQUEST", time.monotonic())
+                    else:
+                        await self.send(ws, "SAVE_REQUEST", {"slot": self.save_slot, "name": f"Reader {self.number}"})
+                        awaiting = ("SAVE_REQUEST", time.monotonic())
+                    continue
+
+                await asyncio.sleep(self.think())
+                message_type, reply = pending
+                pending = None
+                await self.send(ws, message_type, reply)
+                awaiting = (message_type, time.monotonic())
+
+# Nearest-rank percentile of sorted samples
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[rank]
+
+def format_report(args, stats: Stats, elapsed: float, monitor: Optional[ServerMonitor]) -> str:
+    counts = stats.counts
+    lines = [f"{args.clients} readers for {elapsed:.1f}s against {args.url} ({args.encoding})"]
+    lines.append(f"Sessions: {counts['sessions started']} started, {counts['sessions finished']} finished, "
+                 f"{counts['stalled sessions']} stalled, {counts['errors']} connection errors")
+    lines.append(f"Throughput: {counts['messages sent'] / elapsed:.1f} messages/s sent, "
+                 f"{counts['events received'] / elapsed:.1f} events/s received")
+
+    lines.append(f"{'Latency (ms)':<18}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    every = []
+    for kind in sorted(stats.latencies):
+        samples = sorted(stats.latencies[kind])
+        every.extend(samples)
+        lines.append(_latency_row(kind, samples))
+    lines.append(_latency_row("all", sorted(every)))
+
+    if stats.loop_lag:
+        lag = sorted(stats.loop_lag)
+        lines.append(f"Load generator loop lag: p50 {percentile(lag, 50) * 1000:.1f} ms, "
+                     f"max {lag[-1] * 1000:.1f} ms")
+
+    extra = {k: v for k, v in counts.items() if k.startswith("error:") or k in ("engine errors", "stuck on disabled choices")}
+    for key, value in sorted(extra.items()):
+        lines.append(f"  {key}: {value}")
+    if monitor is not None:
+        lines.append(monitor.format())
+    return "\n".join(lines)
+
+def _latency_row(kind: str, samples: List[float]) -> str:
+    ms = [percentile(samples, p) * 1000 for p in (50, 95, 99)]
+    top = samples[-1] * 1000 if samples else 0.0
+    return f"  {kind:<16}{len(samples):>8}{ms[0]:>9.1f}{ms[1]:>9.1f}{ms[2]:>9.1f}{top:>9.1f}"
+
+# Start server.py for the given entry scene and wait until it accepts connections
+async def spawn_server(args) -> subprocess.Popen:
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, "server.py"), os.path.abspath(args.spawn),
+               "--port", str(args.port)] + args.server_args.split()
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", args.port)
+            writer.close()
+            return proc
+        except OSError:
+            await asyncio.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not start listening")
+
+async def main_async(args):
+    server = None
+    if args.spawn:
+        args.url = f"ws://127.0.0.1:{args.port}"
+        server = await spawn_server(args)
+    if args.verbosity:
+        args.url += ("&" if "?" in args.url else "?") + f"verbosity={args.verbosity}"
+    pid = server.pid if server else args.server_pid
+    monitor = ServerMonitor(pid) if pid else None
+
+    stats = Stats()
+    stop = asyncio.Event()
+    watcher = asyncio.ensure_future(monitor.watch(1.0, stop)) if monitor else None
+    lag_watcher = asyncio.ensure_future(stats.watch_loop_lag(0.1, stop))
+
+    start = time.monotonic()
+    deadline = start + args.ramp + args.duration
+    tasks = []
+    try:
+        # Spread connection attempts over the ramp-up period
+        for number in range(args.clients):
+            tasks.append(asyncio.ensure_future(Reader(number, args, stats, deadline).run()))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.clients)
+        await asyncio.gather(*tasks)
+    finally:
+        stop.set()
+        await lag_watcher
+        if watcher:
+            await watcher
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(format_report(args, stats, time.monotonic() - start, monitor))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Concurrent reader load test for server.py")
+    arg_parser.add_argument("url", nargs="?", default="ws://127.0.0.1:8765")
+    arg_parser.add_argument("--clients", type=int, default=100, help="Concurrent readers")
+    arg_parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run after ramp-up")
+    arg_parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which readers connect")
+    arg_parser.add_argument("--think", type=lambda s: tuple(float(x) for x in s.split(",")), default=(0.2, 1.5),
+                            help="Think time range in seconds before each reply, as min,max")
+    arg_parser.add_argument("--save-every", type=int, default=25,
+                            help="Save or load every N interactions (0 disables)")
+    arg_parser.add_argument("--load-ratio", type=float, default=0.3,
+                            help="Share of save/load turns that load the reader's last save")
+    arg_parser.add_argument("--inputs", type=lambda s: s.split(","), default=["Reader", "42"],
+                            help="Comma-separated replies for input prompts")
+    arg_parser.add_argument("--encoding", default="json", help="Wire encoding (json, msgpack, cbor)")
+    arg_parser.add_argument("--no-deflate", action="store_true", help="Don't offer permessage-deflate")
+    arg_parser.add_argument("--verbosity", default=None, choices=["content", "debug", "trace"],
+                            help="Subscribe readers to this verbosity level in the handshake")
+    arg_parser.add_argument("--timeout", type=float, default=30.0,
+                            help="Seconds without an event before a session counts as stalled")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--server-pid", type=int, default=None,
+                            help="PID of an already running server to sample RSS and threads from")
+    arg_parser.add_argument("--spawn", default=None, help="Start server.py for this entry scene")
+    arg_parser.add_argument("--port", type=int, default=8765, help="Port for a spawned server")
+    arg_parser.add_argument("--server-args", default="", help="Extra arguments for a spawned server")
+    args = arg_parser.parse_args()
+
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("\nLoad test interrupted")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
-from lark import Lark, Transformer, Token
+import os
+from lark import Lark, Transformer, Token, v_args
+from lark.exceptions import UnexpectedInput
 from commands import (
     SayCommand, SetVarCommand, RollCommand, ChooseCommand, 
     Option, LabelCommand, JumpCommand, InputCommand, SceneCommand, ReturnCommand,
     ShowImageCommand, HideImageCommand, PlayBGMCommand, StopBGMCommand, 
     PlaySFXCommand, PlayVoiceCommand, StopVoiceCommand
 )
+from fastparser import ScriptSyntaxError, convert_param_value, parse_script_fast
 
-# Load DSL grammar
-_parser = Lark.open('grammar.lark', parser='lalr', propagate_positions=True)
+# Load DSL grammar, next to this file whatever the working directory
+_parser = Lark.open('grammar.lark', rel_to=__file__, parser='lalr', propagate_positions=True)
+
+# Optional hand-written parser (fastparser.py), also enabled with IF_PARSER=fast
+_use_fast_parser = os.environ.get("IF_PARSER", "").lower() == "fast"
+
+def use_fast_parser(enabled: bool = True):
+    global _use_fast_parser
+    _use_fast_parser = enabled
+
+def fast_parser_enabled() -> bool:
+    return _use_fast_parser
 
 # Transform AST to Command objects
 class DSLTransformer(Transformer):
@@ -15,8 +28,12 @@ class DSLTransformer(Transformer):
     def value(self, items):
         return items[0]
     
-    def statement(self, items):
-        return items[0]
+    # Statements carry the source line the parser propagates
+    @v_args(meta=True)
+    def statement(self, meta, items):
+        cmd = items[0]
+        cmd.line = getattr(meta, "line", None)
+        return cmd
 
     def STRING(self, tok: Token):
         return tok.value.strip('"')
@@ -132,29 +149,27 @@ class DSLTransformer(Transformer):
             value_str = str(items[1]).strip()
             
             # Type conversion
-            if value_str.lower() == "true":
-                value = True
-            elif value_str.lower() == "false":
-                value = False
-            else:
-                try:
-                    value = float(value_str) if '.' in value_str else int(value_str)
-                except ValueError:
-                    value = value_str
-            
-            return (key, value)
+            return (key, convert_param_value(value_str))
         else:
             return (key, True)
 
     start = list
 
 # Parse script text and return list of command objects
-def parse_script(script_text: str):
+# strict=True raises ScriptSyntaxError (with line/column) instead of returning []
+def parse_script(script_text: str, strict: bool = False):
     try:
+        if _use_fast_parser:
+            return parse_script_fast(script_text)
         tree = _parser.parse(script_text)
         commands = DSLTransformer().transform(tree)
         return commands
     except Exception as e:
+        if strict:
+            if isinstance(e, UnexpectedInput):
+                message = str(e).splitlines()[0].split(" at line ")[0]
+                raise ScriptSyntaxError(message, e.line, e.column) from e
+            raise
         print(f"Parse error: {e}")
         import traceback
         traceback.print_exc()
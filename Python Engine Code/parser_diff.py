@@ -0,0 +1,162 @@
+"""
+Differential check of the hand-written parser (fastparser.py) against the Lark grammar.
+Runs every .txt scene in the given directories plus a seeded fuzz corpus through both
+parsers: outputs must match command for command, and inputs rejected by one must be
+rejected by the other. Also reports parse time per parser.
+
+Usage: python parser_diff.py [scene_dir ...] [--cases N] [--seed S]
+"""
+import argparse
+import dataclasses
+import os
+import random
+import sys
+import time
+
+from parser import _parser, DSLTransformer
+from fastparser import ScriptSyntaxError, parse_script_fast
+
+# Building blocks for generated scripts
+_IDENTS = ["gold", "hp", "main_menu", "_tmp", "x1", "say", "to", "label", "A"]
+_TEXTS = ["Hello", "Gold: {gold}", "It's fine", "", " padded ", "say \\\"hi\\\"", "中文台词", "a|b;c-d"]
+_EXPRS = ["100", "{gold}+10", " {gold} - 5 ", "{hp}*2", "1d6", "1d20+{strength} ", "-3",
+          "\"txt\"", "a\\;b", "{a}-{b}", "1 -to =x", "{x}\n+1"]
+_VALUES = ["\"Narrator\"", "true", "FALSE", "3", "2.5", "{gold}>=10", "{a} and {b}", "1_0",
+           " spaced ", "\"x\" -extra=1", "-1"]
+_WS = ["", " ", "  ", "\n", "\t", "\r\n", " \n  "]
+_NOISE = [";", ":", "|", "-", "=", "\"", "\\", " ", "\n", "{", "}", "a", "1", "-to=", "say"]
+
+def _ws(rng: random.Random) -> str:
+    return rng.choice(_WS)
+
+def _params(rng: random.Random, keys) -> str:
+    out = ""
+    for _ in range(rng.randint(0, 2)):
+        key = rng.choice(keys)
+        if rng.random() < 0.2:
+            out += f"{_ws(rng)}-{_ws(rng)}{key}"
+        else:
+            out += f"{_ws(rng)}-{key}{_ws(rng)}={_ws(rng)}{rng.choice(_VALUES)}"
+    return out
+
+def _statement(rng: random.Random) -> str:
+    w = lambda: _ws(rng)
+    s = lambda: '"' + rng.choice(_TEXTS) + '"'
+    ident = lambda: rng.choice(_IDENTS)
+    kind = rng.randint(0, 16)
+    if kind == 0:
+        return f"say{w()}:{w()}{s()}{_params(rng, ['speaker', 'voice'])}{w()};"
+    if kind == 1:
+        return f"setVar:{w()}{ident()}{w()}={rng.choice(_EXPRS)};"
+    if kind == 2:
+        return f"input:{ident()}{_params(rng, ['prompt'])};"
+    if kind == 3:
+        to = f"{w()}-to{w()}={w()}{ident()}" if rng.random() < 0.6 else ""
+        return f"roll:{rng.choice(_EXPRS)}{to}{w()};"
+    if kind == 4:
+        options = [f"{w()}{s()}{w()}:{w()}{ident()}{_params(rng, ['when', 'enable'])}"
+                   for _ in range(rng.randint(1, 3))]
+        return f"choose:{'|'.join(options)}{w()};"
+    if kind in (5, 6, 7, 8):
+        keyword = ["label", "jump", "changeScene", "callScene"][kind - 5]
+        return f"{keyword}{w()}:{w()}{ident()}{w()};"
+    if kind == 9:
+        return f"return{w()};"
+    if kind in (10, 11, 12):
+        keyword = ["showImage", "playSFX", "playVoice"][kind - 10]
+        return f"{keyword}:{w()}{s()}{w()};"
+    if kind == 13:
+        return f"playBGM:{s()}{_params(rng, ['loop'])};"
+    return rng.choice(["hideImage", "stopBGM", "stopVoice"]) + f"{w()};"
+
+# Random script, sometimes with a few characters corrupted to exercise error paths
+def generate_case(rng: random.Random) -> str:
+    text = _ws(rng).join(_statement(rng) for _ in range(rng.randint(0, 6)))
+    if text and rng.random() < 0.35:
+        chars = list(text)
+        for _ in range(rng.randint(1, 3)):
+            pos = rng.randrange(len(chars) + 1)
+            op = rng.random()
+            if op < 0.4 and pos < len(chars):
+                del chars[pos]
+            elif op < 0.7 and pos < len(chars):
+                chars[pos] = rng.choice(_NOISE)
+            else:
+                chars.insert(pos, rng.choice(_NOISE))
+        text = "".join(chars)
+    return text
+
+# Comparable form of a command list; Lark tokens compare as their plain string value
+def normalize(value):
+    if dataclasses.is_dataclass(value):
+        return (type(value).__name__,) + tuple(
+            (f.name, normalize(getattr(value, f.name))) for f in dataclasses.fields(value))
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, str):
+        return ("str", str(value))
+    return (type(value).__name__, value)
+
+def _parse_lark(text: str):
+    return DSLTransformer().transform(_parser.parse(text))
+
+# Returns (outcome, elapsed) where outcome is the normalized commands or "error"
+def _run(parse, text: str):
+    start = time.perf_counter()
+    try:
+        result = normalize(parse(text))
+    except Exception:
+        result = "error"
+    return result, time.perf_counter() - start
+
+def compare(text: str, timings: dict):
+    lark_result, lark_time = _run(_parse_lark, text)
+    fast_result, fast_time = _run(parse_script_fast, text)
+    timings["lark"] += lark_time
+    timings["fast"] += fast_time
+    return lark_result == fast_result, lark_result, fast_result
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Differential test: fastparser vs Lark grammar")
+    arg_parser.add_argument("dirs", nargs="*", help="Directories of .txt scenes to include")
+    arg_parser.add_argument("--cases", type=int, default=5000, help="Number of generated cases")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    corpus = []
+    for directory in args.dirs:
+        for entry in sorted(os.listdir(directory)):
+            if entry.endswith(".txt"):
+                with open(os.path.join(directory, entry), "r", encoding="utf-8") as f:
+                    corpus.append((entry, f.read()))
+
+    rng = random.Random(args.seed)
+    corpus.extend((f"case {i}", generate_case(rng)) for i in range(args.cases))
+
+    timings = {"lark": 0.0, "fast": 0.0}
+    failures = 0
+    rejected = 0
+    for name, text in corpus:
+        same, lark_result, fast_result = compare(text, timings)
+        if same and lark_result == "error":
+            rejected += 1
+        if not same:
+            failures += 1
+            if failures <= 10:
+                print(f"MISMATCH in {name}: {text!r}")
+                print(f"  lark: {lark_result}")
+                print(f"  fast: {fast_result}")
+
+    # Syntax errors from the fast parser must carry a position
+    for name, text in corpus:
+        try:
+            parse_script_fast(text)
+        except ScriptSyntaxError as e:
+            assert e.line >= 1 and e.column >= 1, (name, e)
+
+    print(f"{len(corpus)} scripts, {rejected} rejected by both, {failures} mismatches")
+    print(f"lark {timings['lark'] * 1000:.1f} ms, fast {timings['fast'] * 1000:.1f} ms")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
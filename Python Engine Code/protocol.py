@@ -0,0 +1,168 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+# Optional binary encoders
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Small integer codes for message types on binary encodings
+# Codes are part of the wire format: append new types, never renumber
+MESSAGE_CODES = {
+    # Engine -> client
+    "INIT": 1,
+    "SHOW_TEXT": 2,
+    "CHOICES": 3,
+    "INFO": 4,
+    "INPUT_REQUEST": 5,
+    "ROLL_RESULT": 6,
+    "SCENE_CHANGED": 7,
+    "SHOW_IMAGE": 8,
+    "HIDE_IMAGE": 9,
+    "PLAY_BGM": 10,
+    "STOP_BGM": 11,
+    "PLAY_SFX": 12,
+    "PLAY_VOICE": 13,
+    "STOP_VOICE": 14,
+    "END": 15,
+    "ERROR": 16,
+    "SAVE_SUCCESS": 17,
+    "SAVE_ERROR": 18,
+    "LOAD_SUCCESS": 19,
+    "LOAD_ERROR": 20,
+    # Client -> engine
+    "NEXT": 32,
+    "CHOICE_SELECTED": 33,
+    "INPUT_REPLY": 34,
+    "SAVE_REQUEST": 35,
+    "LOAD_REQUEST": 36,
+}
+
+MESSAGE_TYPES = {code: name for name, code in MESSAGE_CODES.items()}
+
+# A well-formed frame that isn't a message the engine can take, e.g. a payload that isn't an object
+class MalformedMessage(ValueError):
+    pass
+
+# Messages reach the engine with an object payload; a missing or null one reads as empty
+def _checked(data: Any) -> Any:
+    if isinstance(data, dict):
+        payload = data.get("payload")
+        if payload is None:
+            if "payload" in data:
+                data["payload"] = {}
+        elif not isinstance(payload, dict):
+            raise MalformedMessage("Message payload is not an object")
+    return data
+
+# JSON text frames, used by the Godot client
+class JsonCodec:
+    name = "json"
+    subprotocol = "if.json"
+    decode_errors = (ValueError,)
+
+    def encode(self, data: Dict[str, Any]) -> str:
+        return json.dumps(data, ensure_ascii=False)
+
+    def decode(self, message) -> Dict[str, Any]:
+        return _checked(json.loads(message))
+
+# Base for binary frames: messages travel as [code, payload]
+# Types without a code are sent by name, so new events never need a protocol bump
+class BinaryCodec:
+    name = ""
+    subprotocol = ""
+    decode_errors = (ValueError, TypeError)
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        msg_type = data.get("type", "")
+        payload = data.get("payload")
+        return self._dumps([MESSAGE_CODES.get(msg_type, msg_type), payload or {}])
+
+    def decode(self, message) -> Dict[str, Any]:
+        # Text frames are always JSON, whatever was negotiated
+        if isinstance(message, str):
+            return _checked(json.loads(message))
+
+        obj = self._loads(message)
+        if isinstance(obj, dict):
+            return _checked(obj)
+        if isinstance(obj, (list, tuple)) and obj:
+            msg_type = obj[0]
+            if isinstance(msg_type, int):
+                msg_type = MESSAGE_TYPES.get(msg_type, "")
+            payload = obj[1] if len(obj) > 1 and obj[1] is not None else {}
+            return _checked({"type": msg_type, "payload": payload})
+        raise ValueError("Malformed binary message")
+
+    def _dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def _loads(self, message: bytes) -> Any:
+        raise NotImplementedError
+
+class MsgpackCodec(BinaryCodec):
+    name = "msgpack"
+    subprotocol = "if.msgpack"
+
+    def _dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def _loads(self, message: bytes) -> Any:
+        return msgpack.unpackb(message, raw=False, strict_map_key=False)
+
+class CborCodec(BinaryCodec):
+    name = "cbor"
+    subprotocol = "if.cbor"
+    # cbor2's decode errors aren't ValueErrors
+    decode_errors = BinaryCodec.decode_errors + ((cbor2.CBORDecodeError,) if cbor2 is not None else ())
+
+    def _dumps(self, obj: Any) -> bytes:
+        return cbor2.dumps(obj)
+
+    def _loads(self, message: bytes) -> Any:
+        return cbor2.loads(message)
+
+JSON = JsonCodec()
+
+# Codecs usable in this environment, in server preference order
+def available_codecs() -> List[Any]:
+    codecs = []
+    if msgpack is not None:
+        codecs.append(MsgpackCodec())
+    if cbor2 is not None:
+        codecs.append(CborCodec())
+    codecs.append(JSON)
+    return codecs
+
+def get_codec(name: str):
+    for codec in available_codecs():
+        if codec.name == name:
+            return codec
+    raise ValueError(f"Unknown or unavailable wire encoding: {name}")
+
+# Codec for a negotiated WebSocket subprotocol; no subprotocol means JSON
+def codec_for_subprotocol(subprotocol: Optional[str]):
+    for codec in available_codecs():
+        if codec.subprotocol == subprotocol:
+            return codec
+    return JSON
+
+# Subprotocol selection for websockets.serve
+# Clients that offer nothing (the Godot client) stay on plain JSON instead of being rejected
+def make_subprotocol_selector(encodings: Sequence[str]):
+    supported = [get_codec(name).subprotocol for name in encodings]
+
+    def select_subprotocol(connection, offered):
+        for subprotocol in supported:
+            if subprotocol in offered:
+                return subprotocol
+        return None
+
+    return select_subprotocol
@@ -0,0 +1,196 @@
+"""
+Recorded-session replay benchmark
+Plays sessions recorded by server.py --record back through engine.core.run with an
+in-memory port, as fast as the engine goes: no network, no think time. Dice are seeded
+per session, so every replay of a corpus runs the same commands. Reports wall time and
+steps per second per session and where engine time goes by handler.
+
+With --json the results are written out; --baseline compares against such a file and
+exits non-zero when steps per second dropped by more than --tolerance percent, so a
+corpus of real traffic can gate changes to the parser, handlers or save system.
+
+Usage: python replay.py corpus.jsonl story_dir_or_bundle [--rounds 3] [--optimize]
+       python replay.py corpus.jsonl --stories stories_root [--json new.json] [--baseline old.json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Optional
+
+from engine.core import run
+from engine.headless import ReplayUiPort, SessionLimitReached
+from engine.recording import load_corpus
+from engine.save_system import SaveSystemManager
+from engine.scenes import open_source
+from engine.stories import Story, discover_stories
+from engine.ui import Subscription
+
+# Times every command by handler through run()'s profiler hook
+# Save and load requests run inside waits; their time is billed to "save/load" instead
+class HandlerTimer:
+
+    def __init__(self):
+        self.steps = 0
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.ui = None
+
+    def wrap_ui(self, ui):
+        self.ui = ui
+        return ui
+
+    def run_command(self, handler, cmd, st):
+        ui = self.ui
+        save_load = ui.save_load_seconds
+        start = time.perf_counter()
+        try:
+            handler(cmd, st)
+        finally:
+            elapsed = time.perf_counter() - start
+            inside = ui.save_load_seconds - save_load
+            name = handler.__name__
+            self.steps += 1
+            self.calls[name] += 1
+            self.seconds[name] += elapsed - inside
+            if inside:
+                self.seconds["save/load"] += inside
+
+# Replay one recorded session; returns wall time and the port it ran against
+def replay(story: Story, record: Dict[str, Any], timer: HandlerTimer):
+    random.seed(record["seed"])
+    ui = ReplayUiPort(record["messages"], Subscription(record.get("events"), record.get("verbosity", "trace")))
+    entry = record.get("entry") or story.entry
+    # Each session gets its own save slots, so replays don't depend on the order they run in
+    saves = SaveSystemManager()
+    strings = story.languages.get(record.get("language"))
+    gc.collect()
+    start = time.perf_counter()
+    try:
+        run(story.scenes.get(entry).cmds, initial_scene=entry, ui=ui, scenes=story.scenes,
+            profiler=timer, saves=saves, strings=strings)
+    except SessionLimitReached:
+        pass
+    return time.perf_counter() - start, ui
+
+def _open_stories(args) -> Dict[Optional[str], Story]:
+    if args.stories:
+        return {name: Story(name, source, args.entry, args.optimize, prefetch_bytes=0)
+                for name, source in discover_stories(args.stories, args.entry)}
+    name = os.path.splitext(os.path.basename(os.path.abspath(args.story)))[0]
+    # One story given: every recorded session plays it, whatever story it was recorded on
+    return {None: Story(name, open_source(args.story), args.entry, args.optimize, prefetch_bytes=0)}
+
+def _compare(result: Dict[str, Any], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old, new = baseline["total"], result["total"]
+    change = (new["steps_per_sec"] / old["steps_per_sec"] - 1) * 100
+    print(f"\nAgainst {baseline_path}: {old['steps_per_sec']:,.0f} -> {new['steps_per_sec']:,.0f} steps/s ({change:+.1f}%)")
+    if new["steps"] != old["steps"]:
+        print(f"  note: {old['steps']} -> {new['steps']} steps; the engine no longer plays the corpus the same way")
+    if change < -tolerance:
+        print(f"  FAIL: slower by more than {tolerance:g}%")
+        return False
+    return True
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Replay recorded sessions against the engine")
+    arg_parser.add_argument("corpus", help="Corpus written by server.py --record")
+    arg_parser.add_argument("story", nargs="?", help="Scene directory or bundle every session plays")
+    arg_parser.add_argument("--stories", default=None, help="Play each session on its recorded story under this root")
+    arg_parser.add_argument("--entry", default="main")
+    arg_parser.add_argument("--optimize", action="store_true", help="Replay with the scene optimizer on")
+    arg_parser.add_argument("--rounds", type=int, default=3, help="Timed rounds; each session keeps its fastest")
+    arg_parser.add_argument("--limit", type=int, default=None, help="Replay only the first N sessions")
+    arg_parser.add_argument("--top", type=int, default=10, help="Slowest sessions listed")
+    arg_parser.add_argument("--json", default=None, help="Write results to this file")
+    arg_parser.add_argument("--baseline", default=None, help="Results of an earlier run to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=10.0,
+                            help="Allowed steps/s drop against the baseline, in percent")
+    args = arg_parser.parse_args()
+    if not args.story and not args.stories:
+        arg_parser.error("give a story or --stories")
+
+    stories = _open_stories(args)
+    records = load_corpus(args.corpus)[:args.limit]
+    sessions = []
+    for index, record in enumerate(records):
+        story = stories.get(None) or stories.get(record.get("story"))
+        if story is None:
+            print(f"Session {index}: story '{record.get('story')}' not found, skipped")
+            continue
+        sessions.append((index, story, record))
+    if not sessions:
+        print("Nothing to replay")
+        raise SystemExit(1)
+
+    # Untimed pass: parses every scene the sessions reach
+    for _, story, record in sessions:
+        replay(story, record, HandlerTimer())
+
+    rounds = max(1, args.rounds)
+    best: Dict[int, float] = {}
+    steps: Dict[int, int] = {}
+    unused: Dict[int, int] = {}
+    handler_calls, handler_seconds = Counter(), defaultdict(float)
+    for _ in range(rounds):
+        for index, story, record in sessions:
+            timer = HandlerTimer()
+            elapsed, ui = replay(story, record, timer)
+            best[index] = min(best.get(index, elapsed), elapsed)
+            if steps.setdefault(index, timer.steps) != timer.steps:
+                print(f"Session {index}: {steps[index]} steps, then {timer.steps}; replay isn't deterministic")
+            unused[index] = sum(ui.counters.values())
+            handler_calls.update(timer.calls)
+            for name, seconds in timer.seconds.items():
+                handler_seconds[name] += seconds
+
+    total_seconds = sum(best.values())
+    total_steps = sum(steps.values())
+    messages = sum(len(record["messages"]) for _, _, record in sessions)
+    result = {
+        "sessions": [{"index": index, "story": story.name, "messages": len(record["messages"]),
+                      "steps": steps[index], "seconds": best[index]} for index, story, record in sessions],
+        "total": {"sessions": len(sessions), "steps": total_steps, "seconds": total_seconds,
+                  "steps_per_sec": total_steps / total_seconds if total_seconds else 0.0},
+        "handlers": {name: {"calls": handler_calls[name] // rounds, "seconds": seconds / rounds}
+                     for name, seconds in handler_seconds.items()},
+    }
+
+    print(f"Replayed {len(sessions)} sessions, {messages:,} messages (best of {rounds} rounds)")
+    print(f"  total {total_seconds * 1000:>10.1f} ms {total_steps:>10,} steps "
+          f"{result['total']['steps_per_sec']:>12,.0f} steps/s")
+
+    shown = sorted(result["sessions"], key=lambda s: -s["seconds"])[:args.top]
+    print(f"\nSlowest {len(shown)} of {len(sessions)} sessions:")
+    print(f"  {'session':>7} {'story':<12} {'messages':>8} {'steps':>9} {'wall ms':>9} {'steps/s':>11} {'unused':>6}")
+    for s in shown:
+        rate = s["steps"] / s["seconds"] if s["seconds"] else 0.0
+        print(f"  {s['index']:>7} {s['story'][:12]:<12} {s['messages']:>8} {s['steps']:>9} "
+              f"{s['seconds'] * 1000:>9.2f} {rate:>11,.0f} {unused[s['index']]:>6}")
+    skipped = sum(unused.values())
+    if skipped:
+        print(f"  {skipped} recorded messages went unused (choices not offered, messages nothing waited for)")
+
+    engine_seconds = sum(h["seconds"] for h in result["handlers"].values()) or 1.0
+    print("\nEngine time by handler (per round):")
+    for name, h in sorted(result["handlers"].items(), key=lambda kv: -kv[1]["seconds"]):
+        calls = h["calls"]
+        per_call = f"{h['seconds'] / calls * 1e6:>8.1f} us" if calls else f"{'-':>11}"
+        print(f"  {name:<22} {calls:>9} calls {h['seconds'] * 1000:>9.1f} ms "
+              f"{h['seconds'] / engine_seconds * 100:>5.1f}% {per_call}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    ok = _compare(result, args.baseline, args.tolerance) if args.baseline else True
+    for story in stories.values():
+        story.close()
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,85 @@
 import asyncio
-import json
+import http
+import ipaddress
+import os
+import sys
 import websockets
 import threading
 import queue
-from typing import Any, Dict, List
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import parse_qs, urlsplit
 
-from engine.ui import UiPort, UIEvent
+from engine.ui import LoadInterruptException, Subscription, UiPort, UIEvent
+from engine.autosave import Autosave, new_session_key, valid_session_key
 from engine.core import run
-from parser import parse_script
+from engine.scenes import DirectorySource, open_source
+from engine.state import MAX_CALL_DEPTH
+from engine.stories import Story, StoryHost, discover_stories, valid_story_name
+from engine.memory import MemoryAccountant
+from engine.presentation import presentation_of
+from engine.analytics import ChoiceAnalytics
+from engine.recording import CorpusWriter
+from engine.profiler import ScriptProfiler
+from engine.warmup import SceneValidationError, warm_up
+from parser import use_fast_parser
+from protocol import MalformedMessage, available_codecs, codec_for_subprotocol, make_subprotocol_selector
 
-#Interrupt exception for breaking choice waits
-class LoadInterruptException(Exception):
+# Ends the engine thread once its client is gone
+# A BaseException so the engine's per-command error handling doesn't swallow it
+class SessionClosed(BaseException):
     pass
 
+# Per-session queue bounds, so a slow or hostile client can't grow memory without limit
+SEND_QUEUE_LIMIT = 256
+RECV_QUEUE_LIMIT = 64
+
 # WebSocket UI port for Godot client
 class WsUiPort(UiPort):
     
-    def __init__(self):
-        self.send_queue = queue.Queue()
-        self.recv_queue = queue.Queue()
+    def __init__(self, send_limit: int = SEND_QUEUE_LIMIT, recv_limit: int = RECV_QUEUE_LIMIT,
+                 subscription: Optional[Subscription] = None, resumed: bool = False):
+        self.subscription = subscription or Subscription()
+        # Set when the client reconnected with a session key and may still show an earlier session's media
+        self.resumed = resumed
+        self.send_queue = queue.Queue(maxsize=send_limit)
+        self.recv_queue = queue.Queue(maxsize=recv_limit)
         self.running = True
         self.game_state = None
+        # Droppable events are shed once the outbound backlog reaches this mark
+        self.shed_level = max(1, send_limit // 2)
+        # Drops and backpressure waits, by kind
+        self.counters = Counter()
+
+    # Event subscription declared by the client in the handshake
+    def wants(self, event_type: str, level: str = "content") -> bool:
+        return self.subscription.wants(event_type, level)
 
     # Send event
+    # A full queue blocks the engine here until the client catches up or disconnects
     def emit(self, ev: UIEvent) -> None:
-        self.send_queue.put({"type": ev.type, "payload": ev.payload})
+        # Catches optional events not already filtered where they're built (e.g. media)
+        if not self.subscription.wants(ev.type):
+            return
+        if ev.droppable and self.send_queue.qsize() >= self.shed_level:
+            self.counters[f"dropped {ev.type}"] += 1
+            return
+        
+        message = {"type": ev.type, "payload": ev.payload}
+        try:
+            self.send_queue.put_nowait(message)
+            return
+        except queue.Full:
+            self.counters["emit waits"] += 1
+        
+        while True:
+            if not self.running:
+                raise SessionClosed()
+            try:
+                self.send_queue.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                continue
 
     # "Wait for NEXT message
     def wait_next(self) -> None:
@@ -79,7 +134,7 @@ class WsUiPort(UiPort):
                     continue
             except queue.Empty:
                 continue
-        return {}
+        raise SessionClosed()
 
     # Synchronously handle save/load messages
     def _handle_save_load_message_sync(self, data: Dict[str, Any]):
@@ -103,26 +158,170 @@ class WsUiPort(UiPort):
             self.emit(UIEvent("SAVE_ERROR", {"message": f"Save/load error: {str(e)}"}))
 
     # Set current game state for save system
+    # A resumed client's screen is unknown, so its first media sync sends everything
     def set_game_state(self, game_state):
         self.game_state = game_state
+        if self.resumed:
+            presentation_of(game_state).invalidate()
 
 # WebSocket server 
-async def serve(script_path: str, scene_name: str, host="127.0.0.1", port=8765):
+async def serve(script_path: str, scene_name: str, host="127.0.0.1", port=8765,
+                encodings: Optional[Sequence[str]] = None, compression: Optional[str] = "deflate",
+                source=None, warmup: str = "off", warmup_workers: Optional[int] = None,
+                profile: Optional[str] = None, prefetch_bytes: int = 16 * 1024 * 1024,
+                send_limit: int = SEND_QUEUE_LIMIT, recv_limit: int = RECV_QUEUE_LIMIT,
+                max_message: int = 64 * 1024, optimize: bool = False,
+                autosave_dir: Optional[str] = None, autosave_choices: bool = True,
+                autosave_interval: Optional[float] = None,
+                stories: Optional[Dict[str, Any]] = None, default_story: Optional[str] = None,
+                cache_bytes: Optional[int] = None, memory_interval: Optional[float] = None,
+                analytics_path: Optional[str] = None, analytics_interval: float = 60.0,
+                max_call_depth: int = MAX_CALL_DEPTH, record_path: Optional[str] = None,
+                record_rate: float = 1.0):
+    
+    # Each story gets its own scene cache (capped at cache_bytes), save slots and autosave directory
+    # Without a story map the server hosts one story: the entry script's directory, or the given source
+    if stories is None:
+        if source is None:
+            source = DirectorySource(os.path.dirname(os.path.abspath(script_path)))
+        name = os.path.basename(os.path.dirname(os.path.abspath(script_path)))
+        host_stories = [Story(name if valid_story_name(name) else "default", source, scene_name, optimize,
+                              cache_bytes, prefetch_bytes, autosave_dir)]
+    else:
+        host_stories = [Story(name, story_source, scene_name, optimize, cache_bytes, prefetch_bytes,
+                              os.path.join(autosave_dir, name) if autosave_dir else None)
+                        for name, story_source in stories.items()]
+    story_host = StoryHost(host_stories, default_story)
+    # (story, session key) of every connected session; a key can't be used twice at once
+    live_sessions = set()
+    multi = len(host_stories) > 1
+    
+    # Parse and validate every reachable scene before accepting players
+    if warmup != "off":
+        problems = 0
+        for story in host_stories:
+            report = warm_up(story.scenes, story.entry, warmup_workers)
+            print(f"[{story.name}] {report.format()}" if multi else report.format())
+            problems += len(report.problems)
+            if optimize:
+                for name in report.scenes:
+                    optimization = story.scenes.get(name).optimization
+                    if optimization.changes or optimization.warnings:
+                        print(optimization.format())
+        if warmup == "strict" and problems:
+            raise SceneValidationError(f"{problems} scene problems, server not started")
+    
+    # Binary encodings are opt-in per client through the WebSocket subprotocol
+    if encodings is None:
+        encodings = [codec.name for codec in available_codecs()]
+    select_subprotocol = make_subprotocol_selector(encodings)
+    
+    # Script profile per story across all its sessions, rewritten as each session ends
+    profiles = {story.name: ScriptProfiler() for story in host_stories} if profile else {}
+    
+    # Opt-in memory accounting, reported over HTTP at /admin/memory to local clients only
+    accountant = MemoryAccountant(host_stories, memory_interval) if memory_interval else None
+    if accountant:
+        accountant.start()
+    
+    # Choice and drop-off counters of every story, flushed in batches off the engine threads
+    analytics = ChoiceAnalytics(analytics_path, analytics_interval) if analytics_path else None
+    
+    # Opt-in recording of what clients send, for replay.py
+    corpus = CorpusWriter(record_path, record_rate) if record_path else None
+    
+    async def admin_memory(connection, query: str):
+        if accountant is None:
+            return connection.respond(http.HTTPStatus.NOT_FOUND, "Memory accounting is off (--memory-accounting)\n")
+        if not ipaddress.ip_address(connection.remote_address[0]).is_loopback:
+            return connection.respond(http.HTTPStatus.FORBIDDEN, "Admin commands are local only\n")
+        params = parse_qs(query)
+        try:
+            top = max(1, int(params.get("top", ["10"])[-1]))
+        except ValueError:
+            return connection.respond(http.HTTPStatus.BAD_REQUEST, "top must be an integer\n")
+        if params.get("sample") or not accountant.history:
+            await asyncio.to_thread(accountant.sample)
+        return connection.respond(http.HTTPStatus.OK, accountant.report(top) + "\n")
+    
+    # Clients pick a story by path or ?story= and declare event subscriptions in the handshake URL;
+    # unknown stories and bad parameters are refused up front
+    # A session key (?session=...) names the session's autosave, so a reconnecting client can resume it;
+    # new sessions get an unguessable key from the server, and a key already connected is refused
+    # ?lang=xx picks a translated string table of the story
+    async def process_request(connection, request):
+        url = urlsplit(request.path)
+        query = url.query
+        if url.path == "/admin/memory":
+            return await admin_memory(connection, query)
+        connection.story = story_host.route(url.path, query)
+        if connection.story is None:
+            return connection.respond(http.HTTPStatus.NOT_FOUND, "Unknown story\n")
+        try:
+            connection.subscription = Subscription.from_query(query)
+        except ValueError as e:
+            return connection.respond(http.HTTPStatus.BAD_REQUEST, f"{e}\n")
+        session_key = parse_qs(query).get("session", [None])[-1]
+        if session_key is not None and not valid_session_key(session_key):
+            return connection.respond(http.HTTPStatus.BAD_REQUEST, "Invalid session key\n")
+        if session_key is not None and (connection.story.name, session_key) in live_sessions:
+            return connection.respond(http.HTTPStatus.CONFLICT, "Session key in use\n")
+        connection.resumed = session_key is not None
+        connection.session_key = session_key or new_session_key()
+        # Dialogue language, for stories with translated string tables; fixed for the session
+        language = parse_qs(query).get("lang", [None])[-1]
+        if language is not None and language not in connection.story.languages:
+            return connection.respond(http.HTTPStatus.BAD_REQUEST, "Unknown language\n")
+        connection.language = language
+        connection.strings = connection.story.languages.get(language)
+        return None
     
     async def handle_client(websocket):
         # Create UI port
-        ui_port = WsUiPort()
+        ui_port = WsUiPort(send_limit, recv_limit, getattr(websocket, "subscription", None),
+                           getattr(websocket, "resumed", False))
+        codec = codec_for_subprotocol(websocket.subprotocol)
+        story = websocket.story
+        session_key = websocket.session_key
+        # Another handshake with the same key may have got here first
+        if (story.name, session_key) in live_sessions:
+            await websocket.close(1008, "Session key in use")
+            return
+        live_sessions.add((story.name, session_key))
+        story.sessions += 1
+        autosave = (Autosave(story.autosave, session_key, autosave_choices, autosave_interval)
+                    if story.autosave else None)
+        story_profile = profiles.get(story.name)
+        if accountant:
+            accountant.track(websocket.id.hex, story, ui_port)
+        recorder = (corpus.session(story.name, story.entry, getattr(websocket, "language", None),
+                                   ui_port.subscription) if corpus else None)
         
         # Start game engine thread
         def run_engine():
+            session_profile = ScriptProfiler() if story_profile else None
             try:
-                with open(script_path, "r", encoding="utf-8") as f:
-                    cmd_list = parse_script(f.read())
+                cmd_list = story.scenes.get(story.entry).cmds
                 
                 from engine.core import run
-                run(cmd_list, initial_scene=scene_name, ui=ui_port)
+                run(cmd_list, initial_scene=story.entry, ui=ui_port, scenes=story.scenes, profiler=session_profile,
+                    autosave=autosave, saves=story.saves,
+                    analytics=analytics.session(story.name) if analytics else None,
+                    strings=getattr(websocket, "strings", None), max_call_depth=max_call_depth)
+            except SessionClosed:
+                pass
             except Exception as e:
                 ui_port.emit(UIEvent("ERROR", {"message": str(e)}))
+            finally:
+                if session_profile:
+                    story_profile.merge(session_profile)
+                    story_profile.write(f"{profile}.{story.name}" if multi else profile)
+                if autosave:
+                    story.autosave.forget(session_key)
+        
+        # Tell the client the key that resumes this session's autosave, before anything else
+        if autosave:
+            ui_port.send_queue.put_nowait({"type": "SESSION", "payload": {"key": session_key}})
         
         engine_thread = threading.Thread(target=run_engine, daemon=True)
         engine_thread.start()
@@ -132,7 +331,7 @@ async def serve(script_path: str, scene_name: str, host="127.0.0.1", port=8765):
             while True:
                 try:
                     data = ui_port.send_queue.get_nowait()
-                    message = json.dumps(data, ensure_ascii=False)
+                    message = codec.encode(data)
                     await websocket.send(message)
                 except queue.Empty:
                     await asyncio.sleep(0.01)
@@ -146,30 +345,160 @@ async def serve(script_path: str, scene_name: str, host="127.0.0.1", port=8765):
             try:
                 async for message in websocket:
                     try:
-                        data = json.loads(message)
-                        ui_port.recv_queue.put(data)
-                    except json.JSONDecodeError:
-                        pass
+                        data = codec.decode(message)
+                        # Messages are objects; anything else is counted and ignored
+                        if not isinstance(data, dict):
+                            ui_port.counters["malformed inbound"] += 1
+                            continue
+                        ui_port.recv_queue.put_nowait(data)
+                        if recorder:
+                            recorder.message(data)
+                    except MalformedMessage:
+                        ui_port.counters["malformed inbound"] += 1
+                    except codec.decode_errors:
+                        ui_port.counters["undecodable inbound"] += 1
+                    except queue.Full:
+                        # The engine only reads while waiting on the player; anything beyond is a flood
+                        ui_port.counters["dropped inbound"] += 1
             except websockets.exceptions.ConnectionClosed:
                 pass
+            finally:
+                # Nobody is left to answer; a waiting engine thread ends with SessionClosed
+                ui_port.running = False
         
+        # The session ends when either side stops: the receiver when the client goes away,
+        # the sender when a send fails. The other task is cancelled, so teardown always runs
+        tasks = {asyncio.create_task(sender()), asyncio.create_task(receiver())}
         try:
-            await asyncio.gather(sender(), receiver(), return_exceptions=True)
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         finally:
             ui_port.running = False
+            live_sessions.discard((story.name, session_key))
+            if autosave:
+                story.autosave.forget(session_key)
+            if accountant:
+                accountant.untrack(websocket.id.hex)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if recorder:
+                await asyncio.to_thread(recorder.finish)
+            if ui_port.counters:
+                print(f"Client {websocket.remote_address}: {dict(ui_port.counters)}")
 
-    async with websockets.serve(handle_client, host, port, max_size=10*1024*1024):
+    # Client messages are small; the size cap bounds what the connection buffers per session
+    async with websockets.serve(handle_client, host, port, max_size=max_message,
+                                select_subprotocol=select_subprotocol, compression=compression,
+                                process_request=process_request):
         print(f"Server running on ws://{host}:{port}")
-        await asyncio.Future()
+        if multi:
+            print(f"Stories: {', '.join(sorted(story_host.stories))}"
+                  + (f" (default: {story_host.default})" if story_host.default else ""))
+        try:
+            await asyncio.Future()
+        finally:
+            if accountant:
+                accountant.stop()
+            if analytics:
+                analytics.close()
+            # Don't lose checkpoints still waiting to be written
+            story_host.close()
+            for story in host_stories:
+                if story.autosave:
+                    print(f"Autosave [{story.name}]: {story.autosave.counts}")
 
 if __name__ == "__main__":
-    import sys
-    main_scene = sys.argv[1] if len(sys.argv) > 1 else "main.txt"
-    scene_name = main_scene[:-4] if main_scene.endswith(".txt") else main_scene
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Interactive fiction WebSocket server")
+    arg_parser.add_argument("scene", nargs="?", default="main.txt", help="Entry scene file")
+    arg_parser.add_argument("--bundle", default=None, help="Story bundle to serve instead of loose scene files")
+    arg_parser.add_argument("--stories", default=None,
+                            help="Host every story under this directory (subdirectories and bundles), "
+                                 "routed by /<story> or ?story=<story>; the scene argument names their entry scene")
+    arg_parser.add_argument("--default-story", default=None,
+                            help="Story for clients that don't name one")
+    arg_parser.add_argument("--story-cache-mb", type=float, default=0,
+                            help="Parsed scene memory per story before least recently used scenes are dropped "
+                                 "(0: unlimited)")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--encodings", default=None,
+                            help="Comma-separated wire encodings clients may negotiate (json, msgpack, cbor)")
+    arg_parser.add_argument("--no-deflate", action="store_true",
+                            help="Disable permessage-deflate compression")
+    arg_parser.add_argument("--fast-parser", action="store_true",
+                            help="Parse scenes with the hand-written parser instead of Lark")
+    arg_parser.add_argument("--warmup", choices=["off", "report", "strict"], default="off",
+                            help="Parse all reachable scenes at startup; strict refuses to start on errors")
+    arg_parser.add_argument("--warmup-workers", type=int, default=None,
+                            help="Worker processes for warm-up (default: CPU count)")
+    arg_parser.add_argument("--prefetch-mb", type=float, default=16,
+                            help="Memory for scenes parsed ahead of a scene change (0 disables prefetching)")
+    arg_parser.add_argument("--send-queue", type=int, default=SEND_QUEUE_LIMIT,
+                            help="Events buffered per client before the engine waits")
+    arg_parser.add_argument("--recv-queue", type=int, default=RECV_QUEUE_LIMIT,
+                            help="Client messages buffered per session before new ones are dropped")
+    arg_parser.add_argument("--max-message-kb", type=int, default=64,
+                            help="Largest accepted client message")
+    arg_parser.add_argument("--autosave-dir", default=None,
+                            help="Checkpoint sessions into this directory (LOAD_REQUEST slot 'auto' resumes)")
+    arg_parser.add_argument("--autosave-interval", type=float, default=None,
+                            help="Also checkpoint every N seconds of play")
+    arg_parser.add_argument("--no-autosave-choices", action="store_true",
+                            help="Don't checkpoint at every choice")
+    arg_parser.add_argument("--max-call-depth", type=int, default=MAX_CALL_DEPTH,
+                            help="How deeply callScene may nest before further calls are refused")
+    arg_parser.add_argument("--optimize", action="store_true",
+                            help="Fold constants and remove dead commands and unused labels from scenes")
+    arg_parser.add_argument("--memory-accounting", type=float, default=0, metavar="SECONDS",
+                            help="Sample per-session and shared memory every N seconds; "
+                                 "report with python -m engine.memory (0: off)")
+    arg_parser.add_argument("--analytics", default=None, metavar="FILE",
+                            help="Count choices picked and where sessions stop; batches are appended to FILE "
+                                 "(summarize with python -m engine.analytics FILE)")
+    arg_parser.add_argument("--analytics-interval", type=float, default=60,
+                            help="Seconds between analytics flushes")
+    arg_parser.add_argument("--record", default=None, metavar="FILE",
+                            help="Append anonymized client message sequences to FILE for replay.py")
+    arg_parser.add_argument("--record-rate", type=float, default=1.0,
+                            help="Share of sessions recorded")
+    arg_parser.add_argument("--profile", default=None,
+                            help="Profile scripts per source line; writes <prefix>.*.folded and <prefix>.txt")
+    args = arg_parser.parse_args()
+    
+    if args.fast_parser:
+        use_fast_parser()
+    
+    main_scene = args.scene
+    scene_name = os.path.basename(main_scene[:-4] if main_scene.endswith(".txt") else main_scene)
     if not main_scene.endswith(".txt"):
         main_scene += ".txt"
+    source = open_source(args.bundle) if args.bundle else None
+    encodings = args.encodings.split(",") if args.encodings else None
+    stories = None
+    if args.stories:
+        stories = dict(discover_stories(args.stories, scene_name))
+        if not stories:
+            print(f"No stories with a {main_scene} found under {args.stories}")
+            sys.exit(1)
     
     try:
-        asyncio.run(serve(main_scene, scene_name))
+        asyncio.run(serve(main_scene, scene_name, args.host, args.port,
+                          encodings=encodings, compression=None if args.no_deflate else "deflate",
+                          source=source, warmup=args.warmup, warmup_workers=args.warmup_workers,
+                          profile=args.profile, prefetch_bytes=int(args.prefetch_mb * 1024 * 1024),
+                          send_limit=args.send_queue, recv_limit=args.recv_queue,
+                          max_message=args.max_message_kb * 1024, optimize=args.optimize,
+                          autosave_dir=args.autosave_dir, autosave_choices=not args.no_autosave_choices,
+                          autosave_interval=args.autosave_interval, stories=stories,
+                          default_story=args.default_story,
+                          cache_bytes=int(args.story_cache_mb * 1024 * 1024) or None,
+                          memory_interval=args.memory_accounting or None,
+                          analytics_path=args.analytics, analytics_interval=args.analytics_interval,
+                          max_call_depth=args.max_call_depth, record_path=args.record,
+                          record_rate=args.record_rate))
+    except SceneValidationError as e:
+        print(e)
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\nServer stopped")
\ No newline at end of file
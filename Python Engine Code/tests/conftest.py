@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Unit tests import the engine the way server.py does, from the engine directory
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ENGINE_DIR not in sys.path:
+    sys.path.insert(0, ENGINE_DIR)
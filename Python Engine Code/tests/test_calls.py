@@ -0,0 +1,48 @@
+from engine.core import run
+from engine.headless import HeadlessUiPort
+from engine.scenes import DirectorySource
+from engine.state import MAX_CALL_DEPTH
+
+def _play(tmp_path, scenes, **kwargs):
+    for name, script in scenes.items():
+        (tmp_path / f"{name}.txt").write_text(script, encoding="utf-8")
+    source = DirectorySource(str(tmp_path))
+    ui = HeadlessUiPort(max_interactions=200, record=True)
+    run(source.load("main"), ui=ui, scenes=source, **kwargs)
+    return [ev.payload["text"] for ev in ui.events if ev.type in ("SHOW_TEXT", "INFO")]
+
+def test_a_call_that_only_returns_is_a_tail_call(tmp_path):
+    texts = _play(tmp_path, {
+        "main": 'callScene:a;\nsay:"Back in main";',
+        "a": 'say:"In a";\ncallScene:b;\nlabel:done;',
+        "b": 'say:"In b";\nreturn;',
+    })
+    assert texts == ["[Calling scene: a]", "In a", "[Tail-calling scene: b]", "In b",
+                     "[Returned to previous scene]", "Back in main"]
+
+def test_tail_calls_keep_the_stack_flat(tmp_path):
+    # Each visit calls itself as its last command; without tail calls this would hit the depth limit
+    texts = _play(tmp_path, {
+        "main": 'setVar:n=0;\ncallScene:count;\nsay:"Counted {n}";',
+        "count": 'setVar:n={n}+1;\nchoose:"Again":again -when={n} < 100 | "Stop":stop -when={n} >= 100;\n'
+                 'label:again;\ncallScene:count;\nreturn;\nlabel:stop;',
+    }, max_call_depth=4)
+    assert texts[-1] == "Counted 100"
+    assert not [text for text in texts if text.startswith("Error")]
+
+def test_calls_nested_past_the_limit_are_refused(tmp_path):
+    texts = _play(tmp_path, {
+        "main": 'callScene:deeper;\nsay:"Done";',
+        "deeper": 'callScene:deeper;\nsay:"Unwinding";',
+    }, max_call_depth=3)
+    assert "Error: scene calls nested 3 deep; not calling 'deeper' from 'deeper'" in texts
+    assert texts.count("Unwinding") == 3
+    assert texts[-1] == "Done"
+
+def test_the_default_limit_applies_without_one_given(tmp_path):
+    texts = _play(tmp_path, {
+        "main": 'callScene:deeper;',
+        "deeper": 'callScene:deeper;\nsay:"Unwinding";',
+    })
+    assert f"Error: scene calls nested {MAX_CALL_DEPTH} deep; not calling 'deeper' from 'deeper'" in texts
+    assert texts.count("Unwinding") == MAX_CALL_DEPTH
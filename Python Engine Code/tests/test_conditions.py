@@ -0,0 +1,79 @@
+from commands import ChooseCommand, Option
+from engine import expressions
+from engine.expressions import choice_menu, resolve_variables
+from engine.state import GameState
+from engine.variables import SlotVars, VarSchema
+
+def _menu():
+    return ChooseCommand([
+        Option("Shop", "shop", when="{gold} >= 10"),
+        Option("Quest", "quest", enable="{level} > 1"),
+        Option("Rest", "rest"),
+    ])
+
+def _state(schema, **values):
+    return GameState(vars=SlotVars(values, schema))
+
+def _visible(menu):
+    return [(opt.target, enabled) for opt, enabled in menu]
+
+def test_compiled_conditions_know_the_variables_they_read():
+    schema = VarSchema()
+    compiled = expressions.compile_expr("{gold} >= 10 and {level} > {gold}", schema)
+    assert sorted(schema.names[slot] for slot in compiled.slots) == ["gold", "level"]
+
+def test_menu_is_reused_until_a_variable_it_reads_changes():
+    schema = VarSchema()
+    cmd = resolve_variables([_menu()], schema)[0]
+    st = _state(schema, gold=20, level=1, visits=0)
+
+    first = choice_menu(cmd, st)
+    assert _visible(first) == [("shop", True), ("quest", False), ("rest", True)]
+
+    # Variables no condition reads, and writes that don't change a value, keep the result
+    st.vars["visits"] = 1
+    st.vars["gold"] = 20
+    assert choice_menu(cmd, st) is first
+
+    st.vars["level"] = 2
+    assert _visible(choice_menu(cmd, st)) == [("shop", True), ("quest", True), ("rest", True)]
+    st.vars["gold"] = 5
+    assert _visible(choice_menu(cmd, st)) == [("quest", True), ("rest", True)]
+
+def test_menu_is_recomputed_for_a_replaced_store():
+    schema = VarSchema()
+    cmd = resolve_variables([_menu()], schema)[0]
+    st = _state(schema, gold=20)
+    assert [target for target, _ in _visible(choice_menu(cmd, st))] == ["shop", "quest", "rest"]
+
+    # Loading a save swaps in a new store, which may lack variables the old one had
+    st.vars = SlotVars({}, schema)
+    assert [target for target, _ in _visible(choice_menu(cmd, st))] == ["quest", "rest"]
+
+def test_global_conditions_are_memoized_too():
+    schema = VarSchema()
+    cmd = resolve_variables([ChooseCommand([Option("Go", "go")], global_when="{open}")], schema)[0]
+    st = _state(schema, open=0)
+    assert choice_menu(cmd, st) is None
+    st.vars["open"] = 1
+    assert _visible(choice_menu(cmd, st)) == [("go", True)]
+
+def test_memoized_menus_go_away_with_their_commands():
+    import gc
+
+    schema = VarSchema()
+    st = _state(schema, gold=20)
+    cmd = resolve_variables([_menu()], schema)[0]
+    choice_menu(cmd, st)
+    assert len(st.condition_memo) == 1
+
+    # As when a scene is evicted from the cache and no session runs it any more
+    del cmd
+    gc.collect()
+    assert len(st.condition_memo) == 0
+
+def test_variable_versions_stay_compact():
+    from array import array
+
+    store = SlotVars({"gold": 1, "level": 2})
+    assert isinstance(store.versions, array) and store.versions.itemsize == 8
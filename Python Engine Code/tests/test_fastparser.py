@@ -0,0 +1,44 @@
+import os
+import random
+
+import pytest
+
+from fastparser import ScriptSyntaxError, parse_script_fast
+from parser_diff import compare, generate_case
+
+STORY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "GameEngine")
+
+def _scenes():
+    if not os.path.isdir(STORY_DIR):
+        return []
+    return sorted(entry for entry in os.listdir(STORY_DIR) if entry.endswith(".txt"))
+
+def _assert_same(text: str):
+    same, lark_result, fast_result = compare(text, {"lark": 0.0, "fast": 0.0})
+    assert same, f"{text!r}\n  lark: {lark_result}\n  fast: {fast_result}"
+
+@pytest.mark.parametrize("scene", _scenes())
+def test_fast_parser_matches_lark_on_the_sample_story(scene):
+    with open(os.path.join(STORY_DIR, scene), encoding="utf-8") as f:
+        _assert_same(f.read())
+
+def test_fast_parser_matches_lark_on_generated_scripts():
+    rng = random.Random(0)
+    for _ in range(500):
+        _assert_same(generate_case(rng))
+
+@pytest.mark.parametrize("text", [
+    'choose:"A":a -when={gold} >= 10 | "B":b;',
+    'roll:1d6+{str} -to=hit;',
+    'setVar:x={a}-{b};',
+    'say:"It\\"s" -speaker=Narrator\n;',
+    'playBGM:"theme.ogg" -loop=false;',
+])
+def test_fast_parser_matches_lark_on_lexing_corner_cases(text):
+    _assert_same(text)
+
+def test_syntax_errors_carry_their_position():
+    with pytest.raises(ScriptSyntaxError) as error:
+        parse_script_fast('say:"Hi";\nsay:"Hi" oops;')
+    assert (error.value.line, error.value.column) == (2, 10)
+    assert str(error.value.in_file("main.txt")).startswith("main.txt: ")
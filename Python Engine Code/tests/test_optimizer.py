@@ -0,0 +1,69 @@
+from commands import ChooseCommand, JumpCommand, LabelCommand, SayCommand, SetVarCommand
+from engine.optimizer import fold_expression, optimize
+from engine.scenes import compile_scene
+from engine.variables import VarSchema
+from parser import parse_script
+
+SCENE = "\n".join([
+    'setVar:a=2*3+1;',
+    'choose:"A":x -when=1 > 2',
+    ' | "B":y -when={g} > 1+1',
+    ' ;',
+    'jump:y;',
+    'say:"dead";',
+    'label:x;',
+    'label:y;',
+    'say:"end";',
+])
+
+def test_constant_parts_of_expressions_are_folded():
+    schema = VarSchema()
+    assert fold_expression("2*3+1", schema) == ("7", (7,), None)
+    assert fold_expression("{g} > 1+1", schema) == ("g > 2", None, None)
+    assert fold_expression("{g} > 1", schema) == (None, None, None)
+    # Negative results are written as 0 - n, since the evaluator has no unary minus
+    assert fold_expression("1 - 3", schema)[0] == "0 - 2"
+    # What doesn't evaluate becomes 0, as it would at runtime
+    assert fold_expression("1 +", schema)[:2] == ("0", (0,))
+
+def test_never_true_options_and_unreachable_code_are_removed():
+    cmds, source_index, report = optimize(parse_script(SCENE), "main")
+
+    assert [type(cmd) for cmd in cmds] == [SetVarCommand, ChooseCommand, JumpCommand, LabelCommand, SayCommand]
+    assert cmds[0].value == "7"
+    assert [(opt.target, opt.when) for opt in cmds[1].options] == [("y", "g > 2")]
+    assert cmds[3].name == "y"
+    # Label x lost its only reference along with option A, so it went too
+    assert source_index == [0, 1, 2, 5, 6]
+    assert report.commands_before == 7 and report.commands_after == 5
+
+def test_optimizing_leaves_the_parsed_commands_alone():
+    parsed = parse_script(SCENE)
+    optimize(parsed, "main")
+    assert parsed == parse_script(SCENE)
+
+def test_optimized_scenes_map_indices_to_and_from_the_source():
+    scene = compile_scene("main", parse_script(SCENE), optimize=True)
+    assert scene.labels == {"y": 3}
+    assert [scene.to_source(i) for i in range(5)] == [0, 1, 2, 5, 6]
+    # Past the end, indices keep their distance from the last command
+    assert scene.to_source(5) == 7
+    # Saved source indices of removed commands resume at the next command that is left
+    assert [scene.from_source(i) for i in range(8)] == [0, 1, 2, 3, 3, 3, 4, 5]
+
+def test_loading_a_save_in_the_same_scene_takes_labels_from_the_scene(tmp_path):
+    from engine.save_system import SaveSystemManager
+    from engine.scenes import DirectorySource, SceneCache
+    from engine.state import GameState
+
+    (tmp_path / "main.txt").write_text(SCENE, encoding="utf-8")
+    scenes = SceneCache(DirectorySource(str(tmp_path)), optimize=True)
+    scene = scenes.get("main")
+    st = GameState(cmds=scene.cmds, labels=scene.labels)
+    st.scenes = scenes
+
+    # Labels saved against the unoptimized scene would send jump:y to the dead say
+    save = {"game_state": {"current_scene": "main", "current_index": 6, "labels": {"x": 6, "y": 7}}}
+    SaveSystemManager()._jump_to_save_state(st, save)
+    assert st.labels == {"y": 3}
+    assert st.index == 4
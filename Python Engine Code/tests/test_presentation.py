@@ -0,0 +1,107 @@
+from engine.core import run
+from engine.headless import HeadlessUiPort
+from engine.presentation import Presentation
+from engine.scenes import DirectorySource
+from parser import parse_script
+
+class _Recorder:
+
+    def __init__(self):
+        self.events = []
+
+    def wants(self, event_type, level="content"):
+        return True
+
+    def emit(self, ev):
+        self.events.append((ev.type, ev.payload))
+
+    def take(self):
+        events, self.events = self.events, []
+        return events
+
+def test_sync_emits_only_what_changed():
+    ui = _Recorder()
+    presentation = Presentation(ui)
+
+    presentation.sync("bg.png", "theme.ogg")
+    assert ui.take() == [("SHOW_IMAGE", {"path": "bg.png"}), ("PLAY_BGM", {"path": "theme.ogg", "loop": True})]
+    presentation.sync("bg.png", "theme.ogg")
+    assert ui.take() == []
+
+    # A new track replaces the playing one without a STOP_BGM first
+    presentation.sync("bg.png", "battle.ogg", bgm_loop=False)
+    assert ui.take() == [("PLAY_BGM", {"path": "battle.ogg", "loop": False})]
+    presentation.sync(None, None)
+    assert ui.take() == [("HIDE_IMAGE", {}), ("STOP_BGM", {})]
+
+def test_voice_is_only_ever_stopped_by_sync():
+    ui = _Recorder()
+    presentation = Presentation(ui)
+    presentation.play_voice("line1.ogg")
+    presentation.sync(None, None, voice="line1.ogg")
+    assert ui.take() == [("PLAY_VOICE", {"path": "line1.ogg"})]
+    presentation.sync(None, None)
+    assert ui.take() == [("STOP_VOICE", {})]
+
+def test_invalidated_presentation_resends_everything():
+    ui = _Recorder()
+    presentation = Presentation(ui)
+    presentation.sync("bg.png", None)
+    ui.take()
+
+    # After a reconnect the client's state is unknown
+    presentation.invalidate()
+    presentation.sync("bg.png", None)
+    assert ui.take() == [("SHOW_IMAGE", {"path": "bg.png"}), ("STOP_BGM", {}), ("STOP_VOICE", {})]
+
+def test_unsubscribed_media_events_are_not_built():
+    from engine.ui import Subscription
+
+    class _Subscribed(_Recorder):
+        subscription = Subscription(["PLAY_BGM"])
+
+        def wants(self, event_type, level="content"):
+            return self.subscription.wants(event_type, level)
+
+    ui = _Subscribed()
+    presentation = Presentation(ui)
+    presentation.sync("bg.png", "theme.ogg")
+    presentation.play_voice("line1.ogg")
+    assert ui.take() == [("PLAY_BGM", {"path": "theme.ogg", "loop": True})]
+    # What the client would show is still tracked
+    assert (presentation.image, presentation.voice) == ("bg.png", "line1.ogg")
+
+def test_loading_a_save_resends_its_whole_media_state():
+    from engine.save_system import SaveSystemManager
+    from engine.state import GameState
+
+    # A fresh session's view: nothing shown, as far as the server knows
+    ui = _Recorder()
+    st = GameState(ui=ui)
+    st.presentation = Presentation(ui)
+
+    # The save has no image or music, but a reconnected client may still show some: both are stopped
+    SaveSystemManager()._restore_media_state(st, {"media_state": {}})
+    assert ui.take() == [("HIDE_IMAGE", {}), ("STOP_BGM", {}), ("STOP_VOICE", {})]
+
+def test_resumed_sessions_start_from_an_unknown_presentation():
+    from engine.state import GameState
+    from server import WsUiPort
+
+    for resumed in (False, True):
+        ui = WsUiPort(resumed=resumed)
+        st = GameState(ui=ui)
+        st.presentation = Presentation(ui)
+        ui.set_game_state(st)
+        assert st.presentation.stale is resumed
+
+def test_scene_commands_repeating_the_current_media_emit_nothing(tmp_path):
+    script = "\n".join([
+        'showImage:"bg.png";', 'playBGM:"theme.ogg";', 'say:"One";',
+        'showImage:"bg.png";', 'playBGM:"theme.ogg";', 'say:"Two";',
+        'hideImage;', 'say:"Three";',
+    ])
+    ui = HeadlessUiPort(max_interactions=10, record=True)
+    run(parse_script(script), ui=ui, scenes=DirectorySource(str(tmp_path)))
+    media = [ev.type for ev in ui.events if ev.type in ("SHOW_IMAGE", "HIDE_IMAGE", "PLAY_BGM", "STOP_BGM")]
+    assert media == ["SHOW_IMAGE", "PLAY_BGM", "HIDE_IMAGE"]
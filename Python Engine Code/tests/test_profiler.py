@@ -0,0 +1,32 @@
+from engine.core import run
+from engine.headless import HeadlessUiPort
+from engine.profiler import ScriptProfiler
+from engine.scenes import DirectorySource, SceneCache
+
+# Scene cache counting the lookups made while the story runs
+class _CountingCache(SceneCache):
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.lookups = 0
+
+    def get(self, name):
+        self.lookups += 1
+        return super().get(name)
+
+def test_commands_are_charged_to_their_callers_stack(tmp_path):
+    (tmp_path / "main.txt").write_text('label:start;\ncallScene:inner;\nsay:"Done";', encoding="utf-8")
+    (tmp_path / "inner.txt").write_text("\n".join(['setVar:n=0;', 'label:loop;'] + ['setVar:n={n}+1;'] * 50
+                                                  + ['say:"Inner";']), encoding="utf-8")
+    scenes = _CountingCache(DirectorySource(str(tmp_path)))
+    profiler = ScriptProfiler()
+    run(scenes.get("main").cmds, ui=HeadlessUiPort(record=True), scenes=scenes, profiler=profiler)
+
+    caller = ("main", "start", "line 2 Scene")
+    inner = {key: entry for key, entry in profiler.stats.items() if key[-1][0] == "inner"}
+    assert all(key[:-1] == (caller,) for key in inner)
+    assert inner[(caller, ("inner", "loop", "line 3 SetVar"))][0] == 1
+    assert sum(entry[0] for entry in inner.values()) == 53
+    assert profiler.stats[(("main", "start", "line 3 Say"),)][0] == 1
+    # Resolving the caller frame looked its scene up once, not once per profiled command
+    assert scenes.lookups <= 4
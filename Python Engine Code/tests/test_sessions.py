@@ -0,0 +1,353 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import websockets
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STORY = "\n".join([
+    'say:"Hello";',
+    'choose:"Left":left | "Right":right;',
+    'label:left;',
+    'say:"Went left";',
+    'label:right;',
+    'say:"The end";',
+])
+
+@pytest.fixture
+def story(tmp_path):
+    path = tmp_path / "story"
+    path.mkdir()
+    (path / "main.txt").write_text(STORY, encoding="utf-8")
+    return path
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Starts server.py on its own port and returns its URL; servers are stopped afterwards
+@pytest.fixture
+def server(story):
+    processes = []
+
+    def start(*args):
+        port = _free_port()
+        process = subprocess.Popen([sys.executable, "server.py", str(story / "main.txt"), "--port", str(port), *args],
+                                   cwd=ENGINE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(process)
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                start.process = process
+                return f"ws://127.0.0.1:{port}"
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait(10)
+
+def _wait_for(check, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.05)
+    return check()
+
+# Read events until one of the given type arrives
+async def _until(ws, event_type: str):
+    while True:
+        event = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        if event["type"] == event_type:
+            return event
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def test_recording_is_written_when_an_idle_client_disconnects(server, tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    url = server("--record", corpus)
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            await ws.send(json.dumps({"type": "NEXT"}))
+            await _until(ws, "CHOICES")
+    asyncio.run(session())
+
+    sessions = _wait_for(lambda: _read_lines(corpus))
+    assert len(sessions) == 1
+    assert sessions[0]["messages"] == [["NEXT", {}]]
+
+@pytest.mark.parametrize("encoding", ["msgpack", "cbor"])
+def test_malformed_binary_frames_are_ignored(server, encoding):
+    pytest.importorskip({"msgpack": "msgpack", "cbor": "cbor2"}[encoding])
+    from protocol import get_codec
+
+    codec = get_codec(encoding)
+    url = server()
+
+    async def until(ws, event_type):
+        while True:
+            event = codec.decode(await asyncio.wait_for(ws.recv(), 5))
+            if event["type"] == event_type:
+                return event
+
+    async def session():
+        async with websockets.connect(url, subprotocols=[codec.subprotocol]) as ws:
+            assert ws.subprotocol == codec.subprotocol
+            await until(ws, "SHOW_TEXT")
+            # Truncated and garbage frames
+            for frame in (b"\x9f", b"\x82\x01", b"\xff\xff", b"\x1c", b"\xc1", b"\x93\x01\x02\x03\x04"):
+                await ws.send(frame)
+            await ws.send(codec.encode({"type": "NEXT"}))
+            assert (await until(ws, "CHOICES"))["payload"]["items"][0]["id"] == "left"
+    asyncio.run(session())
+
+@pytest.mark.parametrize("encoding", ["json", "msgpack", "cbor"])
+def test_messages_whose_payload_is_not_an_object_are_ignored(server, encoding):
+    if encoding != "json":
+        pytest.importorskip({"msgpack": "msgpack", "cbor": "cbor2"}[encoding])
+    from protocol import get_codec
+
+    codec = get_codec(encoding)
+    url = server()
+    subprotocols = [codec.subprotocol] if encoding != "json" else None
+
+    async def until(ws, event_type):
+        while True:
+            event = codec.decode(await asyncio.wait_for(ws.recv(), 5))
+            if event["type"] == event_type:
+                return event
+
+    async def session():
+        async with websockets.connect(url, subprotocols=subprotocols) as ws:
+            await until(ws, "SHOW_TEXT")
+            await ws.send(codec.encode({"type": "NEXT"}))
+            await until(ws, "CHOICES")
+            # CHOICE_SELECTED with payload 5, e.g. msgpack [33, 5]
+            if encoding == "json":
+                await ws.send(json.dumps({"type": "CHOICE_SELECTED", "payload": 5}))
+            else:
+                await ws.send(codec._dumps([33, 5]))
+            await ws.send(codec.encode({"type": "CHOICE_SELECTED", "payload": {"id": "right"}}))
+            assert (await until(ws, "SHOW_TEXT"))["payload"]["text"] == "The end"
+    asyncio.run(session())
+
+def test_messages_that_are_not_objects_are_ignored(server, tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    url = server("--record", corpus)
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            await ws.send(json.dumps([1, 2]))
+            await ws.send(json.dumps("NEXT"))
+            await ws.send(json.dumps({"type": "NEXT"}))
+            await _until(ws, "CHOICES")
+    asyncio.run(session())
+
+    sessions = _wait_for(lambda: _read_lines(corpus))
+    assert sessions[0]["messages"] == [["NEXT", {}]]
+
+def test_recording_is_written_when_a_finished_client_disconnects(server, tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    url = server("--record", corpus)
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            await ws.send(json.dumps({"type": "NEXT"}))
+            await _until(ws, "CHOICES")
+            await ws.send(json.dumps({"type": "CHOICE_SELECTED", "payload": {"id": "right"}}))
+            await _until(ws, "SHOW_TEXT")
+            await ws.send(json.dumps({"type": "NEXT"}))
+            await _until(ws, "END")
+    asyncio.run(session())
+
+    sessions = _wait_for(lambda: _read_lines(corpus))
+    assert [kind for kind, _ in sessions[0]["messages"]] == ["NEXT", "CHOICE_SELECTED", "NEXT"]
+
+
+# Thread count of a process, through psutil when installed, else /proc like loadtest.ServerMonitor
+def _thread_count(pid: int) -> int:
+    if psutil is not None:
+        return psutil.Process(pid).num_threads()
+    status = f"/proc/{pid}/status"
+    if not os.path.exists(status):
+        pytest.skip("counting server threads needs psutil or /proc")
+    with open(status) as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    pytest.skip(f"no thread count in {status}")
+
+def test_disconnect_while_waiting_ends_the_engine_thread(server):
+    url = server()
+    pid = server.process.pid
+    idle_threads = _thread_count(pid)
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            # The engine thread is now waiting for NEXT
+            assert _wait_for(lambda: _thread_count(pid) > idle_threads)
+    asyncio.run(session())
+
+    assert _wait_for(lambda: _thread_count(pid) <= idle_threads)
+
+# Totals of an analytics file by (event, scene, command index)
+def _analytics_totals(path):
+    totals = {}
+    for batch in _read_lines(path):
+        columns = batch["columns"]
+        for event, scene, index, count in zip(columns["event"], columns["scene"], columns["index"], columns["count"]):
+            totals[(event, scene, index)] = totals.get((event, scene, index), 0) + count
+    return totals
+
+def test_closing_a_session_counts_where_it_stopped(server, tmp_path):
+    counts = str(tmp_path / "analytics.jsonl")
+    url = server("--analytics", counts, "--analytics-interval", "0.1")
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            await ws.send(json.dumps({"type": "NEXT"}))
+            await _until(ws, "CHOICES")
+    asyncio.run(session())
+
+    # The session closed while its choice (command 1) was shown
+    totals = _wait_for(lambda: _analytics_totals(counts).get(("ended", "main", 1)) and _analytics_totals(counts))
+    assert totals[("ended", "main", 1)] == 1
+    assert ("finished", "main", 5) not in totals
+
+def _memory_report(url: str) -> str:
+    import urllib.request
+
+    admin = url.replace("ws://", "http://") + "/admin/memory?sample=1"
+    with urllib.request.urlopen(admin, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+def test_memory_report_drops_closed_sessions(server):
+    url = server("--memory-accounting", "60")
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            assert "1 sessions" in _memory_report(url)
+    asyncio.run(session())
+
+    assert _wait_for(lambda: "0 sessions" in _memory_report(url))
+    assert "of 0 sessions" in _memory_report(url)
+
+def test_memory_report_columns_and_top_parameter(server):
+    import urllib.error
+    import urllib.request
+
+    url = server("--memory-accounting", "60")
+    admin = url.replace("ws://", "http://") + "/admin/memory?sample=1"
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            await _until(ws, "SHOW_TEXT")
+            with urllib.request.urlopen(admin + "&top=-3", timeout=10) as response:
+                report = response.read().decode("utf-8")
+            # Negative counts are clamped to one session
+            assert "Top 1 of 1 sessions" in report
+            assert "presentation" in report.split("Top 1 of 1 sessions:")[1]
+    asyncio.run(session())
+
+    with pytest.raises(urllib.error.HTTPError) as refused:
+        urllib.request.urlopen(admin + "&top=ten", timeout=10)
+    assert refused.value.code == 400
+
+def test_session_keys_are_issued_and_not_shared(server, tmp_path):
+    url = server("--autosave-dir", str(tmp_path / "autosaves"))
+
+    async def sessions():
+        async with websockets.connect(url) as ws:
+            first = json.loads(await asyncio.wait_for(ws.recv(), 5))
+            assert first["type"] == "SESSION"
+            key = first["payload"]["key"]
+            assert len(key) >= 32
+
+            # Nobody else can attach to a key while its session is connected
+            with pytest.raises(websockets.exceptions.InvalidStatus) as refused:
+                async with websockets.connect(f"{url}/?session={key}"):
+                    pass
+            assert refused.value.response.status_code == 409
+
+        # Once it's gone, its own client can resume with the key
+        async def resume():
+            async with websockets.connect(f"{url}/?session={key}") as ws:
+                first = json.loads(await asyncio.wait_for(ws.recv(), 5))
+                return first["payload"]["key"]
+        deadline = time.time() + 5
+        while True:
+            try:
+                assert await resume() == key
+                return
+            except websockets.exceptions.InvalidStatus:
+                if time.time() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
+    asyncio.run(sessions())
+
+def test_errors_reach_clients_subscribed_to_some_events(server, story):
+    (story / "main.txt").write_text('jump:nowhere;\nsay:"After";', encoding="utf-8")
+    url = server()
+
+    async def session():
+        async with websockets.connect(f"{url}/?events=SHOW_TEXT&verbosity=content") as ws:
+            info = await _until(ws, "INFO")
+            assert info["payload"]["text"] == "Error: Label nowhere not found"
+            assert (await _until(ws, "SHOW_TEXT"))["payload"]["text"] == "After"
+    asyncio.run(session())
+
+def test_unknown_event_names_are_refused(server):
+    url = server()
+
+    async def session():
+        with pytest.raises(websockets.exceptions.InvalidStatus) as refused:
+            async with websockets.connect(f"{url}/?events=SHOW_IMAGES"):
+                pass
+        assert refused.value.response.status_code == 400
+        assert b"SHOW_IMAGES" in refused.value.response.body
+    asyncio.run(session())
+
+def test_scene_syntax_errors_name_the_file_and_are_not_cached(server, story):
+    (story / "main.txt").write_text('changeScene:broken;\nsay:"Again";\nchangeScene:broken;', encoding="utf-8")
+    (story / "broken.txt").write_text('say:"Hi" oops;', encoding="utf-8")
+    url = server()
+
+    async def session():
+        async with websockets.connect(url) as ws:
+            info = await _until(ws, "INFO")
+            assert str(story / "broken.txt") in info["payload"]["text"]
+            assert "at line 1, column 10" in info["payload"]["text"]
+            await _until(ws, "SHOW_TEXT")
+            # Once the file is fixed, the next scene change loads it
+            (story / "broken.txt").write_text('say:"Fixed";', encoding="utf-8")
+            await ws.send(json.dumps({"type": "NEXT"}))
+            assert (await _until(ws, "SHOW_TEXT"))["payload"]["text"] == "Fixed"
+    asyncio.run(session())
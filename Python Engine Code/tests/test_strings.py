@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from engine.core import run
+from engine.headless import HeadlessUiPort
+from engine.scenes import DirectorySource
+from engine.stories import Story
+from engine.strings import StringTable, build_language_table, build_source_table, export_strings, strings_dir
+
+STORY = "\n".join([
+    'setVar:gold=7;',
+    'say:"Welcome" -speaker=Narrator',
+    ';',
+    'say:"You have {gold} gold";',
+    'choose:"Stay":stay | "Leave":leave;',
+    'label:stay;',
+    'label:leave;',
+])
+
+def _story(tmp_path, translations=None):
+    (tmp_path / "main.txt").write_text(STORY, encoding="utf-8")
+    source = DirectorySource(str(tmp_path))
+    directory = strings_dir(source)
+    build_source_table(source, directory)
+    # Translations are given by source text here and keyed by id the way export_strings() does
+    if translations is not None:
+        table = StringTable(os.path.join(directory, "source.strtab"))
+        ids = {entry["text"]: string_id for string_id, entry in export_strings(table).items()}
+        build_language_table(table, "fr", {ids[text]: translated for text, translated in translations.items()},
+                             directory)
+        table.close()
+    return Story("test", source)
+
+def _play(story, strings=None):
+    scene = story.scenes.get("main")
+    ui = HeadlessUiPort(max_interactions=10, seed=0, record=True)
+    run(scene.cmds, ui=ui, scenes=story.scenes, strings=strings)
+    return ui.events
+
+def _shown(events):
+    out = []
+    for ev in events:
+        if ev.type == "SHOW_TEXT":
+            out.append((ev.payload["speaker"], ev.payload["text"]))
+        elif ev.type == "CHOICES":
+            out.append([item["text"] for item in ev.payload["items"]])
+    return out
+
+def test_scenes_compiled_against_a_table_keep_only_string_ids(tmp_path):
+    story = _story(tmp_path)
+    try:
+        say = story.scenes.get("main").cmds[1]
+        assert say.text is None and say.speaker is None
+        assert story.scenes.strings.get(say.text_id) == "Welcome"
+        assert story.scenes.strings.get(say.speaker_id) == "Narrator"
+        assert _shown(_play(story)) == [
+            ("Narrator", "Welcome"), (None, "You have 7 gold"), ["Stay", "Leave"]]
+    finally:
+        story.close()
+
+def test_untranslated_strings_fall_back_to_the_source_text(tmp_path):
+    story = _story(tmp_path, {"Welcome": "Bienvenue", "You have {gold} gold": "Vous avez {gold} or"})
+    try:
+        assert _shown(_play(story, story.languages["fr"])) == [
+            ("Narrator", "Bienvenue"), (None, "Vous avez 7 or"), ["Stay", "Leave"]]
+    finally:
+        story.close()
+
+def test_only_table_strings_with_placeholders_get_templates(tmp_path):
+    story = _story(tmp_path, {"You have {gold} gold": "Vous avez {gold} or"})
+    try:
+        _play(story)
+        _play(story, story.languages["fr"])
+        cached = story.variables.table_texts
+        assert sorted((table.language, story.scenes.strings.get(string_id)) for table, string_id in cached) == [
+            ("fr", "You have {gold} gold"), ("source", "You have {gold} gold")]
+        assert not story.variables.texts
+    finally:
+        story.close()
+
+def test_closing_a_story_unmaps_every_table(tmp_path):
+    story = _story(tmp_path, {})
+    tables = [story.scenes.strings, *story.languages.values()]
+    story.close()
+    assert all(table._mmap.closed for table in tables)
+
+def test_source_tables_are_not_built_from_scenes_with_syntax_errors(tmp_path):
+    from fastparser import ScriptSyntaxError
+
+    (tmp_path / "main.txt").write_text('say:"Fine";\nsay:"Broken"\nsay:"Lost";', encoding="utf-8")
+    source = DirectorySource(str(tmp_path))
+    directory = strings_dir(source)
+    with pytest.raises(ScriptSyntaxError, match="main.txt"):
+        build_source_table(source, directory)
+    assert not os.path.exists(os.path.join(directory, "source.strtab"))